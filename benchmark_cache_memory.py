@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Compare resident memory of the snapshot cache backends.
+
+Builds the 'products' cache the way FirebaseReadOnlyTool does (projected
+documents, one freshly decoded object per value) for several catalog sizes and
+reports the memory held by the default dict-of-dicts against the compact
+columnar backend.
+
+Usage: python benchmark_cache_memory.py [size ...]
+"""
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, "src")
+
+from trent_agent.tools.firebase_cache import CompactDocumentStore  # noqa: E402
+
+WORDS = ["حاسوب", "محمول", "هاتف", "ذكي", "سماعات", "لاسلكية", "شاشة", "laptop", "pro", "ultra", "mini"]
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_document(rng):
+    # Build every string at runtime so, like documents decoded from Firestore,
+    # equal values are separate objects
+    return {
+        "title": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) + f" {rng.randint(1, 999)}",
+        "categoryId": "".join(["category-", str(rng.randint(1, 40))]),
+        "price": round(rng.uniform(5, 5000), 2),
+        "lastUpdate": BASE_TIME + timedelta(seconds=rng.randint(0, 10**7)),
+    }
+
+
+def measure(size, backend):
+    rng = random.Random(size)
+    gc.collect()
+    tracemalloc.start()
+    documents = CompactDocumentStore() if backend == "compact" else {}
+    for i in range(size):
+        documents[f"product-{i:07d}"] = make_document(rng)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    matches = sum(1 for doc in documents.values() if doc["price"] < 1000)
+    scan_seconds = time.perf_counter() - started
+    del documents
+    return current, scan_seconds, matches
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 500_000]
+    print(f"{'documents':>10} {'dict MiB':>10} {'compact MiB':>12} {'ratio':>6} {'dict scan s':>12} {'compact scan s':>15}")
+    for size in sizes:
+        dict_bytes, dict_scan, _ = measure(size, "dict")
+        compact_bytes, compact_scan, _ = measure(size, "compact")
+        print(
+            f"{size:>10} {dict_bytes / 2**20:>10.1f} {compact_bytes / 2**20:>12.1f} "
+            f"{dict_bytes / compact_bytes:>6.2f} {dict_scan:>12.3f} {compact_scan:>15.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1307 @@
+"""In-memory index structures backing the FirebaseReadOnlyTool snapshot cache."""
+
+import itertools
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import AbstractSet, Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+SUPPORTED_OPERATORS = ("==", "<", "<=", ">", ">=", "in", "array-contains", "array-contains-any")
+RANGE_OPERATORS = ("<", "<=", ">", ">=")
+
+# Returned by get_field when a document does not contain the requested field.
+MISSING = object()
+
+
+def value_key(value: Any) -> Tuple[Any, ...]:
+    """Return a hashable, ordered key for a Firestore value.
+
+    Two values share a key exactly when Firestore considers them equal: ints and
+    floats compare numerically, booleans never equal numbers, timestamps compare
+    as instants and arrays/maps compare element-wise. Keys sort in Firestore's
+    cross-type order (null < bool < number < timestamp < string < bytes <
+    reference < geopoint < array < map), with NaN before every other number.
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        if value != value:  # NaN
+            return (2, 0, 0)
+        return (2, 1, value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, (bytes, bytearray)):
+        return (5, bytes(value))
+    if hasattr(value, "path") and hasattr(value, "id"):  # DocumentReference
+        return (6, value.path)
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):  # GeoPoint
+        return (7, value.latitude, value.longitude)
+    if isinstance(value, (list, tuple)):
+        return (8, tuple(value_key(item) for item in value))
+    if isinstance(value, dict):
+        return (9, tuple(sorted((str(k), value_key(v)) for k, v in value.items())))
+    return (10, str(value))
+
+
+def get_field(doc_data: Dict[str, Any], field: str) -> Any:
+    """Resolve a (possibly dotted) field path, returning MISSING when absent."""
+    if field in doc_data:
+        return doc_data[field]
+    current: Any = doc_data
+    for part in field.split("."):
+        if not isinstance(current, dict) or part not in current:
+            return MISSING
+        current = current[part]
+    return current
+
+
+def project_document(doc_data: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Keep only ``fields`` of a document, nesting dotted paths like Firestore's select()."""
+    projected: Dict[str, Any] = {}
+    for field in fields:
+        if field in doc_data:
+            projected[field] = doc_data[field]
+            continue
+        value = get_field(doc_data, field)
+        if value is MISSING:
+            continue
+        *parents, leaf = field.split(".")
+        target = projected
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = value
+    return projected
+
+
+def document_size(value: Any) -> int:
+    """Approximate memory held by a document (or field value) in bytes."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(key) + document_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(document_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def is_projected(field: str, fields: Iterable[str]) -> bool:
+    """Whether a projection over ``fields`` retains ``field`` (itself or a parent map)."""
+    return any(field == kept or field.startswith(kept + ".") for kept in fields)
+
+
+def matches_condition(doc_data: Dict[str, Any], field: str, operator: str, value: Any) -> bool:
+    """Evaluate one query condition against a cached document like Firestore would.
+
+    Documents without the field never match. Range operators only match values
+    of the same type as the operand, so ``price < 1000`` ignores string prices.
+    """
+    doc_value = get_field(doc_data, field)
+    if doc_value is MISSING:
+        return False
+
+    if operator == "==":
+        return value_key(doc_value) == value_key(value)
+
+    if operator in RANGE_OPERATORS:
+        doc_key = value_key(doc_value)
+        operand_key = value_key(value)
+        # null and NaN never satisfy an inequality; other types only compare within their type
+        if doc_key[0] != operand_key[0] or doc_key[0] == 0 or doc_key[:2] == (2, 0) or operand_key[:2] == (2, 0):
+            return False
+        if operator == "<":
+            return doc_key < operand_key
+        if operator == "<=":
+            return doc_key <= operand_key
+        if operator == ">":
+            return doc_key > operand_key
+        return doc_key >= operand_key
+
+    if operator == "in":
+        return value_key(doc_value) in {value_key(item) for item in value}
+
+    if operator == "array-contains":
+        if not isinstance(doc_value, list):
+            return False
+        operand_key = value_key(value)
+        return any(value_key(item) == operand_key for item in doc_value)
+
+    if operator == "array-contains-any":
+        if not isinstance(doc_value, list):
+            return False
+        operand_keys = {value_key(item) for item in value}
+        return any(value_key(item) in operand_keys for item in doc_value)
+
+    raise ValueError(f"Unsupported operator '{operator}'.")
+
+
+# Shards of a ShardedDict; a power of two.
+_SHARDS = 512
+
+# Target items per block of a SortedBlocks; blocks split at twice this size.
+_SORTED_BLOCK = 256
+
+# Items per block of a BlockArray.
+_ARRAY_BLOCK = 1024
+
+# Approximate bytes per index entry for memory_size(), measured with tracemalloc
+# on CPython 3.11: an id in an equality bucket, a (key, id) pair in a sorted
+# index or group ranking, a number kept for a group summary and an id in the
+# document id order.
+_BUCKET_ENTRY_BYTES = 32
+_SORTED_ENTRY_BYTES = 128
+_NUMBER_ENTRY_BYTES = 32
+_ID_ENTRY_BYTES = 9
+
+
+class ShardedDict(MutableMapping):
+    """A dict split by key hash into shards that copies share until they write them.
+
+    ``copy()`` costs one list of shard references and the first write to a
+    shard copies just that shard, so a copy-on-write snapshot pays for what
+    it changes rather than for the size of the mapping. Like the indexes,
+    only the newest copy may be modified. Iteration follows the shards, not
+    insertion order.
+    """
+
+    __slots__ = ("_shards", "_owned", "_length")
+
+    def __init__(self, items: Optional[Dict[Any, Any]] = None) -> None:
+        self._shards: List[Optional[Dict[Any, Any]]] = [None] * _SHARDS
+        # Shards this instance may modify in place; None means all of them
+        self._owned: Optional[bytearray] = None
+        self._length = 0
+        if items:
+            for key, value in items.items():
+                shard = self._shards[hash(key) & (_SHARDS - 1)]
+                if shard is None:
+                    shard = self._shards[hash(key) & (_SHARDS - 1)] = {}
+                shard[key] = value
+            self._length = len(items)
+
+    def copy(self) -> "ShardedDict":
+        clone = ShardedDict()
+        clone._shards = list(self._shards)
+        clone._owned = bytearray(_SHARDS)
+        clone._length = self._length
+        return clone
+
+    def _writable_shard(self, shard_index: int) -> Dict[Any, Any]:
+        shard = self._shards[shard_index]
+        if shard is None:
+            shard = self._shards[shard_index] = {}
+        elif self._owned is not None and not self._owned[shard_index]:
+            shard = self._shards[shard_index] = dict(shard)
+        if self._owned is not None:
+            self._owned[shard_index] = 1
+        return shard
+
+    def __getitem__(self, key: Any) -> Any:
+        shard = self._shards[hash(key) & (_SHARDS - 1)]
+        if shard is None:
+            raise KeyError(key)
+        return shard[key]
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        shard = self._shards[hash(key) & (_SHARDS - 1)]
+        return default if shard is None else shard.get(key, default)
+
+    def __contains__(self, key: object) -> bool:
+        shard = self._shards[hash(key) & (_SHARDS - 1)]
+        return shard is not None and key in shard
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        shard = self._writable_shard(hash(key) & (_SHARDS - 1))
+        if key not in shard:
+            self._length += 1
+        shard[key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        shard_index = hash(key) & (_SHARDS - 1)
+        shard = self._shards[shard_index]
+        if shard is None or key not in shard:
+            raise KeyError(key)
+        del self._writable_shard(shard_index)[key]
+        self._length -= 1
+
+    def __iter__(self) -> Iterator[Any]:
+        for shard in self._shards:
+            if shard:
+                yield from shard
+
+    def __len__(self) -> int:
+        return self._length
+
+    def items(self) -> "ItemsView[Any, Any]":
+        return _ShardedItems(self)
+
+    def values(self) -> "ValuesView[Any]":
+        return _ShardedValues(self)
+
+
+def writable_copy(mapping: MutableMapping) -> MutableMapping:
+    """Copy a posting or bucket mapping that a copy-on-write index is about to modify.
+
+    Small mappings stay plain dicts. A dict past ``_SHARDS`` entries is copied
+    into a ShardedDict instead, so the next versions copy only a shard of it.
+    """
+    if type(mapping) is dict and len(mapping) > _SHARDS:
+        return ShardedDict(mapping)
+    return mapping.copy()
+
+
+class _ShardedItems(ItemsView):
+    def __iter__(self) -> Iterator[Tuple[Any, Any]]:
+        for shard in self._mapping._shards:
+            if shard:
+                yield from shard.items()
+
+
+class _ShardedValues(ValuesView):
+    def __iter__(self) -> Iterator[Any]:
+        for shard in self._mapping._shards:
+            if shard:
+                yield from shard.values()
+
+
+class SortedBlocks:
+    """A sorted list kept in blocks that copies share until they write them.
+
+    Offers the bisect, slice and positional access the indexes need.
+    ``copy()`` costs one list of block references, and an insertion or
+    removal copies one block of at most ``2 * _SORTED_BLOCK`` items.
+    """
+
+    __slots__ = ("_blocks", "_maxes", "_owned", "_length", "_offsets")
+
+    def __init__(self) -> None:
+        self._blocks: List[List[Any]] = []
+        # Last (largest) item of each block
+        self._maxes: List[Any] = []
+        # Per block, whether this instance may modify it in place; None means all of them
+        self._owned: Optional[List[bool]] = None
+        self._length = 0
+        # Position of the first item of each block, plus the length; built on demand
+        self._offsets: Optional[List[int]] = None
+
+    def copy(self) -> "SortedBlocks":
+        clone = SortedBlocks()
+        clone._blocks = list(self._blocks)
+        clone._maxes = list(self._maxes)
+        clone._owned = [False] * len(self._blocks)
+        clone._length = self._length
+        clone._offsets = self._offsets
+        return clone
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Any]:
+        for block in self._blocks:
+            yield from block
+
+    def _writable_block(self, block_index: int) -> List[Any]:
+        if self._owned is not None and not self._owned[block_index]:
+            self._blocks[block_index] = list(self._blocks[block_index])
+            self._owned[block_index] = True
+        return self._blocks[block_index]
+
+    def add(self, item: Any) -> None:
+        self._offsets = None
+        self._length += 1
+        if not self._blocks:
+            self._blocks.append([item])
+            self._maxes.append(item)
+            if self._owned is not None:
+                self._owned.append(True)
+            return
+        block_index = min(bisect_left(self._maxes, item), len(self._maxes) - 1)
+        block = self._writable_block(block_index)
+        insort(block, item)
+        self._maxes[block_index] = block[-1]
+        if len(block) > 2 * _SORTED_BLOCK:
+            half = len(block) // 2
+            self._blocks[block_index:block_index + 1] = [block[:half], block[half:]]
+            self._maxes[block_index:block_index + 1] = [block[half - 1], block[-1]]
+            if self._owned is not None:
+                self._owned[block_index:block_index + 1] = [True, True]
+
+    def remove(self, item: Any) -> bool:
+        """Remove one occurrence of ``item``; returns whether it was present."""
+        block_index = bisect_left(self._maxes, item)
+        if block_index == len(self._maxes):
+            return False
+        block = self._blocks[block_index]
+        position = bisect_left(block, item)
+        if position == len(block) or block[position] != item:
+            return False
+        block = self._writable_block(block_index)
+        del block[position]
+        self._offsets = None
+        self._length -= 1
+        if block:
+            self._maxes[block_index] = block[-1]
+        else:
+            del self._blocks[block_index]
+            del self._maxes[block_index]
+            if self._owned is not None:
+                del self._owned[block_index]
+        return True
+
+    def _block_offsets(self) -> List[int]:
+        offsets = self._offsets
+        if offsets is None:
+            offsets = self._offsets = list(itertools.accumulate((len(block) for block in self._blocks), initial=0))
+        return offsets
+
+    def bisect_left(self, value: Any, key: Optional[Callable[[Any], Any]] = None) -> int:
+        block_index = bisect_left(self._maxes, value, key=key)
+        if block_index == len(self._maxes):
+            return self._length
+        return self._block_offsets()[block_index] + bisect_left(self._blocks[block_index], value, key=key)
+
+    def bisect_right(self, value: Any, key: Optional[Callable[[Any], Any]] = None) -> int:
+        block_index = bisect_right(self._maxes, value, key=key)
+        if block_index == len(self._maxes):
+            return self._length
+        return self._block_offsets()[block_index] + bisect_right(self._blocks[block_index], value, key=key)
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self._length)
+            return self._slice(start, stop)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        offsets = self._block_offsets()
+        block_index = bisect_right(offsets, index) - 1
+        return self._blocks[block_index][index - offsets[block_index]]
+
+    def _slice(self, start: int, stop: int) -> List[Any]:
+        items: List[Any] = []
+        if start >= stop:
+            return items
+        offsets = self._block_offsets()
+        block_index = bisect_right(offsets, start) - 1
+        position = start - offsets[block_index]
+        while len(items) < stop - start:
+            items.extend(self._blocks[block_index][position:position + stop - start - len(items)])
+            block_index += 1
+            position = 0
+        return items
+
+
+class BlockArray:
+    """A growable array stored in fixed-size blocks that copies share until they write them.
+
+    ``new_block(size)`` returns one block of ``size`` default values; any
+    mutable sequence supporting slicing works (list, array.array, bytearray).
+    ``copy()`` costs one list of block references and a write copies one block.
+    """
+
+    __slots__ = ("_new_block", "_blocks", "_owned", "_length")
+
+    def __init__(self, new_block: Callable[[], Any], length: int = 0):
+        self._new_block = new_block
+        self._blocks: List[Any] = [new_block(_ARRAY_BLOCK) for _ in range(-(-length // _ARRAY_BLOCK))]
+        # Blocks this instance may modify in place; None means all of them
+        self._owned: Optional[List[bool]] = None
+        self._length = length
+
+    def copy(self) -> "BlockArray":
+        clone = BlockArray(self._new_block)
+        clone._blocks = list(self._blocks)
+        clone._owned = [False] * len(self._blocks)
+        clone._length = self._length
+        return clone
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Any:
+        block_index, offset = divmod(index, _ARRAY_BLOCK)
+        return self._blocks[block_index][offset]
+
+    def __setitem__(self, index: int, value: Any) -> None:
+        block_index, offset = divmod(index, _ARRAY_BLOCK)
+        if self._owned is not None and not self._owned[block_index]:
+            self._blocks[block_index] = self._blocks[block_index][:]
+            self._owned[block_index] = True
+        self._blocks[block_index][offset] = value
+
+    def append(self, value: Any) -> None:
+        if self._length == len(self._blocks) * _ARRAY_BLOCK:
+            self._blocks.append(self._new_block(_ARRAY_BLOCK))
+            if self._owned is not None:
+                self._owned.append(True)
+        self._length += 1
+        self[self._length - 1] = value
+
+    def __iter__(self) -> Iterator[Any]:
+        remaining = self._length
+        for block in self._blocks:
+            if remaining <= 0:
+                return
+            yield from block[:remaining] if remaining < _ARRAY_BLOCK else block
+            remaining -= _ARRAY_BLOCK
+
+
+class EqualityIndex:
+    """Maps each value of one document field to the ids of the documents holding it.
+
+    A bucket is a mapping whose keys are the ids. ``copy()`` shares the
+    buckets with the original; a bucket is only copied the first time the
+    copy modifies it, so published lookups never change.
+    """
+
+    __slots__ = ("field", "_buckets", "_owned", "_entries")
+
+    def __init__(self, field: str):
+        self.field = field
+        self._buckets: ShardedDict = ShardedDict()
+        # Keys of buckets this instance may modify in place; None means all of them
+        self._owned: Optional[Set[Hashable]] = None
+        # Ids across all buckets
+        self._entries = 0
+
+    def copy(self) -> "EqualityIndex":
+        clone = EqualityIndex(self.field)
+        clone._buckets = self._buckets.copy()
+        clone._owned = set()
+        clone._entries = self._entries
+        return clone
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the index."""
+        return self._entries * _BUCKET_ENTRY_BYTES
+
+    def _writable_bucket(self, key: Hashable) -> Optional[MutableMapping]:
+        bucket = self._buckets.get(key)
+        if bucket is not None and self._owned is not None and key not in self._owned:
+            bucket = self._buckets[key] = writable_copy(bucket)
+            self._owned.add(key)
+        return bucket
+
+    def add(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        value = get_field(doc_data, self.field)
+        if value is MISSING:
+            return
+        key = value_key(value)
+        bucket = self._writable_bucket(key)
+        if bucket is None:
+            bucket = self._buckets[key] = {}
+            if self._owned is not None:
+                self._owned.add(key)
+        self._entries += doc_id not in bucket
+        bucket[doc_id] = None
+
+    def remove(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        value = get_field(doc_data, self.field)
+        if value is MISSING:
+            return
+        key = value_key(value)
+        bucket = self._writable_bucket(key)
+        if bucket is None or doc_id not in bucket:
+            return
+        del bucket[doc_id]
+        self._entries -= 1
+        if not bucket:
+            del self._buckets[key]
+
+    def lookup(self, value: Any) -> AbstractSet[str]:
+        """Return the ids of documents whose field equals ``value``."""
+        bucket = self._buckets.get(value_key(value))
+        return _EMPTY if bucket is None else bucket.keys()
+
+    def lookup_many(self, values: Iterable[Any]) -> Set[str]:
+        """Return the ids of documents whose field equals any of ``values``."""
+        matches: Set[str] = set()
+        for value in values:
+            matches.update(self.lookup(value))
+        return matches
+
+
+class DocumentIdIndex:
+    """The cached document ids in order, for paging through a collection ordered by id.
+
+    Offers the same ``position``/``ids`` interface as SortedIndex, ignoring values.
+    """
+
+    __slots__ = ("_ids",)
+
+    def __init__(self) -> None:
+        self._ids = SortedBlocks()
+
+    def copy(self) -> "DocumentIdIndex":
+        clone = DocumentIdIndex()
+        clone._ids = self._ids.copy()
+        return clone
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the index; the id strings are shared with the documents."""
+        return len(self._ids) * _ID_ENTRY_BYTES
+
+    def orders_every_value(self) -> bool:
+        return True
+
+    def add(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        self._ids.add(doc_id)
+
+    def remove(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        self._ids.remove(doc_id)
+
+    def replace(self, doc_id: str, previous: Dict[str, Any], doc_data: Dict[str, Any]) -> None:
+        """A modified document keeps its id and so its position."""
+
+    def position(self, value: Any, doc_id: str, after: bool = True) -> int:
+        """Index of the first id after ``doc_id``, or with ``after=False`` of the first not before it."""
+        return self._ids.bisect_right(doc_id) if after else self._ids.bisect_left(doc_id)
+
+    def ids(self, start: int, stop: int) -> List[str]:
+        return self._ids[start:stop]
+
+
+class SortedIndex:
+    """Keeps (value, doc id) pairs of one numeric or timestamp field in sorted order.
+
+    Range conditions resolve with two binary searches and the matching ids come
+    back ordered by the field value, then by document id. Entries live in
+    SortedBlocks, so a copy shares them until it modifies a block.
+    """
+
+    __slots__ = ("field", "_entries", "_unsorted")
+
+    def __init__(self, field: str):
+        self.field = field
+        self._entries = SortedBlocks()
+        # Documents whose field holds a value other than a number or timestamp
+        self._unsorted = 0
+
+    def copy(self) -> "SortedIndex":
+        clone = SortedIndex(self.field)
+        clone._entries = self._entries.copy()
+        clone._unsorted = self._unsorted
+        return clone
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def orders_every_value(self) -> bool:
+        """True if every document with the field is in the index, so it gives the full field order."""
+        return self._unsorted == 0
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the index."""
+        return len(self._entries) * _SORTED_ENTRY_BYTES
+
+    @staticmethod
+    def _sortable_key(value: Any) -> Optional[Tuple[Any, ...]]:
+        key = value_key(value)
+        if key[:2] == (2, 1) or key[0] == 3:  # non-NaN numbers and timestamps
+            return key
+        return None
+
+    def add(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        value = get_field(doc_data, self.field)
+        if value is MISSING:
+            return
+        key = self._sortable_key(value)
+        if key is None:
+            self._unsorted += 1
+        else:
+            self._entries.add((key, doc_id))
+
+    def remove(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        value = get_field(doc_data, self.field)
+        if value is MISSING:
+            return
+        key = self._sortable_key(value)
+        if key is None:
+            self._unsorted -= 1
+        else:
+            self._entries.remove((key, doc_id))
+
+    def position(self, value: Any, doc_id: str, after: bool = True) -> int:
+        """Index of the first entry after (``value``, ``doc_id``), or with ``after=False``
+        of the first entry not before it."""
+        entry = (value_key(value), doc_id)
+        return self._entries.bisect_right(entry) if after else self._entries.bisect_left(entry)
+
+    def span(self, bounds: List[Tuple[str, Any]]) -> Optional[Tuple[int, int]]:
+        """Return the [start, stop) slice matching every (operator, value) bound.
+
+        Returns None when an operand is not a number or timestamp, in which case
+        the caller has to evaluate the bounds some other way.
+        """
+        rank = None
+        lower: Tuple[Any, ...] = ()
+        upper: Tuple[Any, ...] = ()
+        lower_inclusive = upper_inclusive = True
+        for operator, value in bounds:
+            key = self._sortable_key(value)
+            if key is None:
+                return None
+            if rank is None:
+                rank = key[0]
+            elif rank != key[0]:
+                return (0, 0)  # operands of different types can never both hold
+            if operator in (">", ">="):
+                if not lower or key > lower or (key == lower and operator == ">"):
+                    lower, lower_inclusive = key, operator == ">="
+            elif operator in ("<", "<="):
+                if not upper or key < upper or (key == upper and operator == "<"):
+                    upper, upper_inclusive = key, operator == "<="
+            else:
+                return None
+        if rank is None:
+            return None
+
+        key_of = itemgetter(0)
+        entries = self._entries
+        if lower:
+            search = entries.bisect_left if lower_inclusive else entries.bisect_right
+            start = search(lower, key=key_of)
+        else:
+            start = entries.bisect_left((2, 1) if rank == 2 else (rank,), key=key_of)
+        if upper:
+            search = entries.bisect_right if upper_inclusive else entries.bisect_left
+            stop = search(upper, key=key_of)
+        else:
+            stop = entries.bisect_left((2, 2) if rank == 2 else (rank + 1,), key=key_of)
+        return (start, max(start, stop))
+
+    def ids(self, start: int, stop: int) -> List[str]:
+        return [doc_id for _, doc_id in self._entries[start:stop]]
+
+
+_EMPTY: AbstractSet[str] = frozenset()
+
+
+def numeric_value(value: Any) -> Optional[float]:
+    """Return ``value`` as a number if Firestore would aggregate it (no bools or NaN)."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        return None
+    return value
+
+
+def rank_key(doc_data: Dict[str, Any], field: str) -> Tuple[Any, ...]:
+    """Sort key of a document by ``field``; documents without it sort first."""
+    value = get_field(doc_data, field)
+    return (-1,) if value is MISSING else value_key(value)
+
+
+class GroupStats:
+    """Document count, sorted numeric values and ranked ids of one group of a GroupAggregate."""
+
+    __slots__ = ("value", "count", "_numbers", "_sums", "_ranked")
+
+    def __init__(self, value: Any):
+        self.value = value
+        self.count = 0
+        self._numbers: Dict[str, SortedBlocks] = {}
+        self._sums: Dict[str, float] = {}
+        # (rank key, doc id) in ascending order, when the aggregate has a rank field
+        self._ranked = SortedBlocks()
+
+    def copy(self) -> "GroupStats":
+        clone = GroupStats(self.value)
+        clone.count = self.count
+        clone._numbers = {field: values.copy() for field, values in self._numbers.items()}
+        clone._sums = dict(self._sums)
+        clone._ranked = self._ranked.copy()
+        return clone
+
+    def top(self, limit: int) -> List[str]:
+        """Ids of the ``limit`` documents ranked highest, best first."""
+        if limit <= 0:
+            return []
+        return [doc_id for _, doc_id in reversed(self._ranked[-limit:])]
+
+    def add_number(self, field: str, number: float) -> None:
+        values = self._numbers.get(field)
+        if values is None:
+            values = self._numbers[field] = SortedBlocks()
+        values.add(number)
+        self._sums[field] = self._sums.get(field, 0) + number
+
+    def remove_number(self, field: str, number: float) -> None:
+        values = self._numbers.get(field)
+        if values is not None and values.remove(number):
+            self._sums[field] -= number
+
+    def summary(self, field: str) -> Dict[str, Any]:
+        """count/min/max/avg of the numeric values of ``field`` in this group."""
+        values = self._numbers.get(field) or []
+        if not values:
+            return {"count": 0, "min": None, "max": None, "avg": None}
+        return {
+            "count": len(values),
+            "min": values[0],
+            "max": values[-1],
+            "avg": self._sums[field] / len(values),
+        }
+
+
+class GroupAggregate:
+    """Per-value document counts of one field, with numeric summaries per group.
+
+    Maintained on every change like the other indexes, so distinct values and
+    grouped counts/min/max/avg come back in time proportional to the number of
+    groups. With a ``rank_field``, each group also keeps its document ids
+    ordered by that field, so the top documents per group are a slice.
+    Groups are copied on write, one at a time.
+    """
+
+    __slots__ = ("field", "numeric_fields", "rank_field", "_groups", "_owned")
+
+    def __init__(self, field: str, numeric_fields: Iterable[str] = (), rank_field: Optional[str] = None):
+        self.field = field
+        self.numeric_fields = tuple(numeric_fields)
+        self.rank_field = rank_field
+        self._groups: Dict[Hashable, GroupStats] = {}
+        self._owned: Optional[Set[Hashable]] = None
+
+    def copy(self) -> "GroupAggregate":
+        clone = GroupAggregate(self.field, self.numeric_fields, self.rank_field)
+        clone._groups = dict(self._groups)
+        clone._owned = set()
+        return clone
+
+    def _writable_group(self, key: Hashable, value: Any) -> GroupStats:
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = GroupStats(value)
+        elif self._owned is not None and key not in self._owned:
+            group = self._groups[key] = group.copy()
+        if self._owned is not None:
+            self._owned.add(key)
+        return group
+
+    def add(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        value = get_field(doc_data, self.field)
+        if value is MISSING:
+            return
+        group = self._writable_group(value_key(value), value)
+        group.count += 1
+        for field in self.numeric_fields:
+            number = numeric_value(get_field(doc_data, field))
+            if number is not None:
+                group.add_number(field, number)
+        if self.rank_field is not None:
+            group._ranked.add((rank_key(doc_data, self.rank_field), doc_id))
+
+    def remove(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        value = get_field(doc_data, self.field)
+        if value is MISSING:
+            return
+        key = value_key(value)
+        if key not in self._groups:
+            return
+        group = self._writable_group(key, value)
+        group.count -= 1
+        if group.count <= 0:
+            del self._groups[key]
+            return
+        for field in self.numeric_fields:
+            number = numeric_value(get_field(doc_data, field))
+            if number is not None:
+                group.remove_number(field, number)
+        if self.rank_field is not None:
+            group._ranked.remove((rank_key(doc_data, self.rank_field), doc_id))
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the aggregate."""
+        return sum(
+            len(group._ranked) * _SORTED_ENTRY_BYTES
+            + sum(len(values) for values in group._numbers.values()) * _NUMBER_ENTRY_BYTES
+            for group in self._groups.values()
+        )
+
+    def groups(self) -> List[GroupStats]:
+        """Groups ordered by value, in Firestore's cross-type order (do not mutate)."""
+        return [self._groups[key] for key in sorted(self._groups)]
+
+
+def aggregate_documents(
+    documents: Iterable[Dict[str, Any]],
+    field: str,
+    numeric_fields: Iterable[str] = (),
+) -> List[GroupStats]:
+    """Group an arbitrary set of documents the way GroupAggregate does."""
+    aggregate = GroupAggregate(field, numeric_fields)
+    for doc_data in documents:
+        aggregate.add("", doc_data)
+    return aggregate.groups()
+
+
+class CacheSnapshot:
+    """One immutable version of a cached collection: its documents and indexes.
+
+    Writers never modify a published snapshot. They take a private successor
+    with ``evolve()`` (copy-on-write: the documents and indexes live in
+    sharded or blocked containers, so a copy shares them and only the shards,
+    blocks and buckets a batch touches are copied), apply a batch of changes
+    with ``put`` and ``discard`` and publish it by swapping the reference. Readers grab the
+    current reference once and see one consistent version without locking.
+
+    ``search_indexes`` holds the text search structures by name,
+    ``aggregates`` the GroupAggregates by field and ``id_index`` the document
+    ids in order; they follow the same
+    add/remove/copy protocol as the field indexes. Those with a
+    ``replace`` method handle modified documents themselves, and ``seal`` lets
+    them finish batched work before the snapshot is published.
+    ``documents_size`` is the approximate memory of the cached documents,
+    kept up to date by ``put`` and ``discard`` unless the document store
+    reports its own through ``memory_size()``; ``size`` adds what each index
+    reports.
+    """
+
+    __slots__ = (
+        "version",
+        "documents_size",
+        "documents",
+        "indexes",
+        "range_indexes",
+        "search_indexes",
+        "aggregates",
+        "id_index",
+    )
+
+    def __init__(
+        self,
+        documents: Any,
+        indexes: Dict[str, EqualityIndex],
+        range_indexes: Dict[str, SortedIndex],
+        search_indexes: Optional[Dict[str, Any]] = None,
+        aggregates: Optional[Dict[str, GroupAggregate]] = None,
+        version: int = 0,
+        documents_size: int = 0,
+        id_index: Optional[DocumentIdIndex] = None,
+    ):
+        self.version = version
+        self.documents_size = documents_size
+        self.documents = documents
+        self.indexes = indexes
+        self.range_indexes = range_indexes
+        self.search_indexes = search_indexes if search_indexes is not None else {}
+        self.aggregates = aggregates if aggregates is not None else {}
+        self.id_index = id_index if id_index is not None else DocumentIdIndex()
+
+    def evolve(self) -> "CacheSnapshot":
+        return CacheSnapshot(
+            self.documents.copy(),
+            {field: index.copy() for field, index in self.indexes.items()},
+            {field: index.copy() for field, index in self.range_indexes.items()},
+            {name: index.copy() for name, index in self.search_indexes.items()},
+            {field: aggregate.copy() for field, aggregate in self.aggregates.items()},
+            self.version + 1,
+            self.documents_size,
+            self.id_index.copy(),
+        )
+
+    @property
+    def size(self) -> int:
+        """Approximate memory of the cached documents and their indexes, in bytes."""
+        documents_size = (
+            self.documents.memory_size() if hasattr(self.documents, "memory_size") else self.documents_size
+        )
+        return documents_size + sum(index.memory_size() for index in self._all_indexes())
+
+    def _all_indexes(self) -> Tuple[Any, ...]:
+        return (
+            *self.indexes.values(),
+            *self.range_indexes.values(),
+            *self.search_indexes.values(),
+            *self.aggregates.values(),
+            self.id_index,
+        )
+
+    def put(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        previous = self.documents.get(doc_id)
+        for index in self._all_indexes():
+            if previous is None:
+                index.add(doc_id, doc_data)
+            elif hasattr(index, "replace"):
+                index.replace(doc_id, previous, doc_data)
+            else:
+                index.remove(doc_id, previous)
+                index.add(doc_id, doc_data)
+        self.documents[doc_id] = doc_data
+        if not hasattr(self.documents, "memory_size"):
+            self.documents_size += document_size(doc_data) - (document_size(previous) if previous is not None else 0)
+
+    def discard(self, doc_id: str) -> None:
+        previous = self.documents.pop(doc_id, None)
+        if previous is None:
+            return
+        if not hasattr(self.documents, "memory_size"):
+            self.documents_size -= document_size(previous)
+        for index in self._all_indexes():
+            index.remove(doc_id, previous)
+
+    def seal(self) -> None:
+        """Finish pending index work; call once before publishing."""
+        for index in self.search_indexes.values():
+            if hasattr(index, "seal"):
+                index.seal()
+
+
+# Marks an empty cell in CompactDocumentStore columns (field absent or row freed).
+_ABSENT = object()
+
+# Approximate bytes for memory_size() of a CompactDocumentStore, measured like
+# the index entries above: a document id's row number entry (besides the id
+# string) and a string table entry (besides the string).
+_ROW_ENTRY_BYTES = 64
+_STRING_ENTRY_BYTES = 40
+
+# Per-row type tags of _NumberColumn.
+_TAG_ABSENT, _TAG_FLOAT, _TAG_INT, _TAG_BOOL, _TAG_TIMESTAMP = range(5)
+_MAX_EXACT_INT = 2**53
+
+
+def _unshared_size(value: Any) -> int:
+    """Like document_size, leaving out strings, which the string table accounts for."""
+    if isinstance(value, str):
+        return 0
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_unshared_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_unshared_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class _ObjectColumn:
+    """Fallback column holding arbitrary values in blocks of plain lists."""
+
+    __slots__ = ("_values", "_value_bytes")
+
+    def __init__(self, row_count: int):
+        self._values = BlockArray(lambda size: [_ABSENT] * size, row_count)
+        self._value_bytes = 0
+
+    def copy(self) -> "_ObjectColumn":
+        clone = _ObjectColumn(0)
+        clone._values = self._values.copy()
+        clone._value_bytes = self._value_bytes
+        return clone
+
+    def memory_size(self) -> int:
+        return 8 * len(self._values) + self._value_bytes
+
+    def accepts(self, value: Any) -> bool:
+        return True
+
+    def grow(self) -> None:
+        self._values.append(_ABSENT)
+
+    def get(self, row: int) -> Any:
+        return self._values[row]
+
+    def set(self, row: int, value: Any) -> None:
+        self.clear(row)
+        self._values[row] = value
+        self._value_bytes += _unshared_size(value)
+
+    def clear(self, row: int) -> None:
+        previous = self._values[row]
+        if previous is not _ABSENT:
+            self._value_bytes -= _unshared_size(previous)
+            self._values[row] = _ABSENT
+
+
+class _NumberColumn:
+    """Numbers, booleans and timestamps packed into a float array plus a type tag per row.
+
+    Timestamps are stored as POSIX seconds and read back as UTC datetimes.
+    """
+
+    __slots__ = ("_values", "_tags")
+
+    def __init__(self, row_count: int):
+        self._values = BlockArray(lambda size: array("d", bytes(8 * size)), row_count)
+        self._tags = BlockArray(bytearray, row_count)
+
+    def copy(self) -> "_NumberColumn":
+        clone = _NumberColumn(0)
+        clone._values = self._values.copy()
+        clone._tags = self._tags.copy()
+        return clone
+
+    def memory_size(self) -> int:
+        return 9 * len(self._tags)
+
+    def accepts(self, value: Any) -> bool:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT
+        return isinstance(value, (float, bool, datetime))
+
+    def grow(self) -> None:
+        self._values.append(0.0)
+        self._tags.append(_TAG_ABSENT)
+
+    def get(self, row: int) -> Any:
+        tag = self._tags[row]
+        if tag == _TAG_FLOAT:
+            return self._values[row]
+        if tag == _TAG_INT:
+            return int(self._values[row])
+        if tag == _TAG_BOOL:
+            return self._values[row] != 0.0
+        if tag == _TAG_TIMESTAMP:
+            return datetime.fromtimestamp(self._values[row], tz=timezone.utc)
+        return _ABSENT
+
+    def set(self, row: int, value: Any) -> None:
+        if isinstance(value, bool):
+            self._values[row], self._tags[row] = float(value), _TAG_BOOL
+        elif isinstance(value, int):
+            self._values[row], self._tags[row] = float(value), _TAG_INT
+        elif isinstance(value, datetime):
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            self._values[row], self._tags[row] = value.timestamp(), _TAG_TIMESTAMP
+        else:
+            self._values[row], self._tags[row] = value, _TAG_FLOAT
+
+    def clear(self, row: int) -> None:
+        self._tags[row] = _TAG_ABSENT
+
+
+class _TextColumn:
+    """Mostly-unique strings (e.g. titles) stored as UTF-8 in one shared byte heap.
+
+    Each row keeps an offset and a length instead of a str object. Space left by
+    replaced values is reclaimed once it exceeds the live data. The heap is
+    append-only until it is rebuilt into a new buffer, so copies share it.
+    """
+
+    __slots__ = ("_heap", "_heap_end", "_offsets", "_lengths", "_garbage")
+
+    _NO_VALUE = 0xFFFFFFFF
+
+    def __init__(self, row_count: int):
+        self._heap = bytearray()
+        # Bytes of the shared heap this copy uses; later copies may have appended more
+        self._heap_end = 0
+        self._offsets = BlockArray(lambda size: array("Q", bytes(8 * size)), row_count)
+        self._lengths = BlockArray(lambda size: array("L", [self._NO_VALUE]) * size, row_count)
+        self._garbage = 0
+
+    def copy(self) -> "_TextColumn":
+        clone = _TextColumn(0)
+        clone._heap = self._heap
+        clone._heap_end = self._heap_end
+        clone._offsets = self._offsets.copy()
+        clone._lengths = self._lengths.copy()
+        clone._garbage = self._garbage
+        return clone
+
+    def memory_size(self) -> int:
+        return self._heap_end + 16 * len(self._offsets)
+
+    def accepts(self, value: Any) -> bool:
+        return isinstance(value, str)
+
+    def grow(self) -> None:
+        self._offsets.append(0)
+        self._lengths.append(self._NO_VALUE)
+
+    def get(self, row: int) -> Any:
+        length = self._lengths[row]
+        if length == self._NO_VALUE:
+            return _ABSENT
+        offset = self._offsets[row]
+        return self._heap[offset:offset + length].decode("utf-8")
+
+    def set(self, row: int, value: Any) -> None:
+        self.clear(row)
+        encoded = value.encode("utf-8")
+        self._offsets[row] = len(self._heap)
+        self._lengths[row] = len(encoded)
+        self._heap += encoded
+        self._heap_end = len(self._heap)
+
+    def clear(self, row: int) -> None:
+        length = self._lengths[row]
+        if length == self._NO_VALUE:
+            return
+        self._lengths[row] = self._NO_VALUE
+        self._garbage += length
+        if self._garbage > len(self._heap) - self._garbage + 4096:
+            self._compact()
+
+    def _compact(self) -> None:
+        heap = bytearray()
+        for row, length in enumerate(list(self._lengths)):
+            if length == self._NO_VALUE:
+                continue
+            offset = self._offsets[row]
+            self._offsets[row] = len(heap)
+            heap += self._heap[offset:offset + length]
+        self._heap = heap
+        self._heap_end = len(heap)
+        self._garbage = 0
+
+
+class CompactDocumentStore(MutableMapping):
+    """Column-oriented replacement for the ``{doc_id: doc_data}`` cache dict.
+
+    Each field is one column indexed by row number instead of every document
+    carrying its own dict with its own copies of the keys. Numbers and
+    timestamps live in typed arrays, ``text_fields`` (titles) in a UTF-8 string
+    heap, and any other string goes through a shared string table so repeated
+    values such as ``categoryId`` are stored once. A column falls back to plain
+    Python objects when a value does not fit its type. Rows freed by deletions
+    are reused. Reads materialize a fresh dict per document, trading some CPU
+    for a much smaller resident cache. ``memory_size()`` estimates that cache
+    from the columns, row ids and string table rather than per document dict.
+    """
+
+    def __init__(self, text_fields: Iterable[str] = ("title",)) -> None:
+        self._text_fields = frozenset(text_fields)
+        self._rows = ShardedDict()
+        self._columns: Dict[str, Any] = {}
+        self._free_rows: List[int] = []
+        self._row_count = 0
+        self._strings: Dict[str, str] = {}
+        self._strings_bytes = 0
+        self._rows_bytes = 0
+        self._replaced_since_compaction = 0
+
+    def copy(self) -> "CompactDocumentStore":
+        """Copy for copy-on-write snapshots.
+
+        Row ids and columns are sharded or blocked, so the copy shares them
+        until it writes. The string table and text heaps are only ever
+        appended to or replaced wholesale, and only the newest copy is
+        written, so they are shared.
+        """
+        clone = CompactDocumentStore(self._text_fields)
+        clone._rows = self._rows.copy()
+        clone._columns = {field: column.copy() for field, column in self._columns.items()}
+        clone._free_rows = list(self._free_rows)
+        clone._row_count = self._row_count
+        clone._strings = self._strings
+        clone._strings_bytes = self._strings_bytes
+        clone._rows_bytes = self._rows_bytes
+        clone._replaced_since_compaction = self._replaced_since_compaction
+        return clone
+
+    def memory_size(self) -> int:
+        """Approximate memory of the stored documents in bytes."""
+        return (
+            self._rows_bytes
+            + self._strings_bytes
+            + 8 * len(self._free_rows)
+            + sum(column.memory_size() for column in self._columns.values())
+        )
+
+    def _intern(self, value: Any) -> Any:
+        if isinstance(value, str):
+            interned = self._strings.get(value)
+            if interned is None:
+                interned = self._strings[value] = value
+                self._strings_bytes += sys.getsizeof(value) + _STRING_ENTRY_BYTES
+            return interned
+        if isinstance(value, list):
+            return [self._intern(item) for item in value]
+        if isinstance(value, dict):
+            return {self._intern(key): self._intern(item) for key, item in value.items()}
+        return value
+
+    def _new_column(self, field: str, value: Any) -> Any:
+        for column_type in (_NumberColumn, _TextColumn) if field in self._text_fields else (_NumberColumn,):
+            column = column_type(self._row_count)
+            if column.accepts(value):
+                return column
+        return _ObjectColumn(self._row_count)
+
+    def _widen_column(self, field: str) -> Any:
+        column = self._columns[field]
+        widened = _ObjectColumn(self._row_count)
+        for row in range(self._row_count):
+            widened.set(row, self._intern(column.get(row)))
+        self._columns[field] = widened
+        return widened
+
+    def __getitem__(self, doc_id: str) -> Dict[str, Any]:
+        row = self._rows[doc_id]
+        document = {}
+        for field, column in self._columns.items():
+            value = column.get(row)
+            if value is not _ABSENT:
+                document[field] = value
+        return document
+
+    def __setitem__(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        row = self._rows.get(doc_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                row = self._row_count
+                self._row_count += 1
+                for column in self._columns.values():
+                    column.grow()
+            self._rows[doc_id] = row
+            self._rows_bytes += sys.getsizeof(doc_id) + _ROW_ENTRY_BYTES
+        else:
+            self._clear_row(row)
+            self._note_replacement()
+
+        for field, value in doc_data.items():
+            column = self._columns.get(field)
+            if column is None:
+                column = self._columns[self._intern(field)] = self._new_column(field, value)
+            elif not column.accepts(value):
+                column = self._widen_column(field)
+            column.set(row, self._intern(value) if isinstance(column, _ObjectColumn) else value)
+
+    def __delitem__(self, doc_id: str) -> None:
+        row = self._rows.pop(doc_id)
+        self._rows_bytes -= sys.getsizeof(doc_id) + _ROW_ENTRY_BYTES
+        self._clear_row(row)
+        self._free_rows.append(row)
+        self._note_replacement()
+
+    def _clear_row(self, row: int) -> None:
+        for column in self._columns.values():
+            column.clear(row)
+
+    def _note_replacement(self) -> None:
+        # Strings of replaced rows stay in the table until it is rebuilt from the
+        # live rows; doing that after O(n) replacements keeps the cost amortized O(1).
+        self._replaced_since_compaction += 1
+        if self._replaced_since_compaction <= 2 * len(self._rows) + 1024:
+            return
+        self._replaced_since_compaction = 0
+        self._strings = {}
+        self._strings_bytes = 0
+        for field in list(self._columns):
+            column = self._columns.pop(field)
+            if isinstance(column, _ObjectColumn):
+                for row in range(self._row_count):
+                    value = column.get(row)
+                    if value is not _ABSENT:
+                        column.set(row, self._intern(value))
+            self._columns[self._intern(field)] = column
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._rows
@@ -0,0 +1,270 @@
+"""Text search structures backing the FirebaseReadOnlyTool ``search`` operation."""
+
+import heapq
+import math
+import re
+import unicodedata
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Set, Tuple
+
+from .firebase_cache import ShardedDict, writable_copy
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Approximate bytes for TextIndex.memory_size(), measured with tracemalloc on
+# CPython 3.11: a (doc id, frequency) posting entry, a vocabulary term with its
+# posting dict and n-grams, and a document length.
+_POSTING_ENTRY_BYTES = 64
+_TERM_BYTES = 300
+_DOCUMENT_LENGTH_BYTES = 100
+
+# Harakat, tanween, shadda, sukun, superscript alef, Quranic marks and tatweel are dropped.
+_ARABIC_MARKS = "".join(chr(code) for code in (*range(0x0610, 0x061B), *range(0x064B, 0x0660), 0x0670, 0x0640))
+_ARABIC_FOLDING = str.maketrans(
+    {
+        **{mark: None for mark in _ARABIC_MARKS},
+        "أ": "ا",
+        "إ": "ا",
+        "آ": "ا",
+        "ٱ": "ا",
+        "ى": "ي",
+        "ئ": "ي",
+        "ؤ": "و",
+        "ة": "ه",
+        **{chr(0x0660 + digit): str(digit) for digit in range(10)},  # Arabic-Indic digits
+        **{chr(0x06F0 + digit): str(digit) for digit in range(10)},  # Persian digits
+    }
+)
+
+# Gram length of the fuzzy term index.
+NGRAM_SIZE = 3
+
+
+def normalize_text(text: str) -> str:
+    """Fold spelling variants so they index and match as the same text.
+
+    Applies NFKC and case folding, strips Arabic diacritics and tatweel, and
+    unifies alef/hamza forms, alef maqsura with yaa and taa marbuta with haa.
+    """
+    return unicodedata.normalize("NFKC", text).casefold().translate(_ARABIC_FOLDING)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split normalized text into word tokens (Arabic and Latin letters and digits)."""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def ngrams(term: str) -> Set[str]:
+    """Character n-grams of a term padded with word boundaries."""
+    padded = f" {term} "
+    return {padded[start:start + NGRAM_SIZE] for start in range(max(1, len(padded) - NGRAM_SIZE + 1))}
+
+
+def field_text(value: Any) -> str:
+    """Flatten a field value (string, list of tags, number) into searchable text."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(field_text(item) for item in value)
+    if isinstance(value, dict):
+        return " ".join(field_text(item) for item in value.values())
+    return str(value)
+
+
+class NGramIndex:
+    """Maps character n-grams to the indexed terms containing them.
+
+    Used to find vocabulary terms close to a misspelt query term. It indexes
+    distinct terms rather than documents, so lookups grow with the vocabulary,
+    not with the catalog. ``copy()`` shares gram sets copy-on-write.
+    """
+
+    __slots__ = ("_terms", "_owned")
+
+    def __init__(self) -> None:
+        self._terms = ShardedDict()
+        self._owned: Optional[Set[str]] = None
+
+    def copy(self) -> "NGramIndex":
+        clone = NGramIndex()
+        clone._terms = self._terms.copy()
+        clone._owned = set()
+        return clone
+
+    def add(self, term: str) -> None:
+        for gram in ngrams(term):
+            terms = self._terms.get(gram)
+            if terms is None:
+                terms = self._terms[gram] = set()
+            elif self._owned is not None and gram not in self._owned:
+                terms = self._terms[gram] = set(terms)
+            if self._owned is not None:
+                self._owned.add(gram)
+            terms.add(term)
+
+    def remove(self, term: str) -> None:
+        for gram in ngrams(term):
+            terms = self._terms.get(gram)
+            if terms is None:
+                continue
+            if self._owned is not None and gram not in self._owned:
+                terms = self._terms[gram] = set(terms)
+                self._owned.add(gram)
+            terms.discard(term)
+            if not terms:
+                del self._terms[gram]
+
+    def similar(self, term: str, min_similarity: float, limit: int) -> List[Tuple[str, float]]:
+        """Return up to ``limit`` (term, Dice similarity) pairs at or above ``min_similarity``."""
+        grams = ngrams(term)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._terms.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        matches = []
+        for candidate, count in shared.items():
+            similarity = 2.0 * count / (len(grams) + len(ngrams(candidate)))
+            if similarity >= min_similarity:
+                matches.append((candidate, similarity))
+        return heapq.nsmallest(limit, matches, key=lambda item: (-item[1], item[0]))
+
+
+class TextIndex:
+    """Inverted index over weighted text fields, ranked with BM25.
+
+    Text is normalized before indexing, so Arabic spelling variants share
+    terms. Each field's term frequencies are multiplied by its weight, so a
+    match in the title can count more than one in the description. Query
+    terms missing from the vocabulary (typos) are expanded through an n-gram
+    index to similar terms, whose scores are scaled by the similarity. Like
+    EqualityIndex, ``copy()`` shares posting lists and copies one only when
+    it is modified.
+    """
+
+    __slots__ = (
+        "field_weights", "k1", "b", "_postings", "_owned", "_lengths", "_total_length", "_ngrams", "_entries"
+    )
+
+    def __init__(self, field_weights: Dict[str, float], k1: float = 1.2, b: float = 0.75):
+        self.field_weights = dict(field_weights)
+        self.k1 = k1
+        self.b = b
+        # term -> {doc id: weighted term frequency}
+        self._postings = ShardedDict()
+        self._owned: Optional[Set[str]] = None
+        self._lengths = ShardedDict()
+        self._total_length = 0.0
+        self._ngrams = NGramIndex()
+        # Entries across all postings
+        self._entries = 0
+
+    def copy(self) -> "TextIndex":
+        clone = TextIndex(self.field_weights, self.k1, self.b)
+        clone._postings = self._postings.copy()
+        clone._owned = set()
+        clone._lengths = self._lengths.copy()
+        clone._total_length = self._total_length
+        clone._ngrams = self._ngrams.copy()
+        clone._entries = self._entries
+        return clone
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the index."""
+        return (
+            self._entries * _POSTING_ENTRY_BYTES
+            + len(self._postings) * _TERM_BYTES
+            + len(self._lengths) * _DOCUMENT_LENGTH_BYTES
+        )
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def _term_frequencies(self, doc_data: Dict[str, Any]) -> Dict[str, float]:
+        frequencies: Dict[str, float] = {}
+        for field, weight in self.field_weights.items():
+            for token in tokenize(field_text(doc_data.get(field))):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+        return frequencies
+
+    def _writable_posting(self, term: str) -> Optional[MutableMapping]:
+        posting = self._postings.get(term)
+        if posting is not None and self._owned is not None and term not in self._owned:
+            posting = self._postings[term] = writable_copy(posting)
+            self._owned.add(term)
+        return posting
+
+    def add(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        frequencies = self._term_frequencies(doc_data)
+        if not frequencies:
+            return
+        for term, frequency in frequencies.items():
+            posting = self._writable_posting(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                if self._owned is not None:
+                    self._owned.add(term)
+                self._ngrams.add(term)
+            self._entries += doc_id not in posting
+            posting[doc_id] = frequency
+        length = sum(frequencies.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._term_frequencies(doc_data):
+            posting = self._writable_posting(term)
+            if posting is None or doc_id not in posting:
+                continue
+            del posting[doc_id]
+            self._entries -= 1
+            if not posting:
+                del self._postings[term]
+                self._ngrams.remove(term)
+
+    def _expand(self, text: str, min_similarity: Optional[float], max_expansions: int) -> Dict[str, float]:
+        """Map query text to indexed terms and their weights (1 for exact matches)."""
+        weights: Dict[str, float] = {}
+        for token in dict.fromkeys(tokenize(text)):
+            if token in self._postings:
+                weights[token] = max(weights.get(token, 0.0), 1.0)
+                continue
+            if min_similarity is None or len(token) < NGRAM_SIZE:
+                continue
+            for term, similarity in self._ngrams.similar(token, min_similarity, max_expansions):
+                weights[term] = max(weights.get(term, 0.0), similarity)
+        return weights
+
+    def search(
+        self,
+        text: str,
+        limit: int,
+        accept: Optional[Callable[[str], bool]] = None,
+        min_similarity: Optional[float] = 0.5,
+        max_expansions: int = 3,
+    ) -> Tuple[int, List[Tuple[str, float]]]:
+        """Return (number of matching documents, top ``limit`` (doc id, score) pairs).
+
+        ``accept`` filters candidate ids before ranking. Ties are broken by id.
+        Unknown query terms match up to ``max_expansions`` indexed terms with an
+        n-gram similarity of at least ``min_similarity``; None disables this.
+        """
+        document_count = len(self._lengths)
+        if not document_count:
+            return 0, []
+        average_length = self._total_length / document_count
+        scores: Dict[str, float] = {}
+        for term, weight in self._expand(text, min_similarity, max_expansions).items():
+            posting = self._postings[term]
+            idf = weight * math.log(1.0 + (document_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, frequency in posting.items():
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+        if accept is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if accept(doc_id)}
+        top = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), top
@@ -0,0 +1,201 @@
+"""SQLite persistence for the FirebaseReadOnlyTool snapshot cache.
+
+Cached documents are stored per (scope, collection) together with the
+``lastUpdate`` watermark of the collection, so a new process can answer from
+disk before Firestore has been read. Only the documents are stored: indexes are
+rebuilt by replaying every restored document, and a snapshot listener started
+afterwards still reads the whole collection once to reconcile deletions. The
+saving is the wait for the first answer when no listener can run, not the
+Firestore reads or the indexing work.
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Bump when the tables change; older files are dropped and rebuilt from Firestore.
+_SCHEMA_VERSION = 2
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " scope TEXT NOT NULL, collection TEXT NOT NULL, doc_id TEXT NOT NULL, data TEXT NOT NULL,"
+    " PRIMARY KEY (scope, collection, doc_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS collections ("
+    " scope TEXT NOT NULL, collection TEXT NOT NULL, last_update TEXT, full_load_at REAL NOT NULL,"
+    " fields TEXT, PRIMARY KEY (scope, collection))",
+)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__timestamp__": value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, dict):
+        return {key: _encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(item) for item in value]
+    if hasattr(value, "path") and hasattr(value, "id"):  # DocumentReference is stored as its path
+        return value.path
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):  # GeoPoint
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    return value
+
+
+def _decode_hook(value: Dict[str, Any]) -> Any:
+    if len(value) == 1:
+        if "__timestamp__" in value:
+            return datetime.fromisoformat(value["__timestamp__"])
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+    return value
+
+
+def _encode_fields(fields: Optional[List[str]]) -> Optional[str]:
+    return json.dumps(sorted(fields)) if fields is not None else None
+
+
+def encode_document(doc_data: Dict[str, Any]) -> str:
+    return json.dumps(_encode_value(doc_data), ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def decode_document(payload: str) -> Dict[str, Any]:
+    return json.loads(payload, object_hook=_decode_hook)
+
+
+class SnapshotStore:
+    """Stores cached collections in one SQLite file shared by every process.
+
+    ``scope`` separates caches of different Firestore projects/databases that
+    point at the same file. Each call opens its own connection, so the store can
+    be used from the snapshot listener thread as well as the agent thread.
+    """
+
+    def __init__(self, path: str, scope: str):
+        self.path = path
+        self.scope = scope
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            with conn:
+                if conn.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                    conn.execute("DROP TABLE IF EXISTS documents")
+                    conn.execute("DROP TABLE IF EXISTS collections")
+                    conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def load(
+        self,
+        collection: str,
+        max_age: Optional[float] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Optional[Tuple[Dict[str, Dict[str, Any]], Optional[datetime]]]:
+        """Return (documents, last_update) for ``collection``, or None if absent or too old.
+
+        ``max_age`` is measured from the last full load: incremental updates
+        cannot observe deletions of documents older than the watermark, so a
+        stored copy is only trusted for a bounded time after a full read. A copy
+        saved with a different field projection than ``fields`` is ignored.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT last_update, full_load_at, fields FROM collections WHERE scope = ? AND collection = ?",
+                (self.scope, collection),
+            ).fetchone()
+            if row is None:
+                return None
+            last_update_text, full_load_at, stored_fields = row
+            if max_age is not None and time.time() - full_load_at > max_age:
+                return None
+            if stored_fields != _encode_fields(fields):
+                return None
+            documents = {
+                doc_id: decode_document(data)
+                for doc_id, data in conn.execute(
+                    "SELECT doc_id, data FROM documents WHERE scope = ? AND collection = ?",
+                    (self.scope, collection),
+                )
+            }
+        finally:
+            conn.close()
+        last_update = datetime.fromisoformat(last_update_text) if last_update_text else None
+        return documents, last_update
+
+    def replace(
+        self,
+        collection: str,
+        documents: Dict[str, Dict[str, Any]],
+        last_update: Optional[datetime],
+        fields: Optional[List[str]] = None,
+    ) -> None:
+        """Overwrite the stored copy of ``collection`` with a full load."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM documents WHERE scope = ? AND collection = ?",
+                    (self.scope, collection),
+                )
+                self._write(conn, collection, documents, (), last_update)
+                conn.execute(
+                    "UPDATE collections SET full_load_at = ?, fields = ? WHERE scope = ? AND collection = ?",
+                    (time.time(), _encode_fields(fields), self.scope, collection),
+                )
+        finally:
+            conn.close()
+
+    def apply(
+        self,
+        collection: str,
+        upserts: Dict[str, Dict[str, Any]],
+        removals: Iterable[str],
+        last_update: Optional[datetime],
+    ) -> None:
+        """Write one batch of listener changes."""
+        conn = self._connect()
+        try:
+            with conn:
+                self._write(conn, collection, upserts, removals, last_update)
+        finally:
+            conn.close()
+
+    def _write(
+        self,
+        conn: sqlite3.Connection,
+        collection: str,
+        upserts: Dict[str, Dict[str, Any]],
+        removals: Iterable[str],
+        last_update: Optional[datetime],
+    ) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO documents (scope, collection, doc_id, data) VALUES (?, ?, ?, ?)",
+            (
+                (self.scope, collection, doc_id, encode_document(doc_data))
+                for doc_id, doc_data in upserts.items()
+            ),
+        )
+        conn.executemany(
+            "DELETE FROM documents WHERE scope = ? AND collection = ? AND doc_id = ?",
+            ((self.scope, collection, doc_id) for doc_id in removals),
+        )
+        conn.execute(
+            "INSERT INTO collections (scope, collection, last_update, full_load_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (scope, collection) DO UPDATE SET last_update = excluded.last_update",
+            (self.scope, collection, last_update.isoformat() if last_update else None, time.time()),
+        )
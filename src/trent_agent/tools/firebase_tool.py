@@ -1,14 +1,329 @@
+import asyncio
 import base64
+import functools
+import hashlib
+import heapq
+import inspect
+import itertools
 import json
+import math
 import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Literal, Optional
+from typing import (
+    Any, Awaitable, Callable, Dict, Generator, Hashable, Iterable, Iterator, List, Literal, NamedTuple, Optional,
+    Tuple, Union,
+)
 
 from google.cloud import firestore
 from google.oauth2 import service_account
 from crewai.tools import BaseTool
 from pydantic import BaseModel, Field, PrivateAttr
 
+from .firebase_cache import (
+    MISSING,
+    RANGE_OPERATORS,
+    SUPPORTED_OPERATORS,
+    CacheSnapshot,
+    CompactDocumentStore,
+    EqualityIndex,
+    GroupAggregate,
+    GroupStats,
+    ShardedDict,
+    SortedIndex,
+    aggregate_documents,
+    get_field,
+    is_projected,
+    matches_condition,
+    project_document,
+    value_key,
+)
+from .firebase_search import TextIndex
+from .firebase_snapshot import SnapshotStore, decode_document, encode_document
+from .firebase_vectors import EmbeddingFunction, HashingEmbedder, VectorIndex
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "trent_agent", "firestore_snapshot.sqlite3"
+)
+
+# Characters of Firestore auto-generated document ids, in key order.
+_AUTO_ID_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Firestore accepts at most this many disjunctions in one query: the values of an
+# 'in' or 'array-contains-any' filter, multiplied across such filters.
+_DISJUNCTION_LIMIT = 30
+
+# Collections used within this many seconds are never evicted: one operation
+# (e.g. 'browse' over products and categories) needs all of its collections.
+_EVICTION_GRACE = 60.0
+
+
+@functools.lru_cache(maxsize=4)
+def _load_service_account(encoded_credentials: str) -> Tuple[str, Any]:
+    """Decode the Base64 service-account JSON once per process into (project_id, credentials)."""
+    try:
+        json_credentials_str = base64.b64decode(encoded_credentials).decode("utf-8")
+        service_account_dict = json.loads(json_credentials_str)
+    except (base64.binascii.Error, json.JSONDecodeError) as exc:
+        raise ValueError(
+            "Failed to decode GOOGLE_APPLICATION_CREDENTIALS_JSON; ensure it is a "
+            "valid Base64-encoded JSON string."
+        ) from exc
+
+    try:
+        credentials_obj = service_account.Credentials.from_service_account_info(
+            service_account_dict
+        )
+    except Exception as exc:  # pragma: no cover - defensive
+        raise ValueError(f"Failed to construct service account credentials: {exc}")
+
+    project_id = service_account_dict.get("project_id")
+    if not project_id:
+        raise ValueError("Service account JSON must include 'project_id'.")
+    return project_id, credentials_obj
+
+
+class _SingleFlight:
+    """Coalesces concurrent identical fetches: one caller runs, the others share its outcome."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.flights: Dict[Hashable, Future] = {}
+
+    def join(self, key: Hashable) -> Tuple[Future, bool]:
+        """Return (the future of ``key``'s fetch, whether the caller must run it)."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self.flights[key] = Future()
+            return flight, True
+
+    def finish(self, key: Hashable, flight: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def run(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        flight, leader = self.join(key)
+        if not leader:
+            return flight.result()
+        try:
+            result = fetch()
+        except BaseException as exc:
+            self.finish(key, flight, error=exc)
+            raise
+        self.finish(key, flight, result)
+        return result
+
+
+class _SharedCache:
+    """Collection caches shared by every attached tool with the same cache settings."""
+
+    def __init__(self, snapshot_store: Optional[SnapshotStore]):
+        self.collection_cache: Dict[str, Dict[str, Any]] = {}
+        self.snapshot_store = snapshot_store
+        # Loads and remote queries in progress, shared like the caches they fill
+        self.flights = _SingleFlight()
+        # id(tool) -> weak reference; the number of entries is the reference count
+        self.tools: Dict[int, "weakref.ReferenceType[FirebaseReadOnlyTool]"] = {}
+
+    def any_tool(self) -> Optional["FirebaseReadOnlyTool"]:
+        for tool_ref in list(self.tools.values()):
+            tool = tool_ref()
+            if tool is not None:
+                return tool
+        return None
+
+
+class _SharedClient:
+    """One Firestore client (one gRPC channel) per project and database.
+
+    AsyncClient channels are bound to the event loop that opened them, so
+    async calls use one AsyncClient per running loop, created on first use.
+    """
+
+    def __init__(self, client: Any, async_client_factory: Optional[Callable[[], Any]] = None):
+        self.client = client
+        self.caches: Dict[Hashable, _SharedCache] = {}
+        self.async_client_factory = async_client_factory
+        self.async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+_shared_clients: Dict[Tuple[str, str], _SharedClient] = {}
+_shared_clients_lock = threading.Lock()
+
+# Async fetches that finish on their own when the caller that started them is cancelled.
+_background_fetches: set = set()
+
+# Distinguishes cache entries of the same collection, e.g. before and after an eviction.
+_cache_generations = itertools.count()
+
+
+class _ResponseCache:
+    """Serialized tool responses by call, evicted least recently used first.
+
+    Keys carry the versions of the caches a response was built from, so
+    entries of older versions are never hit again and simply age out.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.responses: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self.lock:
+            response = self.responses.get(key)
+            if response is not None:
+                self.responses.move_to_end(key)
+            return response
+
+    def put(self, key: Hashable, response: str) -> None:
+        if len(response) > self.max_size:
+            return
+        with self.lock:
+            previous = self.responses.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.responses[key] = response
+            self.size += len(response)
+            while self.size > self.max_size:
+                _, evicted = self.responses.popitem(last=False)
+                self.size -= len(evicted)
+
+
+def _release_shared_client(client_key: Tuple[str, str], cache_key: Hashable, tool_id: int) -> None:
+    """Detach one tool; the last user of a cache stops its listeners, the last user of a client closes it."""
+    listeners: List[Any] = []
+    client_to_close = None
+    async_clients: List[Tuple[asyncio.AbstractEventLoop, Any]] = []
+    with _shared_clients_lock:
+        shared_client = _shared_clients.get(client_key)
+        if shared_client is None:
+            return
+        shared_cache = shared_client.caches.get(cache_key)
+        if shared_cache is not None:
+            shared_cache.tools.pop(tool_id, None)
+            if not shared_cache.tools:
+                del shared_client.caches[cache_key]
+                for entry in shared_cache.collection_cache.values():
+                    if entry.get("unsubscribe") is not None:
+                        listeners.append(entry["unsubscribe"])
+                        entry["unsubscribe"] = None
+        if not shared_client.caches:
+            del _shared_clients[client_key]
+            client_to_close = shared_client.client
+            async_clients = list(shared_client.async_clients.items())
+            shared_client.async_clients.clear()
+
+    for listener in listeners:
+        try:
+            listener.unsubscribe()
+        except Exception:
+            pass
+    if client_to_close is not None:
+        _close_client(client_to_close)
+        for loop, async_client in async_clients:
+            _close_client(async_client, loop)
+
+
+def _close_client(client: Any, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """Close a Firestore client's HTTP session and its gRPC channel, if it opened one.
+
+    ``client.close()`` only releases the HTTP session. An AsyncClient's channel
+    closes with a coroutine, which must run on ``loop``, the loop it was opened on.
+    """
+    try:
+        if hasattr(client, "close"):
+            client.close()
+        api = getattr(client, "_firestore_api_internal", None)
+        closing = api.transport.close() if api is not None else None
+        if not inspect.isawaitable(closing):
+            return
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(closing, loop)
+        elif loop is not None and not loop.is_closed():
+            loop.run_until_complete(closing)
+        elif hasattr(closing, "close"):
+            # The loop is gone and its channel with it
+            closing.close()
+    except Exception:
+        pass
+
+
+class _Page(NamedTuple):
+    """Resolved pagination of one query call."""
+
+    order_field: Optional[str]  # None orders by document id only
+    descending: bool
+    after: Optional[Tuple[Any, str]]  # (order value, document id) the previous page ended with
+    offset: int
+    limit: int
+    fingerprint: str
+
+
+class _RemoteQuery(NamedTuple):
+    """One page of a query planned for Firestore, possibly split into several queries."""
+
+    queries: List[Any]  # with the cursor, limit and projection applied
+    filtered_queries: List[Any]  # conditions and order only, for counting all matches
+    disjoint: bool
+    fetch: int  # documents read per query
+    key: Hashable  # identical plans share one fetch
+
+
+class _Step(NamedTuple):
+    """One Firestore call of an operation: ``call`` for the sync path, ``acall`` for the async one."""
+
+    call: Callable[..., Any]
+    acall: Callable[..., Awaitable[Any]]
+    args: Tuple[Any, ...]
+
+
+# An operation: yields its _Steps, receives their results and returns the response.
+_Steps = Generator[_Step, Any, str]
+
+
+def _query_fingerprint(
+    collection: str,
+    conditions: List["QueryCondition"],
+    order_field: Optional[str],
+    descending: bool,
+) -> str:
+    payload = json.dumps(
+        [collection, [[c.field, c.operator, c.value] for c in conditions], order_field, descending],
+        default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _encode_page_token(page: _Page, last_id: str, last_value: Any) -> str:
+    payload = encode_document({"q": page.fingerprint, "id": last_id, "v": last_value})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_page_token(token: str, fingerprint: str) -> Tuple[Any, str]:
+    """Return the (order value, document id) a continuation token points after."""
+    try:
+        payload = decode_document(base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8"))
+        last_id = payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("start_after is not a valid continuation token.")
+    if payload.get("q") != fingerprint:
+        raise ValueError("start_after token was issued for a different query or ordering.")
+    return payload.get("v"), last_id
+
 
 class QueryCondition(BaseModel):
     field: str
@@ -17,18 +332,81 @@ class QueryCondition(BaseModel):
 
 
 class FirebaseToolInput(BaseModel):
-    operation: Literal["read", "query"] = Field(
-        description="Operation to perform. Only 'read' and 'query' are supported."
+    operation: Literal[
+        "read",
+        "read_many",
+        "query",
+        "search",
+        "semantic_search",
+        "similar",
+        "count",
+        "distinct",
+        "group_by",
+        "browse",
+    ] = Field(
+        description=(
+            "Operation to perform: 'read' one document, 'read_many' documents by document_ids, "
+            "'query' with conditions, "
+            "'search' products by keywords ranked by relevance, 'semantic_search' products "
+            "by meaning of search_text or find products 'similar' to document_id (both only "
+            "when the tool has embedding_fields), 'count' "
+            "matching documents, list the 'distinct' values of group_by_field, "
+            "'group_by' group_by_field with per-group counts, or 'browse' every category "
+            "with its product count and top products in one call."
+        )
     )
     collection: str = Field(description="Name of the collection to access")
     document_id: Optional[str] = Field(
         None,
-        description="Document ID. Required for 'read' operations."
+        description="Document ID. Required for 'read' and 'similar' operations."
+    )
+    document_ids: Optional[List[str]] = Field(
+        None,
+        description="Document IDs to fetch together. Required for 'read_many' operations."
     )
     query_conditions: Optional[List[QueryCondition]] = Field(
         None,
         description="Conditions to apply when performing a query operation."
     )
+    order_by: Optional[str] = Field(
+        None,
+        description="Field to sort 'query' results by. Defaults to the inequality field, then document ID."
+    )
+    order_direction: Literal["asc", "desc"] = Field(
+        default="asc",
+        description="Sort direction of 'query' results."
+    )
+    offset: Optional[int] = Field(
+        None,
+        description="Number of 'query' results to skip (after start_after, if given)."
+    )
+    start_after: Optional[str] = Field(
+        None,
+        description="Continuation token (next_page_token of the previous page) to fetch the next page."
+    )
+    group_by_field: Optional[str] = Field(
+        None,
+        description="Field whose values are listed by 'distinct' or grouped by 'group_by' (e.g. categoryId)."
+    )
+    aggregate_field: Optional[str] = Field(
+        None,
+        description="Numeric field summarized per group by 'group_by' with count/min/max/avg (e.g. price)."
+    )
+    search_text: Optional[str] = Field(
+        None,
+        description=(
+            "Keywords to look for in product titles, descriptions and tags. Required for "
+            "'search' and 'semantic_search'."
+        )
+    )
+    limit: Optional[int] = Field(
+        None,
+        description=(
+            "Maximum number of results to return. 'query' returns 10 in summaries and "
+            "max_page_size documents with return_objects by default; search operations return 20. "
+            "For 'browse', the number of products listed per category (default 5)."
+        )
+    )
     return_objects: bool = Field(
         default=False,
         description="When true, return raw JSON documents instead of a human-readable summary."
@@ -40,20 +418,198 @@ class FirebaseReadOnlyTool(BaseTool):
 
     name: str = "Firebase Read-Only Tool"
     description: str = (
-        "Read documents from the 'products' collection in Firestore 'trent' database. "
-        "Only returns 'categoryId' and 'title' fields. "
+        "Read documents from the 'products' and 'categories' collections in Firestore 'trent' database. "
+        "Product results only return 'categoryId' and 'title' fields. "
+        "Use 'search' with search_text to get the products best matching keywords. "
         "Supports real-time snapshot caching to avoid re-reading full collections."
     )
     args_schema: type[BaseModel] = FirebaseToolInput
+    collections: List[str] = Field(
+        default_factory=lambda: ["products", "categories"],
+        description="Collections the tool may read. Each is cached on first use with its own listener.",
+    )
+    indexed_fields: List[str] = Field(
+        default_factory=lambda: ["categoryId"],
+        description="Document fields with an equality index on the snapshot cache.",
+    )
+    range_indexed_fields: List[str] = Field(
+        default_factory=lambda: ["price", "lastUpdate"],
+        description="Numeric or timestamp fields with a sorted range index on the snapshot cache.",
+    )
+    projections: Dict[str, List[str]] = Field(
+        default_factory=lambda: {
+            "products": ["title", "categoryId", "price", "lastUpdate", "description", "tags"]
+        },
+        description=(
+            "Fields fetched with select() and kept in the cache, per collection. Indexed "
+            "fields are always included; collections without an entry are read whole."
+        ),
+    )
+    output_fields: Dict[str, List[str]] = Field(
+        default_factory=lambda: {"products": ["title", "categoryId"]},
+        description=(
+            "Fields returned for each document, per collection; collections without an "
+            "entry return every cached field."
+        ),
+    )
+    max_page_size: int = Field(
+        default=100,
+        description="Most documents one 'query' call returns; larger results come back in pages.",
+    )
+    search_fields: Dict[str, float] = Field(
+        default_factory=lambda: {"title": 3.0, "tags": 2.0, "description": 1.0},
+        description=(
+            "Text fields indexed for the 'search' operation and the weight of a match in "
+            "each. An empty mapping disables the search index."
+        ),
+    )
+    search_limit: int = Field(default=20, description="Default number of results of the search operations.")
+    search_min_similarity: Optional[float] = Field(
+        default=0.5,
+        description=(
+            "Minimum character-trigram similarity for a misspelt search term to match an "
+            "indexed word. None disables fuzzy matching."
+        ),
+    )
+    aggregate_fields: Dict[str, List[str]] = Field(
+        default_factory=lambda: {"categoryId": ["price"]},
+        description=(
+            "Fields with incrementally maintained group counts on the snapshot cache, "
+            "each with the numeric fields summarized per group."
+        ),
+    )
+    browse_group_field: str = Field(
+        default="categoryId",
+        description=(
+            "Product field 'browse' groups by. Category documents are matched on the same "
+            "field, or on their document id if they lack it."
+        ),
+    )
+    browse_order_field: str = Field(
+        default="lastUpdate",
+        description="Field ranking the products 'browse' lists per category, highest first.",
+    )
+    browse_limit: int = Field(default=5, description="Products listed per category by 'browse' by default.")
+    category_collection: Optional[str] = Field(
+        default="categories",
+        description="Collection holding the category metadata shown by 'browse'. None shows ids only.",
+    )
+    embedding_fields: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Text fields embedded for 'semantic_search' and 'similar', e.g. "
+            "['title', 'tags', 'description']. Empty (the default) disables the embedding "
+            "index. Every load, listener batch and snapshot restore embeds the documents "
+            "it adds (vectors are not persisted), which dominates cold start time with the "
+            "default embedder."
+        ),
+    )
+    embedding_function: Optional[EmbeddingFunction] = Field(
+        default=None,
+        description=(
+            "Maps a list of texts to a (len(texts), dim) array of embeddings. Defaults to "
+            "an offline hashing embedder over words and character trigrams."
+        ),
+    )
+    cache_backend: Literal["dict", "compact"] = Field(
+        default="dict",
+        description=(
+            "Storage for cached documents: 'dict' keeps one dict per document, 'compact' "
+            "uses a columnar store with a shared string table (much smaller, slower reads)."
+        ),
+    )
+    cache_max_bytes: Optional[int] = Field(
+        default=512 * 1024 * 1024,
+        description=(
+            "Approximate memory budget of the cached collections, indexes included. When it "
+            "is exceeded, the least recently used collections idle for over a minute stop "
+            "their listeners and are dropped until next used. None disables the limit."
+        ),
+    )
+    database: str = Field(default="trent", description="Firestore database to read from.")
+    snapshot_path: Optional[str] = Field(
+        default_factory=lambda: os.getenv("TRENT_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH) or None,
+        description=(
+            "SQLite file used to persist cached collections between processes. Only "
+            "documents are stored: a restore re-indexes every document in the first call "
+            "that uses the collection, and a snapshot listener still reads the whole "
+            "collection once, so it mainly helps when listeners are unavailable. "
+            "Set TRENT_SNAPSHOT_PATH to an empty string to disable."
+        ),
+    )
+    snapshot_max_age: float = Field(
+        default=24 * 60 * 60,
+        description=(
+            "Seconds since the last full load after which a persisted snapshot is "
+            "discarded, and after which a cache kept current without a snapshot listener "
+            "is fully reloaded, bounding how long deletions can go unnoticed."
+        ),
+    )
+    delta_sync_interval: float = Field(
+        default=30.0,
+        description=(
+            "Minimum seconds between incremental 'lastUpdate >= watermark' refreshes "
+            "of a cache whose snapshot listener is unavailable."
+        ),
+    )
+    listener_retry_interval: float = Field(
+        default=300.0,
+        description="Seconds to wait before re-subscribing a snapshot listener that failed.",
+    )
+    load_workers: int = Field(
+        default=8,
+        description=(
+            "Threads reading key ranges of a collection in parallel when it has to be "
+            "loaded without a snapshot listener, and running the parts of an 'in' or "
+            "'array-contains-any' query split into Firestore-sized chunks. 1 reads serially."
+        ),
+    )
+    snapshot_wait_timeout: float = Field(
+        default=10.0,
+        description=(
+            "Seconds a query waits for a new listener's first snapshot. On timeout the "
+            "query is answered by Firestore directly while the listener keeps loading."
+        ),
+    )
+    read_max_staleness: float = Field(
+        default=30.0,
+        description=(
+            "Seconds a cached document may be served by read operations while no live "
+            "snapshot listener keeps it current, counted from the last sync or fetch."
+        ),
+    )
+    response_cache_size: int = Field(
+        default=16 * 1024 * 1024,
+        description=(
+            "Characters of serialized responses memoized for repeated calls. Responses are "
+            "reused until a listener applies a change to the collection. 0 disables."
+        ),
+    )
 
     _db: Any = PrivateAttr(default=None)
+    _shared_client: Optional[_SharedClient] = PrivateAttr(default=None)
     _collection_cache: Dict[str, Dict[str, Any]] = PrivateAttr(default_factory=dict)
+    _snapshot_store: Optional[SnapshotStore] = PrivateAttr(default=None)
+    _shared_cache: Optional[_SharedCache] = PrivateAttr(default=None)
+    _detach: Any = PrivateAttr(default=None)
+    _response_cache: Optional[_ResponseCache] = PrivateAttr(default=None)
+    _flights: _SingleFlight = PrivateAttr(default_factory=_SingleFlight)
 
-    def __init__(self):
-        super().__init__()
-        self._collection_cache = {}
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.response_cache_size > 0:
+            self._response_cache = _ResponseCache(self.response_cache_size)
         self._initialize_firestore_client()
 
+    def close(self) -> None:
+        """Detach from the shared client and caches.
+
+        Tools also detach automatically when garbage collected. Listeners stop
+        once the last tool sharing their cache detaches.
+        """
+        if self._detach is not None:
+            self._detach()
+
     # ------------------------------------------------------------------
     # Firestore bootstrap & helpers
     # ------------------------------------------------------------------
@@ -65,38 +621,106 @@ class FirebaseReadOnlyTool(BaseTool):
                 "to a Base64 encoded service-account JSON."
             )
 
-        try:
-            json_credentials_str = base64.b64decode(encoded_credentials).decode("utf-8")
-            service_account_dict = json.loads(json_credentials_str)
-        except (base64.binascii.Error, json.JSONDecodeError) as exc:
-            raise ValueError(
-                "Failed to decode GOOGLE_APPLICATION_CREDENTIALS_JSON; ensure it is a "
-                "valid Base64-encoded JSON string."
-            ) from exc
+        project_id, credentials_obj = _load_service_account(encoded_credentials)
 
+        # Use 'trent' database instead of default
+        self._attach_shared_client(
+            project_id,
+            lambda: firestore.Client(project=project_id, credentials=credentials_obj, database=self.database),
+            lambda: firestore.AsyncClient(project=project_id, credentials=credentials_obj, database=self.database),
+        )
+
+    def _cache_settings_key(self) -> Hashable:
+        """Settings that shape cache contents; only tools that agree on them share a cache."""
+        return (
+            tuple(self.indexed_fields),
+            tuple(self.range_indexed_fields),
+            tuple(sorted((collection, tuple(fields)) for collection, fields in self.projections.items())),
+            tuple(sorted(self.search_fields.items())),
+            tuple(self.embedding_fields),
+            self.embedding_function,
+            tuple(sorted((field, tuple(numbers)) for field, numbers in self.aggregate_fields.items())),
+            self.browse_group_field,
+            self.browse_order_field,
+            self.cache_backend,
+            self.snapshot_path,
+            self.snapshot_max_age,
+        )
+
+    def _attach_shared_client(
+        self,
+        project_id: str,
+        client_factory: Callable[[], Any],
+        async_client_factory: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        """Use the process-wide client for (project, database), creating it on first use.
+
+        Tools with the same cache settings also share collection caches, and so
+        one snapshot listener per collection.
+        """
+        client_key = (project_id, self.database)
+        cache_key = self._cache_settings_key()
+        with _shared_clients_lock:
+            shared_client = _shared_clients.get(client_key)
+            if shared_client is None:
+                shared_client = _shared_clients[client_key] = _SharedClient(client_factory(), async_client_factory)
+            elif shared_client.async_client_factory is None:
+                shared_client.async_client_factory = async_client_factory
+            shared_cache = shared_client.caches.get(cache_key)
+            if shared_cache is None:
+                shared_cache = shared_client.caches[cache_key] = _SharedCache(
+                    self._open_snapshot_store(project_id)
+                )
+            shared_cache.tools[id(self)] = weakref.ref(self)
+
+        self._db = shared_client.client
+        self._shared_client = shared_client
+        self._collection_cache = shared_cache.collection_cache
+        self._snapshot_store = shared_cache.snapshot_store
+        self._shared_cache = shared_cache
+        self._flights = shared_cache.flights
+        self._detach = weakref.finalize(self, _release_shared_client, client_key, cache_key, id(self))
+
+    def _open_snapshot_store(self, project_id: str) -> Optional[SnapshotStore]:
+        if not self.snapshot_path:
+            return None
+        scope = f"{project_id}/{self.database}"
         try:
-            credentials_obj = service_account.Credentials.from_service_account_info(
-                service_account_dict
-            )
-        except Exception as exc:  # pragma: no cover - defensive
-            raise ValueError(f"Failed to construct service account credentials: {exc}")
+            return SnapshotStore(self.snapshot_path, scope)
+        except (sqlite3.Error, OSError):
+            # Persistence only speeds up start-up; run without it if the file is unusable
+            return None
 
-        project_id = service_account_dict.get("project_id")
-        if not project_id:
-            raise ValueError("Service account JSON must include 'project_id'.")
+    def _check_collection(self, collection: str) -> Optional[str]:
+        """Error message for a collection outside the allow-list, else None."""
+        if collection in self.collections:
+            return None
+        return (
+            f"Error: Collection '{collection}' is not supported. "
+            f"Available collections: {', '.join(self.collections)}. Requested: '{collection}'"
+        )
 
-        # Use 'trent' database instead of default
-        self._db = firestore.Client(project=project_id, credentials=credentials_obj, database='trent')
-
-    def _filter_product_fields(self, doc_data: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
-        """Filter document to only include categoryId and title fields."""
-        filtered = {
-            "_id": doc_id,
-            "title": doc_data.get("title", ""),
-            "categoryId": doc_data.get("categoryId", "")
-        }
+    def _filter_fields(self, collection: str, doc_data: Dict[str, Any], doc_id: str) -> Dict[str, Any]:
+        """Filter document to the collection's output fields (categoryId and title for products)."""
+        fields = self.output_fields.get(collection)
+        if fields is None:
+            return {"_id": doc_id, **doc_data}
+        filtered = {"_id": doc_id}
+        for field in fields:
+            filtered[field] = doc_data.get(field, "")
         return filtered
 
+    def _summarize_fields(self, collection: str, doc_data: Dict[str, Any], exclude: Iterable[str] = ()) -> str:
+        """'Field: value' pairs of the output fields, for text responses."""
+        fields = self.output_fields.get(collection)
+        if fields is None:
+            fields = list(doc_data)
+        return ", ".join(
+            f"{field[:1].upper()}{field[1:]}: {doc_data.get(field, f'No {field}')}"
+            for field in fields
+            if field not in exclude
+        )
+
     def _normalize_timestamp(self, value: Any) -> Optional[datetime]:
         if value is None:
             return None
@@ -113,25 +737,129 @@ class FirebaseReadOnlyTool(BaseTool):
                 return None
         return None
 
-    def _update_cache_entry(
+    def _projected_fields(self, collection: str) -> Optional[List[str]]:
+        fields = self.projections.get(collection)
+        if fields is None:
+            return None
+        return list(
+            dict.fromkeys(
+                [
+                    *fields,
+                    *self.indexed_fields,
+                    *self.range_indexed_fields,
+                    *self.search_fields,
+                    *self.embedding_fields,
+                    *self.aggregate_fields,
+                    *(field for numbers in self.aggregate_fields.values() for field in numbers),
+                    self.browse_group_field,
+                    self.browse_order_field,
+                    "lastUpdate",
+                ]
+            )
+        )
+
+    def _select(self, query: Any, collection: str) -> Any:
+        """Apply the collection's projection to a Firestore query."""
+        fields = self._projected_fields(collection)
+        return query.select(fields) if fields is not None else query
+
+    def _new_cache_entry(self, collection: str) -> Dict[str, Any]:
+        search_indexes: Dict[str, Any] = {}
+        if self.search_fields:
+            search_indexes["text"] = TextIndex(self.search_fields)
+        if self.embedding_fields:
+            search_indexes["vector"] = VectorIndex(
+                self.embedding_fields, self.embedding_function or HashingEmbedder()
+            )
+        return {
+            # Current CacheSnapshot; replaced (never modified) by _apply_cache_changes
+            "snapshot": CacheSnapshot(
+                CompactDocumentStore(text_fields=("title", "description"))
+                if self.cache_backend == "compact"
+                else ShardedDict(),
+                {field: EqualityIndex(field) for field in self.indexed_fields},
+                {field: SortedIndex(field) for field in self.range_indexed_fields},
+                search_indexes,
+                {
+                    field: GroupAggregate(
+                        field, numbers, self.browse_order_field if field == self.browse_group_field else None
+                    )
+                    for field, numbers in {self.browse_group_field: [], **self.aggregate_fields}.items()
+                },
+            ),
+            # Serializes writers; readers never take it
+            "write_lock": threading.Lock(),
+            "generation": next(_cache_generations),
+            "fields": self._projected_fields(collection),
+            "last_update": None,
+            "unsubscribe": None,
+            "ready": False,
+            "listener_error": False,
+            "listener_failed_at": None,
+            # Whether the current listener delivered its first (complete) snapshot
+            "listener_synced": False,
+            "synced_at": None,
+            # Monotonic time the cache last matched a complete read of the collection
+            "full_sync_at": None,
+            "last_used": time.monotonic(),
+            # doc id -> monotonic time a read operation last fetched it (or found it deleted)
+            "read_at": {},
+            # Whether the on-disk snapshot was loaded, or found unusable, for this entry
+            "restore_attempted": False,
+            # Set once the cache holds the whole collection (first snapshot, full load or restore)
+            "ready_event": threading.Event(),
+        }
+
+    def _get_cache_entry(self, collection: str) -> Dict[str, Any]:
+        cache_entry = self._collection_cache.get(collection)
+        if cache_entry is None:
+            cache_entry = self._collection_cache.setdefault(collection, self._new_cache_entry(collection))
+        return cache_entry
+
+    def _document_change(self, doc: Any) -> Tuple[str, Dict[str, Any], Any]:
+        """(doc id, data, lastUpdate) for a Firestore DocumentSnapshot.
+
+        Only the document's own ``lastUpdate`` feeds the watermark: server
+        update times can run ahead of client-written values, and a watermark
+        past them would make ``lastUpdate >= watermark`` skip those documents.
+        """
+        doc_data = doc.to_dict()
+        return doc.id, doc_data, doc_data.get("lastUpdate")
+
+    def _apply_cache_changes(
         self,
         collection: str,
-        doc_id: str,
-        doc_data: Dict[str, Any],
-        last_update_value: Any,
-    ) -> None:
-        cache_entry = self._collection_cache.setdefault(
-            collection,
-            {
-                "documents": {},
-                "last_update": None,
-                "unsubscribe": None,
-                "ready": False,
-            },
-        )
+        changes: Any,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Publish a batch of (doc id, data or None to remove, lastUpdate) changes as one new version.
 
-        cache_entry["documents"][doc_id] = doc_data
+        The current snapshot is copied on write and swapped in atomically, so a
+        reader holding the previous version keeps a consistent view. Returns the
+        final stored (projected) state per document, None for removals.
+        """
+        changes = list(changes)
+        if not changes:
+            return {}
+        cache_entry = self._get_cache_entry(collection)
+        fields = cache_entry.get("fields")
+        stored: Dict[str, Optional[Dict[str, Any]]] = {}
+        with cache_entry["write_lock"]:
+            snapshot = cache_entry["snapshot"].evolve()
+            for doc_id, doc_data, last_update_value in changes:
+                if doc_data is None:
+                    snapshot.discard(doc_id)
+                    stored[doc_id] = None
+                    continue
+                if fields is not None:
+                    doc_data = project_document(doc_data, fields)
+                snapshot.put(doc_id, doc_data)
+                stored[doc_id] = doc_data
+                self._advance_watermark(cache_entry, last_update_value)
+            snapshot.seal()
+            cache_entry["snapshot"] = snapshot
+        return stored
 
+    def _advance_watermark(self, cache_entry: Dict[str, Any], last_update_value: Any) -> None:
         normalized_last_update = self._normalize_timestamp(last_update_value)
         if normalized_last_update is None:
             return
@@ -143,329 +871,1840 @@ class FirebaseReadOnlyTool(BaseTool):
         except TypeError:
             cache_entry["last_update"] = normalized_last_update
 
-    def _ensure_collection_listener(self, collection: str) -> Dict[str, Any]:
-        collection_ref = self._db.collection(collection)
-        cache_entry = self._collection_cache.setdefault(
+    def _restore_snapshot(self, collection: str, cache_entry: Dict[str, Any]) -> None:
+        """Populate a cache entry that is not ready from the on-disk snapshot, if one is usable.
+
+        Documents read operations fetched (or found deleted) since the entry
+        was created are newer than the file and keep their state. Every
+        restored document goes through all indexes in this call; index state
+        is not persisted.
+        """
+        cache_entry["restore_attempted"] = True
+        if self._snapshot_store is None:
+            return
+        try:
+            restored = self._snapshot_store.load(
+                collection, max_age=self.snapshot_max_age, fields=cache_entry.get("fields")
+            )
+        except (sqlite3.Error, ValueError):
+            return
+        if restored is None:
+            return
+
+        documents, last_update = restored
+        read_at = cache_entry["read_at"]
+        self._apply_cache_changes(
             collection,
-            {
-                "documents": {},
-                "last_update": None,
-                "unsubscribe": None,
-                "ready": False,
-                "listener_error": False,
-            },
+            (
+                (doc_id, doc_data, doc_data.get("lastUpdate"))
+                for doc_id, doc_data in documents.items()
+                if doc_id not in read_at
+            ),
         )
+        if last_update is not None:
+            cache_entry["last_update"] = last_update
+        self._mark_ready(cache_entry)
+
+    def _persist_snapshot(
+        self,
+        collection: str,
+        cache_entry: Dict[str, Any],
+        stored: Optional[Dict[str, Optional[Dict[str, Any]]]] = None,
+    ) -> None:
+        """Write the whole cache (``stored`` is None) or a batch from _apply_cache_changes to disk."""
+        if self._snapshot_store is None:
+            return
+        try:
+            if stored is None:
+                # A published snapshot never changes, so it can be written without copying
+                self._snapshot_store.replace(
+                    collection,
+                    cache_entry["snapshot"].documents,
+                    cache_entry.get("last_update"),
+                    cache_entry.get("fields"),
+                )
+            elif stored:
+                self._snapshot_store.apply(
+                    collection,
+                    {doc_id: doc_data for doc_id, doc_data in stored.items() if doc_data is not None},
+                    [doc_id for doc_id, doc_data in stored.items() if doc_data is None],
+                    cache_entry.get("last_update"),
+                )
+        except Exception:
+            # Persistence is best effort; the in-memory cache stays authoritative
+            pass
+
+    def _mark_ready(self, cache_entry: Dict[str, Any]) -> None:
+        cache_entry["ready"] = True
+        cache_entry["ready_event"].set()
+
+    def _changes_since(self, collection_ref: Any, watermark: datetime) -> Any:
+        # >= rather than >: documents written later with the same lastUpdate are re-read, not missed
+        return collection_ref.where("lastUpdate", ">=", watermark)
+
+    def _mark_listener_failed(self, cache_entry: Dict[str, Any]) -> None:
+        cache_entry["listener_error"] = True
+        cache_entry["listener_failed_at"] = time.monotonic()
+
+    def _delta_sync(self, collection: str, cache_entry: Dict[str, Any]) -> None:
+        """Refresh a ready cache with only the documents changed since its watermark.
+
+        Used while no snapshot listener is delivering changes. Runs at most once
+        per ``delta_sync_interval``. Deletions and
+        documents without ``lastUpdate`` are not visible to the watermark query,
+        so the whole collection is reloaded once the last complete read is
+        ``snapshot_max_age`` seconds old.
+        """
+        synced_at = cache_entry.get("synced_at")
+        if synced_at is not None and time.monotonic() - synced_at < self.delta_sync_interval:
+            return
+
+        full_sync_at = cache_entry.get("full_sync_at")
+        if full_sync_at is None or time.monotonic() - full_sync_at >= self.snapshot_max_age:
+            try:
+                self._full_load(collection)
+            except Exception:
+                # Keep serving the cache as it is; the next call retries
+                return
+            cache_entry["synced_at"] = time.monotonic()
+            self._persist_snapshot(collection, cache_entry)
+            return
+
+        watermark = cache_entry.get("last_update")
+        if watermark is None:
+            return
+
+        collection_ref = self._db.collection(collection)
+        try:
+            changes = [
+                self._document_change(doc)
+                for doc in self._select(self._changes_since(collection_ref, watermark), collection).stream()
+            ]
+        except Exception:
+            # Keep serving the cache as it is; the next call retries
+            return
+        stored = self._apply_cache_changes(collection, changes)
+        cache_entry["synced_at"] = time.monotonic()
+        self._persist_snapshot(collection, cache_entry, stored)
+
+    def _apply_snapshot(self, collection: str, collection_snapshot: Any, changes: Any) -> None:
+        """
+        Apply one collection_ref.on_snapshot() delivery to the cache.
+        Handles document changes: ADDED, MODIFIED, REMOVED.
+        Similar to JS Firebase: snapshot.docChanges().forEach((change) => { ... })
+        """
+        entry = self._get_cache_entry(collection)
+
+        # Check if this is the listener's initial snapshot
+        is_initial_snapshot = not entry.get("listener_synced", False)
+
+        if is_initial_snapshot:
+            # Initial snapshot - it holds the whole collection: reconcile the cache with it as a
+            # single new version, dropping documents deleted since a restored or polled copy was read
+            self._reconcile(collection, [self._document_change(doc) for doc in collection_snapshot])
+            entry["listener_synced"] = True
+            self._mark_ready(entry)
+            self._persist_snapshot(collection, entry)
+        else:
+            # Subsequent snapshots - only process changes (on_snapshot only fires on changes)
+            batch: List[Tuple[str, Optional[Dict[str, Any]], Any]] = []
+            if changes:
+                for change in changes:
+                    doc = change.document
+                    change_type = change.type.name  # ADDED, MODIFIED, or REMOVED
+
+                    if change_type == "REMOVED":
+                        # Handle removed documents (drops them from the indexes too)
+                        batch.append((doc.id, None, None))
+                    elif change_type in ("ADDED", "MODIFIED"):
+                        # Handle new and modified documents
+                        batch.append(self._document_change(doc))
+                # The whole delivery becomes one new cache version
+                stored = self._apply_cache_changes(collection, batch)
+                self._persist_snapshot(collection, entry, stored)
+            # If no changes, do nothing - cache is already up to date
+
+    def _load_queries(self, collection: str) -> List[Any]:
+        """Queries that together read the whole collection, one per key range.
+
+        Uses Firestore partition cursors when available and otherwise splits the
+        auto-ID key space evenly by first character. Either way the ranges are
+        contiguous, so custom ids are still covered, only less evenly.
+        """
+        collection_ref = self._db.collection(collection)
+        partition_count = self.load_workers * 2
+        if self.load_workers <= 1:
+            return [collection_ref]
+        try:
+            partitions = list(self._db.collection_group(collection).get_partitions(partition_count))
+            if len(partitions) > 1:
+                return [partition.query() for partition in partitions]
+        except Exception:
+            # Partition queries need extra permissions and are not supported everywhere
+            pass
+
+        boundaries = [
+            _AUTO_ID_ALPHABET[len(_AUTO_ID_ALPHABET) * index // partition_count]
+            for index in range(1, partition_count)
+        ]
+        ordered = collection_ref.order_by("__name__")
+        queries = [ordered.end_before({"__name__": boundaries[0]})]
+        for start, end in zip(boundaries, boundaries[1:]):
+            queries.append(ordered.start_at({"__name__": start}).end_before({"__name__": end}))
+        queries.append(ordered.start_at({"__name__": boundaries[-1]}))
+        return queries
+
+    def _load_range(self, collection: str, query: Any) -> List[Tuple[str, Dict[str, Any], Any]]:
+        prefix = f"{collection}/"
+        return [
+            self._document_change(doc)
+            for doc in self._select(query, collection).stream()
+            # Partition queries span the collection group; keep only the top-level collection
+            if getattr(getattr(doc, "reference", None), "path", prefix + doc.id) == prefix + doc.id
+        ]
+
+    def _full_load(self, collection: str) -> None:
+        """Read the whole collection into the cache as one new version.
+
+        Key ranges are read concurrently on up to ``load_workers`` threads, so
+        a large collection is not limited by the throughput of one stream.
+        Cached documents Firestore no longer returns are dropped. Raises if any
+        range fails, leaving the cache untouched.
+        """
+        queries = self._load_queries(collection)
+        if len(queries) == 1:
+            changes = self._load_range(collection, queries[0])
+        else:
+            with ThreadPoolExecutor(
+                max_workers=self.load_workers, thread_name_prefix="firestore-load"
+            ) as executor:
+                changes = [
+                    change
+                    for range_changes in executor.map(lambda query: self._load_range(collection, query), queries)
+                    for change in range_changes
+                ]
+        self._reconcile(collection, changes)
+
+    def _reconcile(
+        self, collection: str, changes: List[Tuple[str, Dict[str, Any], Any]]
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Make the cache hold exactly ``changes``, a complete read of the collection.
+
+        Cached documents missing from it were deleted in the meantime and are
+        dropped; unchanged documents are left as they are.
+        """
+        cache_entry = self._get_cache_entry(collection)
+        documents = cache_entry["snapshot"].documents
+        fields = cache_entry.get("fields")
+        present = set()
+        batch: List[Tuple[str, Optional[Dict[str, Any]], Any]] = []
+        for doc_id, doc_data, last_update_value in changes:
+            present.add(doc_id)
+            if documents.get(doc_id) != (project_document(doc_data, fields) if fields is not None else doc_data):
+                batch.append((doc_id, doc_data, last_update_value))
+        batch.extend((doc_id, None, None) for doc_id in documents if doc_id not in present)
+        stored = self._apply_cache_changes(collection, batch)
+        cache_entry["full_sync_at"] = time.monotonic()
+        return stored
+
+    def _ensure_collection_listener(self, collection: str) -> Dict[str, Any]:
+        """Return the collection's cache entry, loading it and starting its listener if needed.
+
+        Concurrent calls for the same collection share one run, so a cold
+        collection is subscribed to (or streamed) once however many callers
+        arrive together.
+        """
+        return self._flights.run(("collection", collection), lambda: self._prepare_collection(collection))
+
+    def _prepare_collection(self, collection: str) -> Dict[str, Any]:
+        collection_ref = self._db.collection(collection)
+        cache_entry = self._get_cache_entry(collection)
+        if not cache_entry.get("ready") and not cache_entry.get("restore_attempted"):
+            # Also when reads already cached a few documents in the entry
+            self._restore_snapshot(collection, cache_entry)
+        cache_entry["last_used"] = time.monotonic()
+
+        listener = cache_entry.get("unsubscribe")
+        if listener is not None and getattr(listener, "is_active", True) is False:
+            # The watch stream stopped (e.g. after a permanent error); resubscribe later
+            try:
+                listener.unsubscribe()
+            except Exception:
+                pass
+            cache_entry["unsubscribe"] = None
+            self._mark_listener_failed(cache_entry)
+
+        failed_at = cache_entry.get("listener_failed_at")
+        if (
+            cache_entry.get("listener_error")
+            and failed_at is not None
+            and time.monotonic() - failed_at >= self.listener_retry_interval
+        ):
+            cache_entry["listener_error"] = False
 
         if cache_entry.get("unsubscribe") is None and not cache_entry.get("listener_error"):
             try:
-                # Define the callback function for on_snapshot (built-in method from google.cloud.firestore)
+                # Define the callback function for on_snapshot (built-in method from google.cloud.firestore).
+                # It resolves the tool lazily so the listener does not keep this instance alive;
+                # once it is gone, any other tool attached to the same shared cache applies changes.
+                tool_ref = weakref.ref(self)
+                shared_cache = self._shared_cache
+
                 def snapshot_callback(collection_snapshot, changes, read_time):
-                    """
-                    Callback function for collection_ref.on_snapshot().
-                    Handles document changes: ADDED, MODIFIED, REMOVED.
-                    Similar to JS Firebase: snapshot.docChanges().forEach((change) => { ... })
-                    """
-                    entry = self._collection_cache.setdefault(
-                        collection,
-                        {
-                            "documents": {},
-                            "last_update": None,
-                            "unsubscribe": None,
-                            "ready": False,
-                            "listener_error": False,
-                        },
-                    )
+                    tool = tool_ref()
+                    if tool is None and shared_cache is not None:
+                        tool = shared_cache.any_tool()
+                    # Deliveries still in flight when the collection was evicted are dropped
+                    if tool is not None and tool._collection_cache.get(collection) is cache_entry:
+                        tool._apply_snapshot(collection, collection_snapshot, changes)
 
-                    # Check if this is the initial snapshot (cache not ready yet)
-                    is_initial_snapshot = not entry.get("ready", False)
-                    
-                    if is_initial_snapshot:
-                        # Initial snapshot - populate all documents once
-                        for doc in collection_snapshot:
-                            doc_data = doc.to_dict()
-                            last_update_field = doc_data.get("lastUpdate", getattr(doc, "update_time", None))
-                            self._update_cache_entry(collection, doc.id, doc_data, last_update_field)
-                        entry["ready"] = True
-                    else:
-                        # Subsequent snapshots - only process changes (on_snapshot only fires on changes)
-                        if changes:
-                            for change in changes:
-                                doc = change.document
-                                change_type = change.type.name  # ADDED, MODIFIED, or REMOVED
-                                
-                                if change_type == "REMOVED":
-                                    # Handle removed documents
-                                    entry["documents"].pop(doc.id, None)
-                                elif change_type == "ADDED":
-                                    # Handle new documents
-                                    doc_data = doc.to_dict()
-                                    last_update_field = doc_data.get("lastUpdate", getattr(doc, "update_time", None))
-                                    self._update_cache_entry(collection, doc.id, doc_data, last_update_field)
-                                elif change_type == "MODIFIED":
-                                    # Handle modified documents
-                                    doc_data = doc.to_dict()
-                                    last_update_field = doc_data.get("lastUpdate", getattr(doc, "update_time", None))
-                                    self._update_cache_entry(collection, doc.id, doc_data, last_update_field)
-                        # If no changes, do nothing - cache is already up to date
+                # Listen on the whole collection: a filtered listener never reports deletions of
+                # documents outside its filter. A cache that is already populated (restored from
+                # disk or polled while the listener was down) serves calls until the first
+                # snapshot reconciles it, but is not treated as live before that
+                cache_entry["listener_synced"] = False
 
                 # Use the built-in on_snapshot method from google.cloud.firestore
                 # This sets up a real-time listener for the collection
                 cache_entry["unsubscribe"] = collection_ref.on_snapshot(snapshot_callback)
             except AttributeError:
-                cache_entry["listener_error"] = True
+                self._mark_listener_failed(cache_entry)
             except Exception:
-                cache_entry["listener_error"] = True
+                self._mark_listener_failed(cache_entry)
 
-        if not cache_entry.get("ready"):
+        if cache_entry.get("unsubscribe") is not None and not cache_entry.get("ready"):
+            # The listener's first snapshot carries the whole collection: wait for it
+            # instead of streaming the collection a second time
+            cache_entry["ready_event"].wait(self.snapshot_wait_timeout)
+
+        if not cache_entry.get("ready") and cache_entry.get("listener_error"):
+            # No listener will populate the cache: load it once directly
             try:
-                docs = list(collection_ref.stream())
-                for doc in docs:
-                    doc_data = doc.to_dict()
-                    last_update_field = doc_data.get("lastUpdate", getattr(doc, "update_time", None))
-                    self._update_cache_entry(collection, doc.id, doc_data, last_update_field)
-                cache_entry["ready"] = True
+                self._full_load(collection)
+                self._mark_ready(cache_entry)
+                cache_entry["synced_at"] = time.monotonic()
+                self._persist_snapshot(collection, cache_entry)
             except Exception:
-                cache_entry["listener_error"] = True
+                self._mark_listener_failed(cache_entry)
+        elif cache_entry.get("ready") and cache_entry.get("listener_error"):
+            # No listener to push changes: pull the ones since the watermark instead
+            self._delta_sync(collection, cache_entry)
 
+        self._evict_collections(keep=collection)
         return cache_entry
 
-    def _perform_remote_query(
+    def _evict_collections(self, keep: str) -> None:
+        """Drop least recently used collections while the cache exceeds ``cache_max_bytes``.
+
+        Evicted collections stop their listener; their persisted snapshot lets
+        the next use reload them cheaply. ``keep`` (the collection in use) and
+        every collection used in the last ``_EVICTION_GRACE`` seconds are never
+        evicted. When those alone exceed the budget, nothing is evicted:
+        dropping idle collections could not bring the cache under it.
+        """
+        if self.cache_max_bytes is None:
+            return
+        entries = list(self._collection_cache.items())
+        total = sum(entry["snapshot"].size for _, entry in entries)
+        if total <= self.cache_max_bytes:
+            return
+        recent = time.monotonic() - _EVICTION_GRACE
+        idle = sorted(
+            (entry["last_used"], name, entry["snapshot"].size)
+            for name, entry in entries
+            if name != keep and entry["last_used"] < recent
+        )
+        if total - sum(size for _, _, size in idle) > self.cache_max_bytes:
+            return
+        for _, name, size in idle:
+            if total <= self.cache_max_bytes:
+                break
+            entry = self._collection_cache.pop(name, None)
+            if entry is None:
+                continue
+            total -= size
+            listener, entry["unsubscribe"] = entry.get("unsubscribe"), None
+            if listener is not None:
+                try:
+                    listener.unsubscribe()
+                except Exception:
+                    pass
+
+    def _match_cached_documents(
         self,
-        collection_ref: Any,
-        collection: str,
-        query_conditions: Optional[List[QueryCondition]],
-        return_objects: bool,
-    ) -> str:
-        query = collection_ref
-        for condition in query_conditions or []:
-            field = condition.field
-            operator = condition.operator
-            value = condition.value
+        cache_entry: Dict[str, Any],
+        conditions: List[QueryCondition],
+        snapshot: Optional[CacheSnapshot] = None,
+        ordered: bool = True,
+    ) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """Evaluate ``conditions`` against the cache, or return None if it cannot.
 
-            if not field:
-                return "Error: Each query condition must include a field."
-
-            if operator == "==":
-                query = query.where(field, "==", value)
-            elif operator == ">=":
-                query = query.where(field, ">=", value)
-            elif operator == "<=":
-                query = query.where(field, "<=", value)
-            elif operator == ">":
-                query = query.where(field, ">", value)
-            elif operator == "<":
-                query = query.where(field, "<", value)
-            elif operator == "array-contains":
-                query = query.where(field, "array-contains", value)
-            elif operator == "array-contains-any":
-                query = query.where(field, "array-contains-any", value)
-            elif operator == "in":
-                query = query.where(field, "in", value)
+        Every operator accepted by ``_plan_remote_query`` is evaluated locally
+        with Firestore's comparison semantics. Candidates come from the most
+        selective index available: an equality bucket for ``==``/``in`` or a
+        binary-searched slice of a sorted index for range conditions, so the cost
+        is proportional to the number of candidates rather than the collection
+        size. Like Firestore, queries with an inequality are ordered by the first
+        inequality field and everything else by document id; ``ordered=False``
+        skips sorting for callers that page through the matches themselves.
+        """
+        for condition in conditions:
+            if condition.operator not in SUPPORTED_OPERATORS:
+                return None
+            if condition.operator in ("in", "array-contains-any") and not isinstance(condition.value, list):
+                return None
+
+        fields = cache_entry.get("fields")
+        if fields is not None and not all(is_projected(condition.field, fields) for condition in conditions):
+            # The cache does not hold the filtered field; Firestore has to evaluate it
+            return None
+
+        # One snapshot for the whole match: concurrent writers publish new versions instead
+        if snapshot is None:
+            snapshot = cache_entry["snapshot"]
+        documents = snapshot.documents
+        indexes = snapshot.indexes
+        range_indexes = snapshot.range_indexes
+
+        range_fields = list(
+            dict.fromkeys(condition.field for condition in conditions if condition.operator in RANGE_OPERATORS)
+        )
+        order_field = range_fields[0] if range_fields else None
+
+        candidate_ids = None
+        candidate_count = len(documents)
+        consumed: List[QueryCondition] = []
+        presorted = False
+        for condition in conditions:
+            index = indexes.get(condition.field)
+            if index is None:
+                continue
+            if condition.operator == "==":
+                bucket = index.lookup(condition.value)
+            elif condition.operator == "in":
+                bucket = index.lookup_many(condition.value)
             else:
-                return f"Error: Unsupported operator '{operator}'."
+                continue
+            if candidate_ids is None or len(bucket) < candidate_count:
+                candidate_ids, candidate_count = bucket, len(bucket)
+                consumed, presorted = [condition], False
 
-        try:
-            docs = list(query.stream())
-        except Exception as exc:  # pragma: no cover - remote errors are surfaced to user
-            return f"Error during query: {exc}"
-
-        results: List[Any] = []
-        total_count = 0
-        for doc in docs:
-            total_count += 1
-            doc_data = doc.to_dict()
-            last_update_field = doc_data.get("lastUpdate", getattr(doc, "update_time", None))
-            self._update_cache_entry(collection, doc.id, doc_data, last_update_field)
-            if return_objects:
-                # Only return categoryId and title
-                filtered_payload = self._filter_product_fields(doc_data, doc.id)
-                results.append(filtered_payload)
-            elif total_count <= 10:
-                # Only show categoryId and title (no RTL markers in tool output)
-                title = str(doc_data.get('title', 'No title'))
-                category_id = str(doc_data.get('categoryId', 'No category'))
-                results.append(
-                    f"{total_count}. Title: {title}, CategoryId: {category_id}"
-                )
+        for field in range_fields:
+            index = range_indexes.get(field)
+            if index is None:
+                continue
+            field_conditions = [
+                condition
+                for condition in conditions
+                if condition.field == field and condition.operator in RANGE_OPERATORS
+            ]
+            span = index.span([(condition.operator, condition.value) for condition in field_conditions])
+            if span is None:
+                continue
+            if candidate_ids is None or span[1] - span[0] < candidate_count:
+                candidate_ids, candidate_count = index.ids(*span), span[1] - span[0]
+                consumed, presorted = field_conditions, field == order_field
 
-        if return_objects:
-            try:
-                return json.dumps({"total": total_count, "documents": results}, default=str)
-            except Exception as exc:
-                return f"Error serializing documents: {exc}"
+        if candidate_ids is None:
+            candidates = documents.items()
+        else:
+            candidates = ((doc_id, documents[doc_id]) for doc_id in candidate_ids if doc_id in documents)
 
-        summary_lines = [
-            f"Total documents matching query: {total_count}",
-            "Sample of first 10 matching documents:",
-            *results,
-            "\nTo get specific document details, use the 'read' operation with a document ID.",
+        remaining = [condition for condition in conditions if condition not in consumed]
+        matching_docs = [
+            (doc_id, doc_data)
+            for doc_id, doc_data in candidates
+            if all(
+                matches_condition(doc_data, condition.field, condition.operator, condition.value)
+                for condition in remaining
+            )
         ]
-        return "\n".join(summary_lines)
+        if presorted or not ordered:
+            return matching_docs
+        if order_field is None:
+            matching_docs.sort(key=lambda item: item[0])
+        else:
+            matching_docs.sort(key=lambda item: (value_key(get_field(item[1], order_field)), item[0]))
+        return matching_docs
 
-    # ------------------------------------------------------------------
-    # BaseTool hook
-    # ------------------------------------------------------------------
-    def _run(
+    def _search_cached_documents(
         self,
-        operation: str,
-        collection: str,
-        document_id: Optional[str] = None,
-        query_conditions: Optional[List[Dict[str, Any]]] = None,
-        return_objects: bool = False,
-    ) -> str:
-        try:
-            if operation == "read":
-                # Only allow reads from 'products' collection
-                if collection != "products":
-                    return f"Error: Only 'products' collection is supported. Requested: '{collection}'"
-                
-                if not document_id:
-                    return "Error: document_id is required for read operation."
-
-                doc_ref = self._db.collection(collection).document(document_id)
-                doc_snapshot = doc_ref.get()
-                if doc_snapshot.exists:
-                    doc_data = doc_snapshot.to_dict()
-                    last_update_field = doc_data.get("lastUpdate", getattr(doc_snapshot, "update_time", None))
-                    self._update_cache_entry(collection, doc_snapshot.id, doc_data, last_update_field)
-                    # Only return categoryId and title
-                    filtered_data = self._filter_product_fields(doc_data, doc_snapshot.id)
-                    return f"Document data: {filtered_data}"
-                return f"Document {document_id} not found in collection {collection}."
+        cache_entry: Dict[str, Any],
+        search_text: str,
+        conditions: List[QueryCondition],
+        limit: int,
+    ) -> Optional[Tuple[int, List[Tuple[str, Dict[str, Any], float]]]]:
+        """Rank cached documents against ``search_text`` with BM25.
+
+        Returns (number of matches, top ``limit`` (id, data, score) triples), or
+        None when the conditions cannot be evaluated on the cache.
+        """
+        snapshot = cache_entry["snapshot"]
+        text_index = snapshot.search_indexes.get("text")
+        if text_index is None:
+            return None
+        documents = snapshot.documents
+        accept = None
+        if conditions:
+            matching_docs = self._match_cached_documents(cache_entry, conditions, snapshot)
+            if matching_docs is None:
+                return None
+            allowed = {doc_id for doc_id, _ in matching_docs}
+            accept = allowed.__contains__
+        total_count, ranked = text_index.search(search_text, limit, accept, self.search_min_similarity)
+        return total_count, [(doc_id, documents[doc_id], score) for doc_id, score in ranked if doc_id in documents]
+
+    def _semantic_search_cached_documents(
+        self,
+        cache_entry: Dict[str, Any],
+        search_text: Optional[str],
+        document_id: Optional[str],
+        conditions: List[QueryCondition],
+        limit: int,
+    ) -> Any:
+        """Rank cached documents by embedding cosine similarity.
+
+        Compares against the embedding of ``search_text`` or of the cached
+        document ``document_id`` (which is left out of its own results). Returns
+        like _search_cached_documents, or an error message string.
+        """
+        snapshot = cache_entry["snapshot"]
+        vector_index = snapshot.search_indexes.get("vector")
+        if vector_index is None:
+            return "Error: semantic search is disabled (no embedding_fields configured)."
+        documents = snapshot.documents
+
+        if document_id is not None:
+            query_vector = vector_index.vector(document_id)
+            if query_vector is None:
+                return f"Document {document_id} not found in collection cache or has no text to compare."
+        else:
+            query_vector = vector_index.embed_queries([search_text])[0]
+
+        accept = None
+        if conditions:
+            matching_docs = self._match_cached_documents(cache_entry, conditions, snapshot)
+            if matching_docs is None:
+                return None
+            accept = {doc_id for doc_id, _ in matching_docs}.__contains__
+
+        # Documents with a positive cosine similarity count as matches
+        total_count, ranked = vector_index.search(query_vector, limit, accept, exclude=document_id)[0]
+        return total_count, [(doc_id, documents[doc_id], score) for doc_id, score in ranked if doc_id in documents]
+
+    def _listener_is_live(self, cache_entry: Dict[str, Any]) -> bool:
+        """True while a snapshot listener keeps the complete collection current."""
+        listener = cache_entry.get("unsubscribe")
+        return bool(
+            cache_entry.get("ready")
+            and cache_entry.get("listener_synced")
+            and not cache_entry.get("listener_error")
+            and listener is not None
+            and getattr(listener, "is_active", True) is not False
+        )
+
+    def _cached_reads(
+        self,
+        collection: str,
+        document_ids: List[str],
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[str], bool]:
+        """Return (documents the cache may serve, ids to fetch, whether the cache is complete).
+
+        While a live listener has the complete collection, everything is served
+        from the cache and an id missing from it does not exist. Otherwise a
+        cached document is served only if the whole collection was read or the
+        document fetched within ``read_max_staleness`` seconds.
+        """
+        cache_entry = self._collection_cache.get(collection)
+        if cache_entry is None:
+            return {}, list(document_ids), False
+        documents = cache_entry["snapshot"].documents
+        if self._listener_is_live(cache_entry):
+            found = {doc_id: documents[doc_id] for doc_id in document_ids if doc_id in documents}
+            return found, [], True
+
+        oldest = time.monotonic() - self.read_max_staleness
+        # Delta syncs miss deletions: only a complete read vouches for the whole collection
+        full_sync_at = cache_entry.get("full_sync_at")
+        collection_fresh = cache_entry.get("ready") and full_sync_at is not None and full_sync_at >= oldest
+        read_at = cache_entry["read_at"]
+        found = {
+            doc_id: documents[doc_id]
+            for doc_id in document_ids
+            if doc_id in documents and (collection_fresh or read_at.get(doc_id, oldest - 1) >= oldest)
+        }
+        return found, [doc_id for doc_id in document_ids if doc_id not in found], False
+
+    def _store_reads(self, collection: str, snapshots: Iterable[Any], found: Dict[str, Dict[str, Any]]) -> None:
+        """Store fetched document snapshots in the cache and add the existing ones to ``found``.
+
+        Documents that no longer exist are dropped from the cache.
+        """
+        fetched_at = time.monotonic()
+        changes = [
+            self._document_change(snapshot) if snapshot.exists else (snapshot.id, None, None)
+            for snapshot in snapshots
+        ]
+        stored = self._apply_cache_changes(collection, changes)
+        read_at = self._collection_cache[collection]["read_at"] if stored else {}
+        for doc_id, doc_data in stored.items():
+            if doc_data is not None:
+                found[doc_id] = doc_data
+            read_at[doc_id] = fetched_at
+
+    def _read_documents(
+        self,
+        collection: str,
+        document_ids: List[str],
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """Return (documents by id, ids that do not exist) for ``document_ids``.
+
+        Documents the cache cannot serve (see ``_cached_reads``) are fetched in
+        one get_all batch and stored back in the cache.
+        """
+        found, misses, _ = self._cached_reads(collection, document_ids)
+        if misses:
+            collection_ref = self._db.collection(collection)
+            fields = self._projected_fields(collection)
+            refs = [collection_ref.document(doc_id) for doc_id in misses]
+            snapshots = self._db.get_all(refs, field_paths=fields) if fields is not None else self._db.get_all(refs)
+            self._store_reads(collection, snapshots, found)
+        return found, [doc_id for doc_id in document_ids if doc_id not in found]
+
+    def _requested_ids(
+        self, operation: str, document_id: Optional[str], document_ids: Optional[List[str]]
+    ) -> Union[str, List[str]]:
+        """The ids a read or read_many call asks for, or an error message."""
+        if operation == "read":
+            if not document_id:
+                return "Error: document_id is required for read operation."
+            return [document_id]
+        if not document_ids:
+            return "Error: document_ids is required for read_many operation."
+        requested_ids = list(dict.fromkeys(document_ids))
+        if len(requested_ids) > self.max_page_size:
+            return f"Error: read_many accepts at most {self.max_page_size} document_ids."
+        return requested_ids
+
+    def _format_reads(
+        self,
+        operation: str,
+        collection: str,
+        requested_ids: List[str],
+        found: Dict[str, Dict[str, Any]],
+        missing: List[str],
+        return_objects: bool,
+    ) -> str:
+        if operation == "read":
+            document_id = requested_ids[0]
+            if document_id in found:
+                # Only return the output fields (categoryId and title for products)
+                filtered_data = self._filter_fields(collection, found[document_id], document_id)
+                return f"Document data: {filtered_data}"
+            return f"Document {document_id} not found in collection {collection}."
+
+        if return_objects:
+            payload = {
+                # Only return the output fields (categoryId and title for products)
+                "documents": [
+                    self._filter_fields(collection, found[doc_id], doc_id)
+                    for doc_id in requested_ids
+                    if doc_id in found
+                ],
+                "missing": missing,
+            }
+            try:
+                return json.dumps(payload, default=str)
+            except Exception as exc:
+                return f"Error serializing documents: {exc}"
+
+        lines = [
+            f"Document data: {self._filter_fields(collection, found[doc_id], doc_id)}"
+            for doc_id in requested_ids
+            if doc_id in found
+        ]
+        if missing:
+            lines.append(f"Documents not found in collection {collection}: {', '.join(missing)}")
+        return "\n".join(lines)
+
+    def _resolve_page(
+        self,
+        collection: str,
+        conditions: List[QueryCondition],
+        limit: Optional[int],
+        offset: Optional[int],
+        order_by: Optional[str],
+        order_direction: str,
+        start_after: Optional[str],
+        return_objects: bool,
+    ) -> _Page:
+        """Validate the pagination arguments of a query call; raises ValueError."""
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        if offset is not None and offset < 0:
+            raise ValueError("offset must not be negative.")
+        order_field = order_by or next(
+            (condition.field for condition in conditions if condition.operator in RANGE_OPERATORS), None
+        )
+        descending = order_direction == "desc"
+        fingerprint = _query_fingerprint(collection, conditions, order_field, descending)
+        page_limit = limit or (self.max_page_size if return_objects else 10)
+        return _Page(
+            order_field=order_field,
+            descending=descending,
+            after=_decode_page_token(start_after, fingerprint) if start_after else None,
+            offset=offset or 0,
+            limit=min(page_limit, self.max_page_size),
+            fingerprint=fingerprint,
+        )
+
+    def _paginate_cached(
+        self,
+        items: Iterable[Tuple[str, Dict[str, Any]]],
+        page: _Page,
+    ) -> Tuple[int, List[Tuple[str, Dict[str, Any]]], bool]:
+        """Return (total matches, documents of this page, whether more follow).
+
+        Only the ``offset + limit + 1`` best documents after the cursor are kept
+        in a heap while the matches stream past, instead of sorting (or even
+        listing) every match.
+        """
+        order_field = page.order_field
+        total = 0
+
+        def eligible() -> Iterator[Tuple[str, Dict[str, Any]]]:
+            nonlocal total
+            for item in items:
+                # Like Firestore, ordering by a field leaves out documents without it
+                if order_field is None or get_field(item[1], order_field) is not MISSING:
+                    total += 1
+                    yield item
+
+        if order_field is None:
+            def sort_key(item: Tuple[str, Dict[str, Any]]) -> Tuple[Any, ...]:
+                return (item[0],)
+        else:
+            def sort_key(item: Tuple[str, Dict[str, Any]]) -> Tuple[Any, ...]:
+                return (value_key(get_field(item[1], order_field)), item[0])
+
+        candidates: Iterable[Tuple[str, Dict[str, Any]]] = eligible()
+        if page.after is not None:
+            after_value, after_id = page.after
+            after_key = (after_id,) if order_field is None else (value_key(after_value), after_id)
+            if page.descending:
+                candidates = (item for item in candidates if sort_key(item) < after_key)
+            else:
+                candidates = (item for item in candidates if sort_key(item) > after_key)
+
+        select = heapq.nlargest if page.descending else heapq.nsmallest
+        window = select(page.offset + page.limit + 1, candidates, key=sort_key)
+        page_docs = window[page.offset:page.offset + page.limit]
+        return total, page_docs, len(window) > page.offset + page.limit
+
+    def _paginate_index(
+        self, snapshot: CacheSnapshot, conditions: List[QueryCondition], page: _Page
+    ) -> Optional[Tuple[int, List[Tuple[str, Dict[str, Any]]], bool]]:
+        """Like ``_paginate_cached``, by bisecting and slicing an index in the page order.
+
+        Pages ordered by a field use its SortedIndex, when every condition is a
+        range bound on that field (or there are none) and the index holds every
+        document that has the field. Unfiltered pages ordered by document id
+        use the snapshot's id index. Returns None otherwise. The cost is that of
+        the page, not of the matches.
+        """
+        if page.order_field is None:
+            index = None if conditions else snapshot.id_index
+        else:
+            index = snapshot.range_indexes.get(page.order_field)
+        if index is None or not index.orders_every_value():
+            return None
+        if any(
+            condition.field != page.order_field or condition.operator not in RANGE_OPERATORS
+            for condition in conditions
+        ):
+            return None
+        if conditions:
+            span = index.span([(condition.operator, condition.value) for condition in conditions])
+            if span is None:
+                return None
+        else:
+            span = (0, len(index))
+
+        start, stop = span
+        if page.after is not None:
+            after_value, after_id = page.after
+            if page.descending:
+                stop = max(start, min(stop, index.position(after_value, after_id, after=False)))
+            else:
+                start = min(stop, max(start, index.position(after_value, after_id)))
+        window = page.offset + page.limit + 1
+        if page.descending:
+            window_ids = index.ids(max(start, stop - window), stop)[::-1]
+        else:
+            window_ids = index.ids(start, min(stop, start + window))
+        documents = snapshot.documents
+        page_docs = [(doc_id, documents[doc_id]) for doc_id in window_ids[page.offset:page.offset + page.limit]]
+        return span[1] - span[0], page_docs, len(window_ids) > page.offset + page.limit
+
+    def _next_page_token(self, page: _Page, page_docs: List[Tuple[str, Dict[str, Any]]]) -> str:
+        last_id, last_data = page_docs[-1]
+        last_value = get_field(last_data, page.order_field) if page.order_field is not None else None
+        return _encode_page_token(page, last_id, last_value)
+
+    def _take(self, stream: Any, count: int) -> List[Any]:
+        """Read the first ``count`` documents of a stream and cancel the rest of the RPC."""
+        try:
+            return list(itertools.islice(stream, count))
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+    def _count_remote(self, query: Any) -> Optional[int]:
+        """Number of documents matching ``query`` from an aggregation, or None if it fails."""
+        try:
+            result = query.count(alias="total").get()
+            return int(result[0][0].value)
+        except Exception:
+            return None
+
+    def _format_query_response(
+        self,
+        collection: str,
+        total_count: Optional[int],
+        page_docs: List[Tuple[str, Dict[str, Any]]],
+        page: _Page,
+        next_token: Optional[str],
+        return_objects: bool,
+        filtered: bool,
+    ) -> str:
+        if return_objects:
+            # Only return the output fields (categoryId and title for products)
+            response: Dict[str, Any] = {
+                "total": total_count,
+                "documents": [self._filter_fields(collection, doc_data, doc_id) for doc_id, doc_data in page_docs],
+            }
+            if next_token is not None:
+                response["next_page_token"] = next_token
+            try:
+                return json.dumps(response, default=str)
+            except Exception as exc:
+                return f"Error serializing documents: {exc}"
+
+        summaries: List[str] = []
+        for idx, (_, doc_data) in enumerate(page_docs, start=page.offset + 1):
+            # Only show the output fields, e.g. categoryId and title (no RTL markers in tool output)
+            summaries.append(f"{idx}. {self._summarize_fields(collection, doc_data)}")
+
+        kind = "matching documents" if filtered else "documents"
+        first_page = page.after is None and not page.offset
+        lines = [
+            f"Total documents {'matching query' if filtered else 'in collection'}: "
+            f"{total_count if total_count is not None else 'unknown'}",
+            f"Sample of first {len(page_docs)} {kind}:" if first_page else f"Next {len(page_docs)} {kind}:",
+            *summaries,
+        ]
+        if next_token is not None:
+            lines.append(f"\nMore {kind} available. Pass start_after=\"{next_token}\" for the next page.")
+        lines.append("\nTo get specific document details, use the 'read' operation with a document ID.")
+        # Return plain text without RTL markers - formatting will be applied later
+        return "\n".join(lines)
+
+    def _cached_query_page(
+        self, cache_entry: Dict[str, Any], conditions: List[QueryCondition], page: _Page
+    ) -> Optional[Tuple[int, List[Tuple[str, Dict[str, Any]]], bool]]:
+        """(total matches, documents of this page, whether more follow) from the cache,
+        or None if Firestore must answer the query."""
+        if not cache_entry.get("ready"):
+            # The listener's first snapshot did not arrive within snapshot_wait_timeout (or the
+            # collection could not be loaded): answer from Firestore and let the listener finish
+            return None
+        fields = cache_entry.get("fields")
+        if page.order_field is not None and fields is not None and not is_projected(page.order_field, fields):
+            # The cache does not hold the sort field; let Firestore order the results
+            return None
+        # One snapshot for the whole page: concurrent writers publish new versions instead
+        snapshot = cache_entry["snapshot"]
+        paged = self._paginate_index(snapshot, conditions, page)
+        if paged is not None:
+            return paged
+        if not conditions:
+            return self._paginate_cached(snapshot.documents.items(), page)
+        # None if the local cache can't handle the conditions: filter remotely
+        matching_docs = self._match_cached_documents(cache_entry, conditions, snapshot, ordered=False)
+        return None if matching_docs is None else self._paginate_cached(matching_docs, page)
+
+    def _format_cached_query(
+        self,
+        collection: str,
+        paged: Tuple[int, List[Tuple[str, Dict[str, Any]]], bool],
+        page: _Page,
+        return_objects: bool,
+        filtered: bool,
+    ) -> str:
+        total_count, page_docs, has_more = paged
+        next_token = self._next_page_token(page, page_docs) if has_more else None
+        return self._format_query_response(
+            collection, total_count, page_docs, page, next_token, return_objects, filtered
+        )
+
+    def _count_cached(self, cache_entry: Dict[str, Any], conditions: List[QueryCondition]) -> Optional[int]:
+        """Number of cached documents matching ``conditions``, or None if the cache cannot tell."""
+        if not cache_entry.get("ready"):
+            return None
+        if not conditions:
+            return len(cache_entry["snapshot"].documents)
+        matching_docs = self._match_cached_documents(cache_entry, conditions, ordered=False)
+        return None if matching_docs is None else len(matching_docs)
+
+    def _format_count(self, total_count: Optional[int], conditions: List[QueryCondition], return_objects: bool) -> str:
+        if total_count is None:
+            return "Error during count: Firestore aggregation query failed."
+        if return_objects:
+            return json.dumps({"total": total_count})
+        if conditions:
+            return f"Total documents matching query: {total_count}"
+        return f"Total documents in collection: {total_count}"
+
+    def _build_remote_query(self, collection_ref: Any, query_conditions: Optional[List[QueryCondition]]) -> Any:
+        """Apply the conditions as Firestore filters; raises ValueError for invalid ones."""
+        query = collection_ref
+        for condition in query_conditions or []:
+            field = condition.field
+            operator = condition.operator
+            value = condition.value
+
+            if not field:
+                raise ValueError("Each query condition must include a field.")
+
+            if operator not in SUPPORTED_OPERATORS:
+                raise ValueError(f"Unsupported operator '{operator}'.")
+            query = query.where(field, operator, value)
+        return query
+
+    def _split_disjunctions(
+        self, query_conditions: Optional[List[QueryCondition]]
+    ) -> Tuple[List[List[QueryCondition]], bool]:
+        """Split 'in'/'array-contains-any' lists into queries Firestore allows.
+
+        Returns (condition sets whose results together match the original
+        conditions, whether those results are disjoint). Repeated values are
+        dropped first; a document can still match several chunks of an
+        'array-contains-any' list. With several such lists the chunk sizes are
+        reduced, largest first, until their product is within the limit.
+        """
+        conditions = list(query_conditions or [])
+        value_lists: Dict[int, List[Any]] = {
+            position: list({value_key(value): value for value in condition.value}.values())
+            for position, condition in enumerate(conditions)
+            if condition.operator in ("in", "array-contains-any") and isinstance(condition.value, list)
+        }
+        chunk_sizes = {
+            position: max(1, min(len(values), _DISJUNCTION_LIMIT)) for position, values in value_lists.items()
+        }
+        while math.prod(chunk_sizes.values()) > _DISJUNCTION_LIMIT:
+            largest = max(chunk_sizes, key=chunk_sizes.__getitem__)
+            chunk_sizes[largest] -= 1
+
+        options: List[List[QueryCondition]] = []
+        disjoint = True
+        for position, condition in enumerate(conditions):
+            if position not in value_lists:
+                options.append([condition])
+                continue
+            values, size = value_lists[position], chunk_sizes[position]
+            chunks = [values[start:start + size] for start in range(0, len(values), size)]
+            if len(chunks) > 1 and condition.operator == "array-contains-any":
+                disjoint = False
+            options.append(
+                [
+                    QueryCondition(field=condition.field, operator=condition.operator, value=chunk)
+                    for chunk in chunks or [values]
+                ]
+            )
+        return [list(combination) for combination in itertools.product(*options)], disjoint
+
+    def _remote_queries(
+        self, collection_ref: Any, query_conditions: Optional[List[QueryCondition]]
+    ) -> Tuple[List[Any], bool]:
+        """Firestore queries that together match the conditions, and whether their results are disjoint."""
+        condition_sets, disjoint = self._split_disjunctions(query_conditions)
+        return [self._build_remote_query(collection_ref, condition_set) for condition_set in condition_sets], disjoint
+
+    def _fan_out(self, function: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+        """Apply ``function`` to each item on up to ``load_workers`` threads; results keep item order."""
+        if len(items) == 1:
+            return [function(items[0])]
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.load_workers, len(items))), thread_name_prefix="firestore-query"
+        ) as executor:
+            return list(executor.map(function, items))
+
+    def _count_remote_queries(self, queries: List[Any], disjoint: bool) -> Optional[int]:
+        """Number of documents matching any of ``queries``, or None if it fails.
+
+        Disjoint queries are counted by server-side aggregations; overlapping
+        ones by the union of their document ids.
+        """
+        if len(queries) == 1:
+            return self._count_remote(queries[0])
+        if disjoint:
+            counts = self._fan_out(self._count_remote, queries)
+            return None if any(count is None for count in counts) else sum(counts)
+        try:
+            id_lists = self._fan_out(
+                lambda query: [doc.id for doc in query.select(["__name__"]).stream()], queries
+            )
+        except Exception:
+            return None
+        return len(set(itertools.chain.from_iterable(id_lists)))
+
+    def _aggregate_cached(
+        self,
+        cache_entry: Dict[str, Any],
+        conditions: List[QueryCondition],
+        group_field: str,
+        aggregate_field: Optional[str],
+    ) -> Optional[List[GroupStats]]:
+        """Group cached documents by ``group_field``, or return None if the cache cannot.
+
+        Unfiltered groupings of a configured aggregate field are read from the
+        maintained GroupAggregate; anything else is grouped from the matches.
+        """
+        snapshot = cache_entry["snapshot"]
+        needed = [group_field, *([aggregate_field] if aggregate_field else [])]
+        fields = cache_entry.get("fields")
+        if fields is not None and not all(is_projected(field, fields) for field in needed):
+            return None
+
+        numeric_fields = [aggregate_field] if aggregate_field else []
+        aggregate = snapshot.aggregates.get(group_field)
+        if not conditions and aggregate is not None and set(numeric_fields) <= set(aggregate.numeric_fields):
+            return aggregate.groups()
+        if conditions:
+            matching_docs = self._match_cached_documents(cache_entry, conditions, snapshot, ordered=False)
+            if matching_docs is None:
+                return None
+            documents: Iterable[Dict[str, Any]] = (doc_data for _, doc_data in matching_docs)
+        else:
+            documents = snapshot.documents.values()
+        return aggregate_documents(documents, group_field, numeric_fields)
+
+    def _aggregate_queries(
+        self,
+        collection_ref: Any,
+        conditions: List[QueryCondition],
+        group_field: str,
+        aggregate_field: Optional[str],
+    ) -> List[Any]:
+        """Queries for the matching documents with only the grouped fields selected."""
+        queries, _ = self._remote_queries(collection_ref, conditions)
+        fields = [group_field, *([aggregate_field] if aggregate_field else [])]
+        return [query.select(fields) for query in queries]
+
+    def _aggregate_remote(
+        self,
+        collection_ref: Any,
+        conditions: List[QueryCondition],
+        group_field: str,
+        aggregate_field: Optional[str],
+    ) -> List[GroupStats]:
+        """Group matching documents streamed with only the grouped fields selected."""
+        queries = self._aggregate_queries(collection_ref, conditions, group_field, aggregate_field)
+        streamed = self._fan_out(lambda query: [(doc.id, doc.to_dict()) for doc in query.stream()], queries)
+        # Keyed by id: a document matching several chunks counts once
+        documents = dict(itertools.chain.from_iterable(streamed))
+        return aggregate_documents(documents.values(), group_field, [aggregate_field] if aggregate_field else [])
+
+    def _format_groups(
+        self,
+        operation: str,
+        group_field: str,
+        aggregate_field: Optional[str],
+        groups: List[GroupStats],
+        return_objects: bool,
+    ) -> str:
+        rows: List[Dict[str, Any]] = []
+        for group in groups:
+            row: Dict[str, Any] = {"value": group.value, "count": group.count}
+            if operation == "group_by" and aggregate_field:
+                summary = group.summary(aggregate_field)
+                row.update(min=summary["min"], max=summary["max"], avg=summary["avg"])
+            rows.append(row)
+
+        if return_objects:
+            response: Dict[str, Any] = {"field": group_field, "total": len(rows)}
+            if operation == "group_by":
+                if aggregate_field:
+                    response["aggregate_field"] = aggregate_field
+                response["groups"] = rows
+            else:
+                response["values"] = rows
+            try:
+                return json.dumps(response, default=str)
+            except Exception as exc:
+                return f"Error serializing documents: {exc}"
+
+        if operation == "group_by":
+            lines = [f"Groups by {group_field}: {len(rows)}"]
+        else:
+            lines = [f"Distinct values of {group_field}: {len(rows)}"]
+        for idx, row in enumerate(rows, start=1):
+            line = f"{idx}. {group_field}: {row['value']}, Documents: {row['count']}"
+            if operation == "group_by" and aggregate_field:
+                if row["avg"] is None:
+                    line += f", {aggregate_field}: no numeric values"
+                else:
+                    line += (
+                        f", {aggregate_field} min: {row['min']}, max: {row['max']}, "
+                        f"avg: {row['avg']:.2f}"
+                    )
+            lines.append(line)
+        return "\n".join(lines)
+
+    def _browse_catalog(
+        self,
+        collection: str,
+        cache_entry: Dict[str, Any],
+        per_group: int,
+        category_entry: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Join the per-category product groups with the category documents.
+
+        Counts and rankings come from the GroupAggregate the listener keeps up to
+        date, so this only touches ``per_group`` documents per category.
+        ``category_entry`` is the cache of ``category_collection``, if it is
+        served. Categories without products and groups without a category
+        document are both included.
+        """
+        snapshot = cache_entry["snapshot"]
+        group_field = self.browse_group_field
+        groups = {value_key(group.value): group for group in snapshot.aggregates[group_field].groups()}
+
+        categories: Dict[Hashable, Tuple[str, Dict[str, Any]]] = {}
+        category_collection = self.category_collection
+        if category_entry is not None:
+            category_documents = category_entry["snapshot"].documents
+            for doc_id, doc_data in category_documents.items():
+                categories[value_key(doc_data.get(group_field, doc_id))] = (doc_id, doc_data)
+
+        rows: List[Dict[str, Any]] = []
+        for key in sorted(set(groups) | set(categories)):
+            group = groups.get(key)
+            category = categories.get(key)
+            row: Dict[str, Any] = {}
+            if category is not None:
+                category_id, category_data = category
+                row.update(self._filter_fields(category_collection, category_data, category_id))
+                row.pop("_id", None)
+            row[group_field] = group.value if group is not None else category[1].get(group_field, category[0])
+            row["count"] = group.count if group is not None else 0
+            row["products"] = []
+            for doc_id in group.top(per_group) if group is not None else []:
+                doc_data = snapshot.documents.get(doc_id)
+                if doc_data is not None:
+                    item = self._filter_fields(collection, doc_data, doc_id)
+                    item.pop(group_field, None)
+                    row["products"].append(item)
+            rows.append(row)
+        return rows
+
+    def _format_browse(self, collection: str, rows: List[Dict[str, Any]], return_objects: bool) -> str:
+        total_products = sum(row["count"] for row in rows)
+        if return_objects:
+            try:
+                return json.dumps(
+                    {"total_categories": len(rows), "total_products": total_products, "categories": rows},
+                    default=str,
+                )
+            except Exception as exc:
+                return f"Error serializing documents: {exc}"
+
+        group_field = self.browse_group_field
+        lines = [f"Categories: {len(rows)}, Products: {total_products}"]
+        for idx, row in enumerate(rows, start=1):
+            category_fields = {key: value for key, value in row.items() if key not in ("count", "products")}
+            category_line = ", ".join(
+                f"{field[:1].upper()}{field[1:]}: {value}" for field, value in category_fields.items()
+            )
+            lines.append(f"{idx}. {category_line}, Products: {row['count']}")
+            for item in row["products"]:
+                # Only show the output fields (no RTL markers in tool output)
+                lines.append(f"   - {self._summarize_fields(collection, item, exclude=('_id', group_field))}")
+        lines.append(
+            f"\nTo list every product of a category, use the 'query' operation with {group_field} == <value>."
+        )
+        return "\n".join(lines)
+
+    def _plan_remote_query(
+        self,
+        collection_ref: Any,
+        collection: str,
+        query_conditions: Optional[List[QueryCondition]],
+        return_objects: bool,
+        page: _Page,
+    ) -> _RemoteQuery:
+        """Build the Firestore queries for one page; raises ValueError for invalid conditions."""
+        condition_sets, disjoint = self._split_disjunctions(query_conditions)
+        queries = [self._build_remote_query(collection_ref, condition_set) for condition_set in condition_sets]
+
+        # Same order as the cached path: the order field, then document id
+        direction = firestore.Query.DESCENDING if page.descending else firestore.Query.ASCENDING
+        if page.order_field is not None:
+            queries = [query.order_by(page.order_field, direction=direction) for query in queries]
+        filtered_queries = queries = [query.order_by("__name__", direction=direction) for query in queries]
+        if page.after is not None:
+            cursor = {"__name__": page.after[1]}
+            if page.order_field is not None:
+                cursor[page.order_field] = page.after[0]
+            queries = [query.start_after(cursor) for query in queries]
+        # One extra document tells whether another page follows. Split queries
+        # cannot skip the offset on the server: each reads up to the page end
+        fetch = page.limit + 1 if len(queries) == 1 else page.offset + page.limit + 1
+        if page.offset and len(queries) == 1:
+            queries = [queries[0].offset(page.offset)]
+        queries = [query.limit(fetch) for query in queries]
+        selected_fields: Optional[List[str]] = None
+        if return_objects:
+            selected_fields = self._projected_fields(collection)
+        elif self.output_fields.get(collection) is not None:
+            # A summary only shows the output fields: transfer just those (and the sort field)
+            selected_fields = list(
+                dict.fromkeys(
+                    [*self.output_fields[collection], *([page.order_field] if page.order_field else [])]
+                )
+            )
+        if selected_fields is not None:
+            queries = [query.select(selected_fields) for query in queries]
+
+        key = (
+            "query",
+            collection,
+            encode_document(
+                {
+                    "conditions": [
+                        [condition.model_dump() for condition in conditions] for conditions in condition_sets
+                    ],
+                    "page": list(page),
+                    "fields": selected_fields,
+                    "store": return_objects,
+                }
+            ),
+        )
+        return _RemoteQuery(queries, filtered_queries, disjoint, fetch, key)
+
+    def _merge_remote_results(
+        self, results: List[List[Any]], page: _Page, fetch: int
+    ) -> List[Tuple[str, Dict[str, Any], Any]]:
+        """Changes of one page from the documents each (possibly split) query returned.
+
+        Split queries are merged in query order and de-duplicated before the
+        offset applies.
+        """
+        if len(results) == 1:
+            return [self._document_change(doc) for doc in results[0]]
+
+        # Each chunk is already in query order: merge them, keeping the first copy of a document
+        def order_key(change: Tuple[str, Dict[str, Any], Any]) -> Tuple[Any, ...]:
+            if page.order_field is None:
+                return (change[0],)
+            return (value_key(get_field(change[1], page.order_field)), change[0])
+
+        changes = []
+        seen = set()
+        for change in heapq.merge(
+            *([self._document_change(doc) for doc in docs] for docs in results),
+            key=order_key,
+            reverse=page.descending,
+        ):
+            if change[0] in seen:
+                continue
+            seen.add(change[0])
+            changes.append(change)
+            if len(changes) == fetch:
+                break
+        return changes[page.offset:]
+
+    def _fetch_remote_page(
+        self, collection: str, plan: _RemoteQuery, page: _Page, store: bool
+    ) -> Tuple[List[Tuple[str, Dict[str, Any], Any]], Optional[int]]:
+        """Read one page of a planned remote query: (up to limit + 1 changes, total).
+
+        Complete documents are stored in the cache when ``store`` is set.
+        """
+        results = self._fan_out(lambda query: self._take(query.stream(), plan.fetch), plan.queries)
+        changes = self._merge_remote_results(results, page, plan.fetch)
+        if store:
+            # Summary rows are partial documents and must not replace cached ones
+            self._apply_cache_changes(collection, changes)
+
+        if len(changes) > page.limit or page.after is not None or page.offset:
+            # Server-side count instead of reading every match
+            total_count = self._count_remote_queries(plan.filtered_queries, plan.disjoint)
+        else:
+            total_count = min(len(changes), page.limit)
+        return changes, total_count
+
+    def _format_remote_page(
+        self,
+        collection: str,
+        changes: List[Tuple[str, Dict[str, Any], Any]],
+        total_count: Optional[int],
+        page: _Page,
+        return_objects: bool,
+        filtered: bool,
+    ) -> str:
+        has_more = len(changes) > page.limit
+        page_docs = [(doc_id, doc_data) for doc_id, doc_data, _ in changes[:page.limit]]
+        next_token = self._next_page_token(page, page_docs) if has_more else None
+        return self._format_query_response(
+            collection, total_count, page_docs, page, next_token, return_objects, filtered
+        )
+
+    def _shared_remote_page(
+        self, collection: str, plan: _RemoteQuery, page: _Page, store: bool
+    ) -> Tuple[List[Tuple[str, Dict[str, Any], Any]], Optional[int]]:
+        """``_fetch_remote_page``, run once for all identical concurrent queries."""
+        return self._flights.run(plan.key, lambda: self._fetch_remote_page(collection, plan, page, store))
+
+    def _response_key(self, operation: str, collection: str, arguments: Dict[str, Any]) -> Optional[Hashable]:
+        """Memoization key of a call, or None if its response must be built afresh.
+
+        Responses are only reused while every collection involved has a live
+        listener. The key holds each cache's generation and snapshot version,
+        so the first change a listener applies makes older responses unreachable.
+        """
+        if self._response_cache is None:
+            return None
+        collections = [collection]
+        if operation == "browse" and self.category_collection in self.collections:
+            collections.append(self.category_collection)
+        versions = []
+        for name in dict.fromkeys(collections):
+            cache_entry = self._collection_cache.get(name)
+            if cache_entry is None or not self._listener_is_live(cache_entry):
+                return None
+            versions.append((cache_entry["generation"], cache_entry["snapshot"].version))
+        try:
+            normalized = dict(arguments)
+            normalized["query_conditions"] = [
+                (condition if isinstance(condition, QueryCondition) else QueryCondition(**condition)).model_dump()
+                for condition in arguments["query_conditions"] or []
+            ]
+            return (operation, collection, encode_document(normalized), tuple(versions))
+        except Exception:
+            # Arguments the operation will reject anyway
+            return None
+
+    def _recall_response(
+        self, operation: str, collection: str, arguments: Dict[str, Any]
+    ) -> Tuple[Optional[Hashable], Optional[str]]:
+        """Return (the call's memoization key, its memoized response if any)."""
+        response_key = self._response_key(operation, collection, arguments)
+        if response_key is None:
+            return None, None
+        response = self._response_cache.get(response_key)
+        if response is not None:
+            cache_entry = self._collection_cache.get(collection)
+            if cache_entry is not None:
+                cache_entry["last_used"] = time.monotonic()
+        return response_key, response
+
+    def _remember_response(self, response_key: Optional[Hashable], response: str) -> None:
+        if response_key is not None and not response.startswith("Error"):
+            self._response_cache.put(response_key, response)
+
+    # ------------------------------------------------------------------
+    # BaseTool hooks
+    # ------------------------------------------------------------------
+    def _run(
+        self,
+        operation: str,
+        collection: str,
+        document_id: Optional[str] = None,
+        query_conditions: Optional[List[Dict[str, Any]]] = None,
+        return_objects: bool = False,
+        search_text: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        order_by: Optional[str] = None,
+        order_direction: str = "asc",
+        start_after: Optional[str] = None,
+        document_ids: Optional[List[str]] = None,
+        group_by_field: Optional[str] = None,
+        aggregate_field: Optional[str] = None,
+    ) -> str:
+        arguments: Dict[str, Any] = {
+            "document_id": document_id,
+            "query_conditions": query_conditions,
+            "return_objects": return_objects,
+            "search_text": search_text,
+            "limit": limit,
+            "offset": offset,
+            "order_by": order_by,
+            "order_direction": order_direction,
+            "start_after": start_after,
+            "document_ids": document_ids,
+            "group_by_field": group_by_field,
+            "aggregate_field": aggregate_field,
+        }
+        return self._drive(self._respond(lambda: self._db, operation, collection, arguments))
+
+    async def _arun(self, *args: Any, **kwargs: Any) -> str:
+        """Async ``_run`` with the same arguments: the same operations, caches and responses,
+        without a thread per call.
+
+        Firestore reads go through the AsyncClient; snapshot listeners (which
+        the AsyncClient lacks) stay on the sync client and feed the cache both
+        paths share.
+        """
+        call = inspect.signature(self._run).bind(*args, **kwargs)
+        call.apply_defaults()
+        arguments = dict(call.arguments)
+        operation, collection = arguments.pop("operation"), arguments.pop("collection")
+        return await self._adrive(self._respond(self._async_db, operation, collection, arguments))
+
+    async def arun(self, *args: Any, **kwargs: Any) -> str:
+        """Async counterpart of ``run`` for callers on an event loop.
+
+        crewai itself only calls ``run``: ``Crew.kickoff_async`` runs the sync
+        kickoff in a thread.
+        """
+        result = await self._arun(*args, **kwargs)
+        self.current_usage_count += 1
+        return result
+
+    # ------------------------------------------------------------------
+    # Operations
+    # ------------------------------------------------------------------
+    def _drive(self, steps: _Steps) -> str:
+        """Run an operation to completion, calling each of its steps in this thread."""
+        result: Any = None
+        error: Optional[Exception] = None
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = step.call(*step.args), None
+            except Exception as exc:
+                result, error = None, exc
+
+    async def _adrive(self, steps: _Steps) -> str:
+        """Async ``_drive``: awaits each step's async version, never blocking the event loop."""
+        result: Any = None
+        error: Optional[Exception] = None
+        while True:
+            try:
+                step = steps.send(result) if error is None else steps.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = await step.acall(*step.args), None
+            except Exception as exc:
+                result, error = None, exc
+
+    def _respond(
+        self, db: Callable[[], Any], operation: str, collection: str, arguments: Dict[str, Any]
+    ) -> _Steps:
+        """One tool call: the memoized response, else the operation's, memoized."""
+        response_key, response = self._recall_response(operation, collection, arguments)
+        if response is not None:
+            return response
+        response = yield from self._operation_steps(db, operation, collection, **arguments)
+        self._remember_response(response_key, response)
+        return response
+
+    def _operation_steps(
+        self,
+        db: Callable[[], Any],
+        operation: str,
+        collection: str,
+        document_id: Optional[str] = None,
+        query_conditions: Optional[List[Dict[str, Any]]] = None,
+        return_objects: bool = False,
+        search_text: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        order_by: Optional[str] = None,
+        order_direction: str = "asc",
+        start_after: Optional[str] = None,
+        document_ids: Optional[List[str]] = None,
+        group_by_field: Optional[str] = None,
+        aggregate_field: Optional[str] = None,
+    ) -> _Steps:
+        """One operation, shared by ``_run`` and ``_arun``.
+
+        Each Firestore call is yielded as a _Step that the driver runs
+        (``_drive``) or awaits (``_adrive``); its result is sent back in and
+        its exception thrown back in. ``db`` returns the client queries are
+        built on, so the sync and async drivers each use their own.
+        """
+        try:
+            if operation in ("read", "read_many"):
+                # Only allow collections on the allow-list
+                collection_error = self._check_collection(collection)
+                if collection_error is not None:
+                    return collection_error
+
+                requested_ids = self._requested_ids(operation, document_id, document_ids)
+                if isinstance(requested_ids, str):
+                    return requested_ids
+                found, missing = yield _Step(self._read_documents, self._aread_documents, (collection, requested_ids))
+                return self._format_reads(operation, collection, requested_ids, found, missing, return_objects)
 
             if operation == "query":
-                # Only allow queries to 'products' collection
+                # Only allow collections on the allow-list
+                collection_error = self._check_collection(collection)
+                if collection_error is not None:
+                    return collection_error
+
+                cache_entry = yield _Step(self._ensure_collection_listener, self._aensure_collection, (collection,))
+
+                # Convert condition dicts to QueryCondition models
+                parsed_conditions = [
+                    QueryCondition(**condition) if not isinstance(condition, QueryCondition) else condition
+                    for condition in query_conditions or []
+                ]
+
+                try:
+                    page = self._resolve_page(
+                        collection,
+                        parsed_conditions,
+                        limit,
+                        offset,
+                        order_by,
+                        order_direction,
+                        start_after,
+                        return_objects,
+                    )
+                except ValueError as exc:
+                    return f"Error: {exc}"
+
+                paged = self._cached_query_page(cache_entry, parsed_conditions, page)
+                if paged is not None:
+                    return self._format_cached_query(collection, paged, page, return_objects, bool(parsed_conditions))
+
+                try:
+                    plan = self._plan_remote_query(
+                        db().collection(collection), collection, parsed_conditions, return_objects, page
+                    )
+                except ValueError as exc:
+                    return f"Error: {exc}"
+                try:
+                    changes, total_count = yield _Step(
+                        self._shared_remote_page, self._ashared_remote_page, (collection, plan, page, return_objects)
+                    )
+                except Exception as exc:  # pragma: no cover - remote errors are surfaced to user
+                    return f"Error during query: {exc}"
+                return self._format_remote_page(
+                    collection, changes, total_count, page, return_objects, bool(parsed_conditions)
+                )
+
+            if operation in ("search", "semantic_search", "similar"):
+                # Only allow searches in 'products' collection
                 if collection != "products":
                     return f"Error: Only 'products' collection is supported. Requested: '{collection}'"
-                
-                collection_ref = self._db.collection(collection)
-                cache_entry = self._ensure_collection_listener(collection)
-
-                if not query_conditions:
-                    documents = cache_entry.get("documents", {})
-                    total_count = len(documents)
-                    
-                    # Wait for snapshot listener to populate cache (only reads on changes after initial load)
-                    # Only do direct query as last resort if snapshot listener failed
-                    if total_count == 0 and not cache_entry.get("ready") and cache_entry.get("listener_error"):
-                        try:
-                            # Last resort: Query directly only if snapshot listener failed
-                            docs = list(collection_ref.stream())
-                            for doc in docs:
-                                doc_data = doc.to_dict()
-                                last_update_field = doc_data.get("lastUpdate", getattr(doc, "update_time", None))
-                                self._update_cache_entry(collection, doc.id, doc_data, last_update_field)
-                            
-                            # Update cache entry after populating
-                            documents = cache_entry.get("documents", {})
-                            total_count = len(documents)
-                            cache_entry["ready"] = True
-                        except Exception as exc:
-                            return f"Error querying collection: {exc}"
-
-                    if return_objects:
-                        payload = []
-                        for doc_id, doc_data in documents.items():
-                            # Only return categoryId and title
-                            item = self._filter_product_fields(doc_data, doc_id)
-                            payload.append(item)
-                        try:
-                            return json.dumps({"total": total_count, "documents": payload}, default=str)
-                        except Exception as exc:
-                            return f"Error serializing documents: {exc}"
-
-                    summaries: List[str] = []
-                    for idx, doc_data in enumerate(documents.values(), start=1):
-                        if idx > 10:
-                            break
-                        # Only show categoryId and title (no RTL markers in tool output)
-                        title = str(doc_data.get('title', 'No title'))
-                        category_id = str(doc_data.get('categoryId', 'No category'))
-                        summaries.append(
-                            f"{idx}. Title: {title}, CategoryId: {category_id}"
-                        )
 
-                    lines = [
-                        f"Total documents in collection: {total_count}",
-                        "Sample of first 10 documents:",
-                        *summaries,
-                        "\nTo get specific document details, use the 'read' operation with a document ID.",
-                    ]
-                    # Return plain text without RTL markers - formatting will be applied later
-                    return "\n".join(lines)
+                if operation == "similar":
+                    if not document_id:
+                        return "Error: document_id is required for similar operation."
+                elif not search_text or not search_text.strip():
+                    return f"Error: search_text is required for {operation} operation."
 
-                # Convert condition dicts to QueryCondition models
                 parsed_conditions = [
                     QueryCondition(**condition) if not isinstance(condition, QueryCondition) else condition
-                    for condition in query_conditions
+                    for condition in query_conditions or []
+                ]
+                cache_entry = yield _Step(self._ensure_collection_listener, self._aensure_collection, (collection,))
+                if not cache_entry.get("ready"):
+                    # Ranking needs the whole catalog in the cache; Firestore has no text search
+                    return "Error: The product catalog is still loading. Please retry the search shortly."
+
+                result_limit = limit or self.search_limit
+                if operation == "search":
+                    searched = self._search_cached_documents(
+                        cache_entry, search_text, parsed_conditions, result_limit
+                    )
+                else:
+                    searched = self._semantic_search_cached_documents(
+                        cache_entry,
+                        search_text if operation == "semantic_search" else None,
+                        document_id if operation == "similar" else None,
+                        parsed_conditions,
+                        result_limit,
+                    )
+                if isinstance(searched, str):
+                    return searched
+                if searched is None:
+                    return "Error: search conditions must use supported operators on cached fields."
+                total_count, ranked_docs = searched
+
+                if return_objects:
+                    payload = []
+                    for doc_id, doc_data, score in ranked_docs:
+                        # Only return categoryId and title, plus the relevance score
+                        item = self._filter_fields(collection, doc_data, doc_id)
+                        item["score"] = round(score, 4)
+                        payload.append(item)
+                    try:
+                        return json.dumps({"total": total_count, "documents": payload}, default=str)
+                    except Exception as exc:
+                        return f"Error serializing documents: {exc}"
+
+                summaries = []
+                for idx, (_, doc_data, score) in enumerate(ranked_docs, start=1):
+                    # Only show categoryId and title (no RTL markers in tool output)
+                    summaries.append(f"{idx}. {self._summarize_fields(collection, doc_data)}, Score: {score:.2f}")
+
+                lines = [
+                    f"Total documents matching search: {total_count}",
+                    f"Top {len(ranked_docs)} documents by relevance:",
+                    *summaries,
+                    "\nTo get specific document details, use the 'read' operation with a document ID.",
                 ]
+                return "\n".join(lines)
+
+            if operation in ("count", "distinct", "group_by"):
+                # Only allow collections on the allow-list
+                collection_error = self._check_collection(collection)
+                if collection_error is not None:
+                    return collection_error
 
-                if cache_entry.get("ready") and not cache_entry.get("listener_error"):
-                    documents = cache_entry.get("documents", {})
-                    matching_docs: List[Dict[str, Any]] = []
-                    unsupported_operator = False
-
-                    for doc_id, doc_data in documents.items():
-                        matches = True
-                        for condition in parsed_conditions:
-                            doc_value = doc_data.get(condition.field)
-
-                            if condition.operator == "==":
-                                if doc_value != condition.value:
-                                    matches = False
-                                    break
-                            else:
-                                unsupported_operator = True
-                                break
-
-                        if unsupported_operator:
-                            break
-
-                        if matches:
-                            payload = doc_data.copy()
-                            payload["_id"] = doc_id
-                            matching_docs.append(payload)
-
-                    if not unsupported_operator:
-                        total_count = len(matching_docs)
-
-                        if return_objects:
-                            # Filter to only return categoryId and title
-                            filtered_docs = []
-                            for doc_data in matching_docs:
-                                doc_id = doc_data.get("_id", "")
-                                filtered_doc = self._filter_product_fields(doc_data, doc_id)
-                                filtered_docs.append(filtered_doc)
-                            try:
-                                return json.dumps(
-                                    {"total": total_count, "documents": filtered_docs}, default=str
-                                )
-                            except Exception as exc:
-                                return f"Error serializing documents: {exc}"
-
-                        summaries = []
-                        for idx, doc_data in enumerate(matching_docs, start=1):
-                            if idx > 10:
-                                break
-                            # Only show categoryId and title (no RTL markers in tool output)
-                            title = str(doc_data.get('title', 'No title'))
-                            category_id = str(doc_data.get('categoryId', 'No category'))
-                            summaries.append(
-                                f"{idx}. Title: {title}, CategoryId: {category_id}"
+                if operation != "count" and not group_by_field:
+                    return f"Error: group_by_field is required for {operation} operation."
+
+                cache_entry = yield _Step(self._ensure_collection_listener, self._aensure_collection, (collection,))
+                parsed_conditions = [
+                    QueryCondition(**condition) if not isinstance(condition, QueryCondition) else condition
+                    for condition in query_conditions or []
+                ]
+
+                if operation == "count":
+                    total_count = self._count_cached(cache_entry, parsed_conditions)
+                    if total_count is None:
+                        # Server-side aggregation: no documents are transferred
+                        try:
+                            remote_queries, disjoint = self._remote_queries(
+                                db().collection(collection), parsed_conditions
                             )
+                        except ValueError as exc:
+                            return f"Error: {exc}"
+                        total_count = yield _Step(
+                            self._count_remote_queries, self._acount_remote_queries, (remote_queries, disjoint)
+                        )
+                    return self._format_count(total_count, parsed_conditions, return_objects)
 
-                        lines = [
-                            f"Total documents matching query: {total_count}",
-                            "Sample of first 10 matching documents:",
-                            *summaries,
-                            "\nTo get specific document details, use the 'read' operation with a document ID.",
-                        ]
-                        return "\n".join(lines)
+                groups = None
+                if cache_entry.get("ready"):
+                    groups = self._aggregate_cached(
+                        cache_entry, parsed_conditions, group_by_field, aggregate_field
+                    )
+                if groups is None:
+                    try:
+                        groups = yield _Step(
+                            self._aggregate_remote,
+                            self._aaggregate_remote,
+                            (db().collection(collection), parsed_conditions, group_by_field, aggregate_field),
+                        )
+                    except ValueError as exc:
+                        return f"Error: {exc}"
+                    except Exception as exc:  # pragma: no cover - remote errors are surfaced to user
+                        return f"Error during {operation}: {exc}"
+                return self._format_groups(operation, group_by_field, aggregate_field, groups, return_objects)
 
-                # Fall back to remote filtering if local cache can't handle it
-                return self._perform_remote_query(collection_ref, collection, parsed_conditions, return_objects)
+            if operation == "browse":
+                # Only allow collections on the allow-list
+                collection_error = self._check_collection(collection)
+                if collection_error is not None:
+                    return collection_error
+                if limit is not None and limit < 0:
+                    return "Error: limit must not be negative."
 
-            return ("Error: Unsupported operation. Only 'read' and 'query' are allowed.")
+                cache_entry = yield _Step(self._ensure_collection_listener, self._aensure_collection, (collection,))
+                if not cache_entry.get("ready"):
+                    # Counts and rankings need the whole catalog in the cache
+                    return "Error: The product catalog is still loading. Please retry shortly."
+                category_entry = None
+                category_collection = self.category_collection
+                if category_collection and category_collection != collection and category_collection in self.collections:
+                    category_entry = yield _Step(
+                        self._ensure_collection_listener, self._aensure_collection, (category_collection,)
+                    )
+                rows = self._browse_catalog(
+                    collection,
+                    cache_entry,
+                    min(self.browse_limit if limit is None else limit, self.max_page_size),
+                    category_entry,
+                )
+                return self._format_browse(collection, rows, return_objects)
+
+            return (
+                "Error: Unsupported operation. Only 'read', 'read_many', 'query', 'search', "
+                "'semantic_search', 'similar', 'count', 'distinct', 'group_by' and 'browse' are allowed."
+            )
 
         except Exception as exc:  # pragma: no cover - defensive catch for tool surface
             return f"Error executing Firebase operation: {exc}"
+
+    # ------------------------------------------------------------------
+    # Async path
+    # ------------------------------------------------------------------
+    def _async_db(self) -> Any:
+        """The shared AsyncClient of the running event loop, created on first use."""
+        loop = asyncio.get_running_loop()
+        shared_client = self._shared_client
+        with _shared_clients_lock:
+            client = shared_client.async_clients.get(loop)
+            if client is None:
+                if shared_client.async_client_factory is None:
+                    raise RuntimeError("No async Firestore client is configured for this tool.")
+                client = shared_client.async_clients[loop] = shared_client.async_client_factory()
+        return client
+
+    async def _arun_flight(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Async ``_SingleFlight.run``: sync and async callers of the same key share one fetch.
+
+        The fetch runs as its own task, so cancelling the caller that started
+        it does not fail the others waiting on it.
+        """
+        flight, leader = self._flights.join(key)
+        if leader:
+            task = asyncio.ensure_future(fetch())
+            _background_fetches.add(task)
+
+            def finish(task: "asyncio.Future[Any]") -> None:
+                _background_fetches.discard(task)
+                if task.cancelled():
+                    self._flights.finish(key, flight, error=asyncio.CancelledError())
+                elif task.exception() is not None:
+                    self._flights.finish(key, flight, error=task.exception())
+                else:
+                    self._flights.finish(key, flight, task.result())
+
+            task.add_done_callback(finish)
+        return await asyncio.shield(asyncio.wrap_future(flight))
+
+    async def _aensure_collection(self, collection: str) -> Dict[str, Any]:
+        """Async ``_ensure_collection_listener``.
+
+        A collection its listener keeps current is served without leaving the
+        event loop. Loading one (or syncing it while listeners fail) blocks, so
+        it runs in a worker thread; there concurrent callers of both paths wait
+        on one shared run without holding up the loop.
+        """
+        cache_entry = self._collection_cache.get(collection)
+        if cache_entry is not None and self._listener_is_live(cache_entry):
+            cache_entry["last_used"] = time.monotonic()
+            self._evict_collections(keep=collection)
+            return cache_entry
+        return await asyncio.to_thread(self._ensure_collection_listener, collection)
+
+    async def _aread_documents(
+        self,
+        collection: str,
+        document_ids: List[str],
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+        """Async ``_read_documents``: cache misses are fetched in one AsyncClient get_all batch."""
+        found, misses, _ = self._cached_reads(collection, document_ids)
+        if misses:
+            db = self._async_db()
+            collection_ref = db.collection(collection)
+            fields = self._projected_fields(collection)
+            refs = [collection_ref.document(doc_id) for doc_id in misses]
+            snapshots = db.get_all(refs, field_paths=fields) if fields is not None else db.get_all(refs)
+            self._store_reads(collection, [snapshot async for snapshot in snapshots], found)
+        return found, [doc_id for doc_id in document_ids if doc_id not in found]
+
+    async def _atake(self, stream: Any, count: int) -> List[Any]:
+        """Async ``_take``: read the first ``count`` documents and cancel the rest of the RPC."""
+        documents: List[Any] = []
+        try:
+            async for document in stream:
+                documents.append(document)
+                if len(documents) >= count:
+                    break
+        finally:
+            close = getattr(stream, "aclose", None)
+            if close is not None:
+                await close()
+        return documents
+
+    async def _agather(self, function: Callable[[Any], Awaitable[Any]], items: List[Any]) -> List[Any]:
+        """Async ``_fan_out``: await ``function`` for each item, at most ``load_workers`` at once."""
+        if len(items) == 1:
+            return [await function(items[0])]
+        semaphore = asyncio.Semaphore(max(1, self.load_workers))
+
+        async def bounded(item: Any) -> Any:
+            async with semaphore:
+                return await function(item)
+
+        return list(await asyncio.gather(*(bounded(item) for item in items)))
+
+    async def _acount_remote(self, query: Any) -> Optional[int]:
+        """Async ``_count_remote``."""
+        try:
+            result = await query.count(alias="total").get()
+            return int(result[0][0].value)
+        except Exception:
+            return None
+
+    async def _acount_remote_queries(self, queries: List[Any], disjoint: bool) -> Optional[int]:
+        """Async ``_count_remote_queries``."""
+        if len(queries) == 1:
+            return await self._acount_remote(queries[0])
+        if disjoint:
+            counts = await self._agather(self._acount_remote, queries)
+            return None if any(count is None for count in counts) else sum(counts)
+
+        async def document_ids(query: Any) -> List[str]:
+            return [doc.id async for doc in query.select(["__name__"]).stream()]
+
+        try:
+            id_lists = await self._agather(document_ids, queries)
+        except Exception:
+            return None
+        return len(set(itertools.chain.from_iterable(id_lists)))
+
+    async def _aaggregate_remote(
+        self,
+        collection_ref: Any,
+        conditions: List[QueryCondition],
+        group_field: str,
+        aggregate_field: Optional[str],
+    ) -> List[GroupStats]:
+        """Async ``_aggregate_remote``."""
+        queries = self._aggregate_queries(collection_ref, conditions, group_field, aggregate_field)
+
+        async def documents_of(query: Any) -> List[Tuple[str, Dict[str, Any]]]:
+            return [(doc.id, doc.to_dict()) async for doc in query.stream()]
+
+        streamed = await self._agather(documents_of, queries)
+        # Keyed by id: a document matching several chunks counts once
+        documents = dict(itertools.chain.from_iterable(streamed))
+        return aggregate_documents(documents.values(), group_field, [aggregate_field] if aggregate_field else [])
+
+    async def _afetch_remote_page(
+        self, collection: str, plan: _RemoteQuery, page: _Page, store: bool
+    ) -> Tuple[List[Tuple[str, Dict[str, Any], Any]], Optional[int]]:
+        """Async ``_fetch_remote_page``."""
+        results = await self._agather(lambda query: self._atake(query.stream(), plan.fetch), plan.queries)
+        changes = self._merge_remote_results(results, page, plan.fetch)
+        if store:
+            # Summary rows are partial documents and must not replace cached ones
+            self._apply_cache_changes(collection, changes)
+
+        if len(changes) > page.limit or page.after is not None or page.offset:
+            # Server-side count instead of reading every match
+            total_count = await self._acount_remote_queries(plan.filtered_queries, plan.disjoint)
+        else:
+            total_count = min(len(changes), page.limit)
+        return changes, total_count
+
+    async def _ashared_remote_page(
+        self, collection: str, plan: _RemoteQuery, page: _Page, store: bool
+    ) -> Tuple[List[Tuple[str, Dict[str, Any], Any]], Optional[int]]:
+        """Async ``_shared_remote_page``: identical sync and async queries share one fetch."""
+        return await self._arun_flight(plan.key, lambda: self._afetch_remote_page(collection, plan, page, store))
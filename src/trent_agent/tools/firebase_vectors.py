@@ -0,0 +1,221 @@
+"""Embedding index backing the FirebaseReadOnlyTool ``semantic_search`` and ``similar`` operations."""
+
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .firebase_cache import BlockArray, ShardedDict
+from .firebase_search import field_text, ngrams, tokenize
+
+# Maps a batch of texts to a (len(texts), dim) float array.
+EmbeddingFunction = Callable[[List[str]], Any]
+
+# Rows per storage block; copy-on-write copies one block at a time.
+_BLOCK_ROWS = 1024
+
+# Approximate bytes per row of the id map, for memory_size().
+_ROW_BYTES = 64
+
+
+class HashingEmbedder:
+    """Offline default embedding: hashed word and character-trigram features.
+
+    Words and their trigrams of the normalized text are hashed into ``dim``
+    signed buckets and the vector is L2-normalized, so texts sharing words or
+    word fragments (including Arabic spelling variants) end up close in cosine
+    similarity. Needs no model download or network access.
+    """
+
+    def __init__(self, dim: int = 512, ngram_weight: float = 0.5):
+        self.dim = dim
+        self.ngram_weight = ngram_weight
+
+    def _features(self, text: str) -> Dict[int, float]:
+        features: Dict[int, float] = {}
+        for token in tokenize(text):
+            for feature, weight in ((token, 1.0), *((gram, self.ngram_weight) for gram in ngrams(token))):
+                hashed = zlib.crc32(feature.encode("utf-8"))
+                bucket = hashed % self.dim
+                sign = 1.0 if hashed & 0x80000000 else -1.0
+                features[bucket] = features.get(bucket, 0.0) + sign * weight
+        return features
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if features:
+                matrix[row, list(features)] = list(features.values())
+        return matrix
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """Unit-length embeddings of one text per document, searched by cosine similarity.
+
+    Vectors live in fixed-size NumPy blocks. ``copy()`` shares the blocks and a
+    block is copied the first time the copy writes to it, so a published
+    snapshot keeps its matrix while the next version is prepared. Documents
+    added in a batch are embedded together by ``seal()``; documents whose text
+    did not change keep their vector.
+    """
+
+    __slots__ = ("fields", "embed", "_rows", "_ids", "_free", "_blocks", "_alive", "_owned", "_pending")
+
+    def __init__(self, fields: Sequence[str], embed: EmbeddingFunction):
+        self.fields = tuple(fields)
+        self.embed = embed
+        self._rows = ShardedDict()
+        self._ids = BlockArray(lambda size: [None] * size)
+        self._free: List[int] = []
+        self._blocks: List[np.ndarray] = []
+        self._alive: List[np.ndarray] = []
+        self._owned: Optional[Set[int]] = None
+        # row -> text waiting to be embedded by seal()
+        self._pending: Dict[int, str] = {}
+
+    def copy(self) -> "VectorIndex":
+        clone = VectorIndex(self.fields, self.embed)
+        clone._rows = self._rows.copy()
+        clone._ids = self._ids.copy()
+        clone._free = list(self._free)
+        clone._blocks = list(self._blocks)
+        clone._alive = list(self._alive)
+        clone._owned = set()
+        clone._pending = dict(self._pending)
+        return clone
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def memory_size(self) -> int:
+        """Approximate bytes held by the index: the vector blocks plus the id map."""
+        matrices = sum(block.nbytes + alive.nbytes for block, alive in zip(self._blocks, self._alive))
+        return matrices + len(self._ids) * _ROW_BYTES
+
+    def text(self, doc_data: Dict[str, Any]) -> str:
+        return " ".join(field_text(doc_data.get(field)) for field in self.fields).strip()
+
+    def _writable_block(self, block: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._owned is not None and block not in self._owned:
+            self._blocks[block] = self._blocks[block].copy()
+            self._alive[block] = self._alive[block].copy()
+            self._owned.add(block)
+        return self._blocks[block], self._alive[block]
+
+    def _clear_row(self, row: int) -> None:
+        self._pending.pop(row, None)
+        block, offset = divmod(row, _BLOCK_ROWS)
+        if block < len(self._alive) and self._alive[block][offset]:
+            _, alive = self._writable_block(block)
+            alive[offset] = False
+
+    def add(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        text = self.text(doc_data)
+        if not text:
+            return
+        if self._free:
+            row = self._free.pop()
+            self._ids[row] = doc_id
+        else:
+            row = len(self._ids)
+            self._ids.append(doc_id)
+        self._rows[doc_id] = row
+        self._pending[row] = text
+
+    def remove(self, doc_id: str, doc_data: Dict[str, Any]) -> None:
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return
+        self._clear_row(row)
+        self._ids[row] = None
+        self._free.append(row)
+
+    def replace(self, doc_id: str, previous: Dict[str, Any], doc_data: Dict[str, Any]) -> None:
+        """Re-embed a modified document only if its indexed text changed."""
+        text = self.text(doc_data)
+        row = self._rows.get(doc_id)
+        if row is not None and text and text == self.text(previous):
+            return
+        self.remove(doc_id, previous)
+        self.add(doc_id, doc_data)
+
+    def seal(self) -> None:
+        """Embed every document added since the last call in one batch."""
+        if not self._pending:
+            return
+        rows = list(self._pending)
+        vectors = _normalize_rows(np.asarray(self.embed(list(self._pending.values())), dtype=np.float32))
+        self._pending = {}
+        if not self._blocks:
+            dim = vectors.shape[1]
+        else:
+            dim = self._blocks[0].shape[1]
+        while len(self._blocks) * _BLOCK_ROWS < len(self._ids):
+            self._blocks.append(np.zeros((_BLOCK_ROWS, dim), dtype=np.float32))
+            self._alive.append(np.zeros(_BLOCK_ROWS, dtype=bool))
+            if self._owned is not None:
+                self._owned.add(len(self._blocks) - 1)
+        for row, vector in zip(rows, vectors):
+            block, offset = divmod(row, _BLOCK_ROWS)
+            matrix, alive = self._writable_block(block)
+            matrix[offset] = vector
+            alive[offset] = True
+
+    def vector(self, doc_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(doc_id)
+        if row is None:
+            return None
+        block, offset = divmod(row, _BLOCK_ROWS)
+        if block >= len(self._blocks) or not self._alive[block][offset]:
+            return None
+        return self._blocks[block][offset]
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        return _normalize_rows(np.asarray(self.embed(texts), dtype=np.float32))
+
+    def search(
+        self,
+        queries: np.ndarray,
+        limit: int,
+        accept: Optional[Callable[[str], bool]] = None,
+        exclude: Optional[str] = None,
+    ) -> List[Tuple[int, List[Tuple[str, float]]]]:
+        """For each row of ``queries``: (number of documents with a positive
+        similarity, their top ``limit`` (doc id, cosine similarity) pairs).
+
+        All queries are scored against each block with one matrix product and
+        the best rows are picked with argpartition. ``accept`` filters ids and
+        costs a Python call per document; ``exclude`` leaves one id out (e.g.
+        the document a similarity search started from) with the NumPy mask.
+        """
+        queries = np.atleast_2d(queries)
+        if not self._blocks or limit <= 0:
+            return [(0, []) for _ in range(len(queries))]
+        scores = np.concatenate([queries @ block.T for block in self._blocks], axis=1)
+        valid = np.concatenate(self._alive)
+        excluded_row = self._rows.get(exclude) if exclude is not None else None
+        if excluded_row is not None:
+            valid[excluded_row] = False
+        if accept is not None:
+            for row in np.flatnonzero(valid):
+                if not accept(self._ids[row]):
+                    valid[row] = False
+        scores[:, ~valid] = -np.inf
+        results = []
+        for row_scores in scores:
+            positive = int(np.count_nonzero(row_scores > 0))
+            top = min(limit, positive)
+            if not top:
+                results.append((0, []))
+                continue
+            best = np.argpartition(-row_scores, top - 1)[:top]
+            best = sorted(best, key=lambda row: (-row_scores[row], self._ids[row]))
+            results.append((positive, [(self._ids[row], float(row_scores[row])) for row in best]))
+        return results
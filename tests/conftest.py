@@ -0,0 +1,34 @@
+import pytest
+
+from fake_firestore import AsyncClient, Client
+from trent_agent.tools import firebase_tool
+from trent_agent.tools.firebase_tool import FirebaseReadOnlyTool
+
+
+@pytest.fixture
+def make_tool():
+    """Build tools on a fake client instead of service-account credentials.
+
+    Tools built for the same client share it, and its caches, the way tools of
+    one project do in production. Every tool is closed at teardown.
+    """
+    tools = []
+
+    def make(client: Client, **kwargs) -> FirebaseReadOnlyTool:
+        def attach(tool: FirebaseReadOnlyTool) -> None:
+            tool._attach_shared_client(client.project, lambda: client, lambda: AsyncClient(client))
+
+        kwargs.setdefault("snapshot_path", None)
+        initialize = FirebaseReadOnlyTool._initialize_firestore_client
+        FirebaseReadOnlyTool._initialize_firestore_client = attach
+        try:
+            tool = FirebaseReadOnlyTool(**kwargs)
+        finally:
+            FirebaseReadOnlyTool._initialize_firestore_client = initialize
+        tools.append(tool)
+        return tool
+
+    yield make
+    for tool in tools:
+        tool.close()
+    assert not firebase_tool._shared_clients
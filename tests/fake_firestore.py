@@ -0,0 +1,351 @@
+"""In-memory stand-in for the parts of the Firestore client the tool uses.
+
+Queries evaluate filters, orders, cursors and limits over plain dicts;
+``Collection.set`` and ``Collection.delete`` notify snapshot listeners the way
+the real watch stream does. ``Client.calls`` counts round trips so tests can
+check how many reads a call cost.
+"""
+
+import asyncio
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+from trent_agent.tools.firebase_cache import MISSING, get_field, matches_condition, value_key
+
+_project_ids = itertools.count()
+
+
+class Snapshot:
+    def __init__(self, collection: "Collection", doc_id: str, data: Optional[Dict[str, Any]]):
+        self.id = doc_id
+        self.exists = data is not None
+        self.update_time = datetime.now(timezone.utc)
+        self.reference = SimpleNamespace(
+            id=doc_id,
+            path=f"{collection.name}/{doc_id}",
+            parent=SimpleNamespace(id=collection.name, path=collection.name),
+        )
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return None if self._data is None else dict(self._data)
+
+
+class AggregationQuery:
+    def __init__(self, query: "Query", alias: Optional[str]):
+        self._query = query
+        self._alias = alias or "count"
+
+    def get(self, **kwargs: Any) -> List[List[SimpleNamespace]]:
+        self._query.collection.client.calls["count"] += 1
+        total = len(self._query.results())
+        return [[SimpleNamespace(alias=self._alias, value=total)]]
+
+
+class Query:
+    def __init__(self, collection: "Collection", **state: Any):
+        self.collection = collection
+        self.filters: List[Tuple[str, str, Any]] = state.get("filters", [])
+        self.fields: Optional[List[str]] = state.get("fields")
+        self.orders: List[Tuple[str, str]] = state.get("orders", [])
+        self.limit_count: Optional[int] = state.get("limit_count")
+        self.offset_count: int = state.get("offset_count", 0)
+        self.start: Optional[Tuple[str, Any]] = state.get("start")
+        self.end: Optional[Any] = state.get("end")
+
+    def _with(self, **changes: Any) -> "Query":
+        state = dict(
+            filters=self.filters,
+            fields=self.fields,
+            orders=self.orders,
+            limit_count=self.limit_count,
+            offset_count=self.offset_count,
+            start=self.start,
+            end=self.end,
+        )
+        state.update(changes)
+        return Query(self.collection, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, filter: Any = None) -> "Query":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        filters = self.filters + [(field_path, op_string, value)]
+        disjunctions = 1
+        for _, operator, operand in filters:
+            if operator in ("in", "array-contains-any"):
+                disjunctions *= len(operand)
+        if disjunctions > 30:
+            raise ValueError("A query supports a maximum of 30 disjunctions in its filters.")
+        return self._with(filters=filters)
+
+    def select(self, field_paths: List[str]) -> "Query":
+        return self._with(fields=list(field_paths))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "Query":
+        return self._with(orders=self.orders + [(field_path, direction)])
+
+    def limit(self, count: int) -> "Query":
+        return self._with(limit_count=count)
+
+    def offset(self, count: int) -> "Query":
+        return self._with(offset_count=count)
+
+    def start_after(self, values: Any) -> "Query":
+        return self._with(start=("after", values))
+
+    def start_at(self, values: Any) -> "Query":
+        return self._with(start=("at", values))
+
+    def end_before(self, values: Any) -> "Query":
+        return self._with(end=values)
+
+    def count(self, alias: Optional[str] = None) -> AggregationQuery:
+        return AggregationQuery(self, alias)
+
+    def _orders(self) -> List[Tuple[str, str]]:
+        return self.orders or [("__name__", "ASCENDING")]
+
+    def _sort_key(self, doc_id: str, data: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(
+            doc_id if field == "__name__" else value_key(get_field(data, field))
+            for field, _ in self._orders()
+        )
+
+    def _cursor_key(self, values: Any) -> Tuple[Any, ...]:
+        if isinstance(values, dict):
+            return tuple(
+                values[field] if field == "__name__" else value_key(values[field])
+                for field, _ in self._orders()
+                if field in values
+            )
+        if hasattr(values, "to_dict"):
+            return self._sort_key(values.id, values.to_dict() or {})
+        key = []
+        for (field, _), value in zip(self._orders(), values):
+            if field == "__name__":
+                key.append(getattr(value, "id", value))
+            else:
+                key.append(value_key(value))
+        return tuple(key)
+
+    def results(self) -> List[Tuple[str, Dict[str, Any]]]:
+        matches = [
+            (doc_id, data)
+            for doc_id, data in list(self.collection.docs.items())
+            if all(matches_condition(data, *condition) for condition in self.filters)
+        ]
+        for field, _ in self._orders():
+            if field != "__name__":
+                matches = [(doc_id, data) for doc_id, data in matches if get_field(data, field) is not MISSING]
+        for position in reversed(range(len(self._orders()))):
+            descending = self._orders()[position][1] in ("DESCENDING", "desc")
+            matches.sort(key=lambda item: self._sort_key(*item)[position], reverse=descending)
+
+        descending = self._orders()[0][1] in ("DESCENDING", "desc")
+        if self.start is not None:
+            kind, values = self.start
+            cursor = self._cursor_key(values)
+
+            def after_cursor(item: Tuple[str, Dict[str, Any]]) -> bool:
+                key = self._sort_key(*item)[: len(cursor)]
+                if descending:
+                    return key < cursor if kind == "after" else key <= cursor
+                return key > cursor if kind == "after" else key >= cursor
+
+            matches = [item for item in matches if after_cursor(item)]
+        if self.end is not None:
+            cursor = self._cursor_key(self.end)
+            matches = [item for item in matches if self._sort_key(*item)[: len(cursor)] < cursor]
+        matches = matches[self.offset_count:]
+        if self.limit_count is not None:
+            matches = matches[: self.limit_count]
+        return matches
+
+    def _snapshot(self, doc_id: str, data: Dict[str, Any]) -> Snapshot:
+        if self.fields is not None:
+            data = {field: data[field] for field in self.fields if field in data}
+        return Snapshot(self.collection, doc_id, data)
+
+    def stream(self, transaction: Any = None, **kwargs: Any):
+        client = self.collection.client
+        client.calls["stream"] += 1
+        if client.stream_delay:
+            threading.Event().wait(client.stream_delay)
+        for doc_id, data in self.results():
+            yield self._snapshot(doc_id, data)
+
+    def get(self, **kwargs: Any) -> List[Snapshot]:
+        return list(self.stream())
+
+    def on_snapshot(self, callback: Any) -> SimpleNamespace:
+        client = self.collection.client
+        client.calls["listen"] += 1
+        if client.fail_listen:
+            raise RuntimeError("listen is not permitted")
+        listener = (self, callback)
+        self.collection.listeners.append(listener)
+        snapshots = [self._snapshot(doc_id, data) for doc_id, data in self.results()]
+        changes = [SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=snapshot) for snapshot in snapshots]
+        if client.listen_delay:
+            threading.Timer(client.listen_delay, callback, args=(snapshots, changes, None)).start()
+        else:
+            callback(snapshots, changes, None)
+
+        def unsubscribe() -> None:
+            if listener in self.collection.listeners:
+                self.collection.listeners.remove(listener)
+
+        return SimpleNamespace(unsubscribe=unsubscribe)
+
+
+class DocumentReference:
+    def __init__(self, collection: "Collection", doc_id: str):
+        self.collection = collection
+        self.id = doc_id
+        self.path = f"{collection.name}/{doc_id}"
+
+    def get(self, field_paths: Optional[List[str]] = None, **kwargs: Any) -> Snapshot:
+        self.collection.client.calls["get"] += 1
+        data = self.collection.docs.get(self.id)
+        if data is not None and field_paths is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        return Snapshot(self.collection, self.id, data)
+
+
+class Collection(Query):
+    def __init__(self, client: "Client", name: str):
+        super().__init__(self)
+        self.client = client
+        self.name = self.id = name
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.listeners: List[Tuple[Query, Any]] = []
+
+    def document(self, doc_id: str) -> DocumentReference:
+        return DocumentReference(self, doc_id)
+
+    def set(self, doc_id: str, data: Dict[str, Any]) -> None:
+        """Write a document and deliver the change to every listener."""
+        kind = "MODIFIED" if doc_id in self.docs else "ADDED"
+        self.docs[doc_id] = dict(data)
+        self._notify(doc_id, kind)
+
+    def delete(self, doc_id: str) -> None:
+        """Delete a document and deliver the change to every listener."""
+        data = self.docs.pop(doc_id, {})
+        self._notify(doc_id, "REMOVED", data)
+
+    def _notify(self, doc_id: str, kind: str, data: Optional[Dict[str, Any]] = None) -> None:
+        for query, callback in list(self.listeners):
+            snapshot = query._snapshot(doc_id, self.docs.get(doc_id, data or {}))
+            callback([], [SimpleNamespace(type=SimpleNamespace(name=kind), document=snapshot)], None)
+
+
+class Client:
+    """Synchronous client; each instance is its own project."""
+
+    def __init__(self, listen_delay: float = 0.0, stream_delay: float = 0.0, fail_listen: bool = False):
+        self.project = f"project-{next(_project_ids)}"
+        self.listen_delay = listen_delay
+        self.stream_delay = stream_delay
+        self.fail_listen = fail_listen
+        self.calls: Counter = Counter()
+        self.closed = False
+        self._collections: Dict[str, Collection] = {}
+
+    def collection(self, name: str) -> Collection:
+        if name not in self._collections:
+            self._collections[name] = Collection(self, name)
+        return self._collections[name]
+
+    def collection_group(self, name: str) -> SimpleNamespace:
+        def get_partitions(count: int):
+            raise RuntimeError("partition queries are not permitted")
+
+        return SimpleNamespace(get_partitions=get_partitions)
+
+    def get_all(self, references: List[DocumentReference], field_paths: Optional[List[str]] = None, **kwargs: Any):
+        self.calls["get_all"] += 1
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class AsyncQuery:
+    """Async view of a ``Query`` of the wrapped synchronous client."""
+
+    def __init__(self, client: "AsyncClient", query: Query):
+        self._client = client
+        self._query = query
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._query, name)
+        if name in ("where", "select", "order_by", "limit", "offset", "start_after", "start_at", "end_before"):
+            return lambda *args, **kwargs: AsyncQuery(self._client, attribute(*args, **kwargs))
+        return attribute
+
+    def document(self, doc_id: str) -> DocumentReference:
+        return self._query.collection.document(doc_id)
+
+    async def stream(self, **kwargs: Any):
+        self._client.check_loop()
+        client = self._query.collection.client
+        client.calls["async_stream"] += 1
+        if client.stream_delay:
+            await asyncio.sleep(client.stream_delay)
+        for doc_id, data in self._query.results():
+            await asyncio.sleep(0)
+            yield self._query._snapshot(doc_id, data)
+
+    def count(self, alias: Optional[str] = None) -> SimpleNamespace:
+        aggregation = self._query.count(alias)
+
+        async def get(**kwargs: Any) -> List[List[SimpleNamespace]]:
+            self._client.check_loop()
+            await asyncio.sleep(0)
+            return aggregation.get()
+
+        return SimpleNamespace(get=get)
+
+
+class AsyncTransport:
+    def __init__(self, client: "AsyncClient"):
+        self._client = client
+
+    async def close(self) -> None:
+        self._client.check_loop()
+        self._client.channel_closed = True
+
+
+class AsyncClient:
+    """Async client over the same data as ``client``, bound to the running loop like a real one."""
+
+    def __init__(self, client: Client):
+        self.client = client
+        self.loop = asyncio.get_running_loop()
+        self.closed = False
+        self.channel_closed = False
+        self._firestore_api_internal = SimpleNamespace(transport=AsyncTransport(self))
+        client.async_clients = getattr(client, "async_clients", []) + [self]
+
+    def check_loop(self) -> None:
+        if asyncio.get_running_loop() is not self.loop:
+            raise RuntimeError("the client is bound to a different event loop")
+
+    def collection(self, name: str) -> AsyncQuery:
+        return AsyncQuery(self, self.client.collection(name))
+
+    async def get_all(self, references: List[DocumentReference], field_paths: Optional[List[str]] = None, **kwargs: Any):
+        self.check_loop()
+        self.client.calls["async_get_all"] += 1
+        await asyncio.sleep(0)
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def close(self) -> None:
+        self.closed = True
@@ -0,0 +1,96 @@
+import random
+from datetime import datetime, timezone
+
+import pytest
+
+from trent_agent.tools.firebase_cache import (
+    BlockArray,
+    CacheSnapshot,
+    CompactDocumentStore,
+    EqualityIndex,
+    ShardedDict,
+    SortedBlocks,
+    SortedIndex,
+    writable_copy,
+)
+
+
+def test_sharded_dict_copy_leaves_the_original_unchanged():
+    original = ShardedDict({f"k{number}": number for number in range(2000)})
+    copy = original.copy()
+    copy["k1"] = "changed"
+    copy["added"] = -1
+    del copy["k2"]
+
+    assert original["k1"] == 1 and "added" not in original and original["k2"] == 2
+    assert len(original) == 2000 and len(copy) == 2000
+    assert dict(copy.items()) == {**{f"k{n}": n for n in range(2000) if n != 2}, "k1": "changed", "added": -1}
+
+
+def test_writable_copy_promotes_large_dicts_only():
+    assert type(writable_copy({"a": None})) is dict
+    large = {number: None for number in range(1000)}
+    promoted = writable_copy(large)
+    assert type(promoted) is ShardedDict and dict(promoted.items()) == large
+
+
+def test_sorted_blocks_match_a_sorted_list_across_copies():
+    rng = random.Random(7)
+    blocks, expected = SortedBlocks(), []
+    versions = []
+    for step in range(5000):
+        if expected and rng.random() < 0.4:
+            item = rng.choice(expected)
+            expected.remove(item)
+            assert blocks.remove(item)
+        else:
+            item = rng.randrange(1000)
+            expected.append(item)
+            expected.sort()
+            blocks.add(item)
+        if step % 500 == 0:
+            versions.append((blocks, list(expected)))
+            blocks = blocks.copy()
+
+    assert not blocks.remove(-1)
+    for version, items in versions + [(blocks, expected)]:
+        assert list(version) == items and len(version) == len(items)
+        assert version[10:50] == items[10:50]
+        assert version.bisect_left(500) == sum(item < 500 for item in items)
+        assert version.bisect_right(500) == sum(item <= 500 for item in items)
+
+
+def test_block_array_copy_shares_until_written():
+    original = BlockArray(lambda size: [0] * size, 3000)
+    original[2999] = 5
+    copy = original.copy()
+    copy[2999] = 6
+    copy.append(7)
+
+    assert original[2999] == 5 and len(original) == 3000
+    assert copy[2999] == 6 and copy[3000] == 7 and len(copy) == 3001
+
+
+@pytest.mark.parametrize("documents", [ShardedDict, CompactDocumentStore], ids=["dict", "compact"])
+def test_evolved_snapshot_leaves_the_published_one_unchanged(documents):
+    day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    published = CacheSnapshot(documents(), {"categoryId": EqualityIndex("categoryId")}, {"price": SortedIndex("price")})
+    for number in range(1500):
+        published.put(f"p{number}", {"title": f"Product {number}", "categoryId": f"c{number % 3}", "price": number, "lastUpdate": day})
+    size = published.size
+
+    successor = published.evolve()
+    successor.put("p1", {"title": "Renamed", "categoryId": "c0", "price": 5000})
+    successor.discard("p3")
+
+    assert published.documents["p1"]["title"] == "Product 1" and "p3" in published.documents
+    assert "p1" in published.indexes["categoryId"].lookup("c1")
+    assert published.range_indexes["price"].span([(">=", 5000)]) == (1500, 1500)
+    assert published.size == size
+
+    assert successor.documents["p1"]["title"] == "Renamed" and "p3" not in successor.documents
+    assert "p1" in successor.indexes["categoryId"].lookup("c0")
+    assert "p3" not in successor.indexes["categoryId"].lookup("c0")
+    start, stop = successor.range_indexes["price"].span([(">=", 5000)])
+    assert successor.range_indexes["price"].ids(start, stop) == ["p1"]
+    assert successor.version == published.version + 1
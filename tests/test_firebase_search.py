@@ -0,0 +1,76 @@
+import json
+
+from fake_firestore import Client
+
+CATALOG = {
+    "boot": {"title": "Leather boots", "categoryId": "shoes", "description": "Winter boots with a leather lining"},
+    "belt": {"title": "Belt", "categoryId": "accessories", "description": "A leather belt"},
+    "sneaker": {"title": "Running sneakers", "categoryId": "shoes", "tags": ["leather", "sport"]},
+    "scarf": {"title": "Wool scarf", "categoryId": "accessories", "description": "Soft and warm"},
+}
+
+
+def catalog_client(catalog: dict = CATALOG) -> Client:
+    client = Client()
+    client.collection("products").docs.update(catalog)
+    return client
+
+
+def search(tool, search_text: str, **arguments) -> dict:
+    return json.loads(tool._run("search", "products", search_text=search_text, return_objects=True, **arguments))
+
+
+def ranked_ids(found: dict) -> list:
+    return [document["_id"] for document in found["documents"]]
+
+
+def test_search_ranks_title_matches_above_description_matches(make_tool):
+    tool = make_tool(catalog_client())
+
+    found = search(tool, "leather")
+
+    assert found["total"] == 3
+    assert ranked_ids(found)[0] == "boot"
+    assert set(ranked_ids(found)) == {"boot", "belt", "sneaker"}
+    assert [document["score"] for document in found["documents"]] == sorted(
+        (document["score"] for document in found["documents"]), reverse=True
+    )
+
+
+def test_search_honors_conditions_and_limit(make_tool):
+    tool = make_tool(catalog_client())
+    shoes = [{"field": "categoryId", "operator": "==", "value": "shoes"}]
+
+    found = search(tool, "leather", query_conditions=shoes, limit=1)
+
+    assert found["total"] == 2 and ranked_ids(found) == ["boot"]
+    assert search(tool, "umbrella")["total"] == 0
+    assert tool._run("search", "categories", search_text="leather").startswith("Error")
+
+
+def test_arabic_spelling_variants_match(make_tool):
+    tool = make_tool(
+        catalog_client(
+            {
+                "bag": {"title": "حقيبة جلدية", "categoryId": "bags"},
+                "kettle": {"title": "غلاية كهربائية", "categoryId": "kitchen"},
+                "lamp": {"title": "مصباح مكتب ٢٠ واط", "categoryId": "home"},
+            }
+        ),
+        search_min_similarity=None,
+    )
+
+    # Taa marbuta, harakat, tatweel and Arabic-Indic digits fold to one spelling
+    assert ranked_ids(search(tool, "حقيبه")) == ["bag"]
+    assert ranked_ids(search(tool, "حَقِيـبَة")) == ["bag"]
+    assert ranked_ids(search(tool, "20")) == ["lamp"]
+    assert ranked_ids(search(tool, "كهربائيه")) == ["kettle"]
+
+
+def test_misspelt_terms_match_by_ngrams_unless_disabled(make_tool):
+    fuzzy = make_tool(catalog_client())
+    exact = make_tool(catalog_client(), search_min_similarity=None)
+
+    assert ranked_ids(search(fuzzy, "sneakres"))[0] == "sneaker"
+    assert ranked_ids(search(fuzzy, "leathr boots"))[0] == "boot"
+    assert search(exact, "sneakres")["total"] == 0
@@ -0,0 +1,502 @@
+import asyncio
+import gc
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from fake_firestore import Client
+from trent_agent.tools import firebase_tool
+from trent_agent.tools.firebase_cache import matches_condition, value_key
+from trent_agent.tools.firebase_tool import FirebaseReadOnlyTool
+
+LAST_UPDATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def add_products(client: Client, count: int) -> None:
+    products = client.collection("products")
+    for number in range(count):
+        products.docs[f"p{number:03d}"] = {
+            "title": f"Product {number}",
+            "categoryId": f"c{number % 3}",
+            "price": number,
+            "lastUpdate": LAST_UPDATE + timedelta(days=number),
+        }
+    categories = client.collection("categories")
+    for number in range(3):
+        categories.docs[f"c{number}"] = {"name": f"Category {number}"}
+
+
+def all_pages(tool: FirebaseReadOnlyTool, **arguments) -> list:
+    """Document ids of every page of a query, following next_page_token."""
+    ids, token = [], None
+    while True:
+        page = json.loads(tool._run("query", "products", return_objects=True, start_after=token, **arguments))
+        ids.extend(document["_id"] for document in page["documents"])
+        token = page.get("next_page_token")
+        if token is None:
+            return ids
+
+
+def test_listener_changes_reach_cached_results(make_tool):
+    client = Client()
+    add_products(client, 6)
+    tool = make_tool(client)
+    shoes = [{"field": "categoryId", "operator": "==", "value": "shoes"}]
+
+    assert tool._run("count", "products") == "Total documents in collection: 6"
+    assert "Product 1" not in tool._run("query", "products", query_conditions=shoes)
+
+    products = client.collection("products")
+    products.set("p001", {"title": "Product 1", "categoryId": "shoes", "price": 1})
+    products.set("new", {"title": "New product", "categoryId": "shoes", "price": 7})
+    products.delete("p002")
+
+    assert tool._run("count", "products") == "Total documents in collection: 6"
+    shoes_page = tool._run("query", "products", query_conditions=shoes)
+    assert "Product 1" in shoes_page and "New product" in shoes_page
+    assert "not found" in tool._run("read", "products", document_id="p002")
+    assert client.calls["listen"] == 1
+    assert client.calls["stream"] == 0
+
+
+@pytest.mark.parametrize("client_options", [{}, {"listen_delay": 5.0}], ids=["cached", "remote"])
+def test_next_page_token_walks_every_page_once(make_tool, client_options):
+    client = Client(**client_options)
+    add_products(client, 11)
+    tool = make_tool(client, max_page_size=3, snapshot_wait_timeout=0.01)
+    expected = sorted(client.collection("products").docs)
+
+    assert all_pages(tool) == expected
+    assert all_pages(tool, order_by="price", order_direction="desc") == expected[::-1]
+    assert all_pages(tool, query_conditions=[{"field": "categoryId", "operator": "==", "value": "c1"}]) == [
+        doc_id for doc_id in expected if int(doc_id[1:]) % 3 == 1
+    ]
+    if client_options:
+        assert client.calls["stream"] > 0
+
+
+def test_token_of_another_query_is_rejected(make_tool):
+    client = Client()
+    add_products(client, 5)
+    tool = make_tool(client, max_page_size=2)
+    token = json.loads(tool._run("query", "products", return_objects=True))["next_page_token"]
+
+    response = tool._run("query", "products", order_by="price", return_objects=True, start_after=token)
+
+    assert response.startswith("Error")
+
+
+def test_sync_and_async_callers_share_one_listener(make_tool):
+    client = Client(listen_delay=0.3)
+    add_products(client, 30)
+    tool = make_tool(client)
+    other_tool = make_tool(client)
+    sync_results = []
+    threads = [
+        threading.Thread(target=lambda caller=caller: sync_results.append(caller._run("count", "products")))
+        for caller in (tool, other_tool) * 2
+    ]
+    for thread in threads:
+        thread.start()
+
+    async def count_concurrently():
+        return await asyncio.gather(*(tool._arun("count", "products") for _ in range(10)))
+
+    async_results = asyncio.run(count_concurrently())
+    for thread in threads:
+        thread.join()
+
+    assert set(sync_results) | set(async_results) == {"Total documents in collection: 30"}
+    assert client.calls["listen"] == 1
+
+
+def test_concurrent_remote_queries_share_one_fetch(make_tool):
+    arguments = dict(
+        query_conditions=[{"field": "price", "operator": ">=", "value": 4}],
+        order_by="price",
+        return_objects=True,
+    )
+    single = Client(listen_delay=5.0)
+    add_products(single, 20)
+    make_tool(single, snapshot_wait_timeout=0.01)._run("query", "products", **arguments)
+    fetches_per_call = single.calls["stream"] + single.calls["count"]
+
+    client = Client(listen_delay=5.0, stream_delay=0.2)
+    add_products(client, 20)
+    tool = make_tool(client, snapshot_wait_timeout=0.01)
+    sync_results = []
+    threads = [
+        threading.Thread(target=lambda: sync_results.append(tool._run("query", "products", **arguments)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+
+    async def query_concurrently():
+        return await asyncio.gather(*(tool._arun("query", "products", **arguments) for _ in range(4)))
+
+    async_results = asyncio.run(query_concurrently())
+    for thread in threads:
+        thread.join()
+
+    assert len(set(sync_results) | set(async_results)) == 1
+    assert json.loads(async_results[0])["total"] == 16
+    fetches = client.calls["stream"] + client.calls["async_stream"] + client.calls["count"]
+    assert fetches == fetches_per_call
+
+
+def test_async_caller_does_not_block_the_loop_while_a_thread_loads(make_tool):
+    client = Client(listen_delay=0.5)
+    add_products(client, 12)
+    tool = make_tool(client)
+    sync_result = []
+    thread = threading.Thread(target=lambda: sync_result.append(tool._run("browse", "products")))
+    thread.start()
+
+    async def browse_while_ticking():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        results = await asyncio.wait_for(
+            asyncio.gather(*(tool._arun("browse", "products") for _ in range(3))), timeout=5
+        )
+        ticker.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(browse_while_ticking())
+    thread.join()
+
+    assert set(results) == set(sync_result)
+    assert "Category 1" in results[0]
+    assert ticks > 10
+
+
+def test_arun_awaits_arun_on_the_loop_and_counts_usage(make_tool, monkeypatch):
+    client = Client()
+    add_products(client, 4)
+    tool = make_tool(client)
+    awaited_on = []
+    arun = FirebaseReadOnlyTool._arun
+
+    async def spy(self, *args, **kwargs):
+        awaited_on.append(threading.get_ident())
+        return await arun(self, *args, **kwargs)
+
+    monkeypatch.setattr(FirebaseReadOnlyTool, "_arun", spy)
+
+    async def invoke():
+        return await tool.arun(operation="count", collection="products"), threading.get_ident()
+
+    result, loop_thread = asyncio.run(invoke())
+
+    assert result == "Total documents in collection: 4"
+    assert awaited_on == [loop_thread]
+    assert tool.current_usage_count == 1
+    assert tool.run(operation="count", collection="products") == result
+
+
+def test_close_closes_async_clients_on_their_loop(make_tool):
+    client = Client(listen_delay=5.0)
+    add_products(client, 4)
+    tool = make_tool(client, snapshot_wait_timeout=0.01)
+
+    async def query_then_close():
+        await tool._arun("query", "products", return_objects=True)
+        tool.close()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(query_then_close())
+
+    (async_client,) = client.async_clients
+    assert client.closed
+    assert async_client.closed and async_client.channel_closed
+
+
+def restart_from_snapshot(make_tool, snapshot_path: str, **client_options) -> Client:
+    """Cache 5 products to ``snapshot_path``, then return a client of the same project
+    in which ``p000`` was deleted and ``new`` added while no tool was running."""
+    first = Client()
+    add_products(first, 5)
+    tool = make_tool(first, snapshot_path=snapshot_path)
+    assert tool._run("count", "products") == "Total documents in collection: 5"
+    tool.close()
+    del tool
+    gc.collect()
+
+    second = Client(**client_options)
+    second.project = first.project
+    products = second.collection("products")
+    products.docs.update(first.collection("products").docs)
+    del products.docs["p000"]
+    products.docs["new"] = {"title": "New product", "categoryId": "c0", "lastUpdate": LAST_UPDATE + timedelta(days=30)}
+    return second
+
+
+@pytest.mark.parametrize(
+    "client_options",
+    [{}, {"listen_delay": 0.2}, {"fail_listen": True}],
+    ids=["listener", "slow-listener", "no-listener"],
+)
+def test_warm_start_drops_documents_deleted_while_offline(make_tool, tmp_path, client_options):
+    snapshot_path = str(tmp_path / "snapshots.sqlite3")
+    client = restart_from_snapshot(make_tool, snapshot_path, **client_options)
+    tool = make_tool(client, snapshot_path=snapshot_path, snapshot_wait_timeout=0.05)
+
+    assert tool._run("count", "products") == "Total documents in collection: 5"
+    assert "not found" in tool._run("read", "products", document_id="p000")
+    assert "New product" in tool._run("read", "products", document_id="new")
+
+
+def test_reads_before_first_use_keep_the_warm_start(make_tool, tmp_path):
+    snapshot_path = str(tmp_path / "snapshots.sqlite3")
+    client = restart_from_snapshot(make_tool, snapshot_path, listen_delay=5.0)
+    tool = make_tool(client, snapshot_path=snapshot_path, snapshot_wait_timeout=0.05)
+
+    assert "not found" in tool._run("read", "products", document_id="p000")
+    assert "Product 1" in tool._run("read", "products", document_id="p001")
+
+    # Served from the restored snapshot while the listener loads; the read deletion holds
+    found = tool._run("search", "products", search_text="product", return_objects=True)
+    assert {document["_id"] for document in json.loads(found)["documents"]} == {"p001", "p002", "p003", "p004"}
+
+
+def test_async_call_after_first_snapshot_does_not_wait_on_the_loop(make_tool):
+    client = Client(listen_delay=0.1)
+    add_products(client, 12)
+    tool = make_tool(client)
+
+    async def search_once_live():
+        loading = asyncio.ensure_future(tool._arun("count", "products"))
+        while not tool._listener_is_live(tool._collection_cache.get("products", {})):
+            await asyncio.sleep(0)
+        # The cold load's flight may still be open here; joining it must not block the loop
+        found = await tool._arun("search", "products", search_text="product")
+        return found, await loading
+
+    results = []
+    runner = threading.Thread(target=lambda: results.append(asyncio.run(search_once_live())), daemon=True)
+    runner.start()
+    runner.join(timeout=5)
+
+    assert results, "the event loop hung"
+    found, count = results[0]
+    assert "Product 1" in found
+    assert count == "Total documents in collection: 12"
+
+
+def cached_size(tool: FirebaseReadOnlyTool, collection: str) -> int:
+    return tool._collection_cache[collection]["snapshot"].size
+
+
+def test_browse_keeps_every_collection_it_uses_cached(make_tool):
+    client = Client()
+    add_products(client, 40)
+    sizing_tool = make_tool(Client(), cache_max_bytes=None)
+    add_products(sizing_tool._db, 40)
+    sizing_tool._run("browse", "products")
+    products_size = cached_size(sizing_tool, "products")
+
+    tool = make_tool(client, cache_max_bytes=products_size - 1, response_cache_size=0)
+    for _ in range(3):
+        assert "Category 1" in tool._run("browse", "products")
+
+    assert sorted(tool._collection_cache) == ["categories", "products"]
+    assert client.calls["listen"] == 2
+
+
+def test_idle_collections_are_evicted_over_budget(make_tool, monkeypatch):
+    monkeypatch.setattr(firebase_tool, "_EVICTION_GRACE", 0.0)
+    client = Client()
+    add_products(client, 40)
+    sizing_tool = make_tool(Client(), cache_max_bytes=None)
+    add_products(sizing_tool._db, 40)
+    sizing_tool._run("count", "products")
+    products_size = cached_size(sizing_tool, "products")
+
+    tool = make_tool(client, cache_max_bytes=products_size + 100)
+    tool._run("count", "categories")
+    tool._run("count", "products")
+    assert list(tool._collection_cache) == ["products"]
+
+    # Over budget on its own: the idle collection is kept, evicting it would not help
+    tool = make_tool(Client(), cache_max_bytes=products_size - 1)
+    add_products(tool._db, 40)
+    tool._run("count", "categories")
+    tool._run("count", "products")
+    assert sorted(tool._collection_cache) == ["categories", "products"]
+
+
+@pytest.mark.parametrize("unsortable", [False, True], ids=["index", "scan"])
+def test_cached_pages_match_firestore_order(make_tool, monkeypatch, unsortable):
+    if not unsortable:
+        # Every page must come from bisecting the price index
+        monkeypatch.setattr(FirebaseReadOnlyTool, "_paginate_cached", None)
+    client = Client()
+    products = client.collection("products")
+    for number in range(60):
+        products.docs[f"p{number:03d}"] = {"title": f"Product {number}", "categoryId": "c", "price": number % 17}
+    products.docs["free"] = {"title": "No price", "categoryId": "c"}
+    if unsortable:
+        products.docs["quote"] = {"title": "On request", "categoryId": "c", "price": "ask"}
+    tool = make_tool(client, max_page_size=7)
+
+    def expected(bounds, descending):
+        matches = [
+            (value_key(data["price"]), doc_id)
+            for doc_id, data in products.docs.items()
+            if "price" in data and all(matches_condition(data, "price", *bound) for bound in bounds)
+        ]
+        return [doc_id for _, doc_id in sorted(matches, reverse=descending)]
+
+    assert all_pages(tool) == sorted(products.docs)
+    for bounds in ([], [(">=", 3)], [(">", 3), ("<=", 11)], [("<", 0)]):
+        conditions = [{"field": "price", "operator": operator, "value": value} for operator, value in bounds]
+        for direction in ("asc", "desc"):
+            arguments = dict(query_conditions=conditions, order_by="price", order_direction=direction)
+            assert all_pages(tool, **arguments) == expected(bounds, direction == "desc")
+            first = json.loads(tool._run("query", "products", return_objects=True, offset=2, limit=3, **arguments))
+            assert [document["_id"] for document in first["documents"]] == expected(bounds, direction == "desc")[2:5]
+            assert first["total"] == len(expected(bounds, direction == "desc"))
+
+
+def test_compact_backend_answers_like_dict_and_reports_less_memory(make_tool):
+    tools = {}
+    for backend in ("dict", "compact"):
+        client = Client()
+        add_products(client, 300)
+        for number, document in enumerate(client.collection("products").docs.values()):
+            document["description"] = f"Leather bag number {number} with a zip pocket"
+            document["tags"] = ["bag", f"size-{number % 4}"]
+        tools[backend] = make_tool(client, cache_backend=backend)
+
+    for arguments in (
+        dict(query_conditions=[{"field": "categoryId", "operator": "==", "value": "c1"}], order_by="price"),
+        dict(query_conditions=[{"field": "tags", "operator": "array-contains", "value": "size-2"}]),
+        dict(order_by="lastUpdate", order_direction="desc"),
+    ):
+        assert all_pages(tools["compact"], **arguments) == all_pages(tools["dict"], **arguments)
+    documents_size = {}
+    for backend, tool in tools.items():
+        snapshot = tool._collection_cache["products"]["snapshot"]
+        documents_size[backend] = snapshot.size - sum(index.memory_size() for index in snapshot._all_indexes())
+    assert documents_size["compact"] < documents_size["dict"] / 2
+
+
+@pytest.mark.parametrize("client_options", [{}, {"listen_delay": 5.0}], ids=["cached", "remote"])
+def test_count_distinct_and_group_by(make_tool, client_options):
+    client = Client(**client_options)
+    add_products(client, 12)
+    tool = make_tool(client, snapshot_wait_timeout=0.01)
+    expensive = [{"field": "price", "operator": ">=", "value": 10}]
+
+    grouped = json.loads(
+        tool._run("group_by", "products", group_by_field="categoryId", aggregate_field="price", return_objects=True)
+    )
+    assert grouped["groups"] == [
+        {"value": "c0", "count": 4, "min": 0, "max": 9, "avg": 4.5},
+        {"value": "c1", "count": 4, "min": 1, "max": 10, "avg": 5.5},
+        {"value": "c2", "count": 4, "min": 2, "max": 11, "avg": 6.5},
+    ]
+    distinct = json.loads(
+        tool._run("distinct", "products", group_by_field="categoryId", query_conditions=expensive, return_objects=True)
+    )
+    assert distinct["values"] == [{"value": "c1", "count": 1}, {"value": "c2", "count": 1}]
+    assert tool._run("count", "products", query_conditions=expensive) == "Total documents matching query: 2"
+    assert tool._run("group_by", "products").startswith("Error")
+    if client_options:
+        assert client.calls["count"] > 0 and client.calls["stream"] > 0
+    else:
+        client.collection("products").set("p100", {"title": "New", "categoryId": "c3", "price": 50})
+        regrouped = json.loads(
+            tool._run("group_by", "products", group_by_field="categoryId", aggregate_field="price", return_objects=True)
+        )
+        assert regrouped["groups"][-1] == {"value": "c3", "count": 1, "min": 50, "max": 50, "avg": 50.0}
+        assert tool._run("count", "products") == "Total documents in collection: 13"
+
+
+def test_read_many_fetches_misses_in_one_batch_and_then_serves_them_cached(make_tool):
+    client = Client()
+    add_products(client, 5)
+    tool = make_tool(client, max_page_size=4)
+
+    def read_many(document_ids: list) -> dict:
+        return json.loads(tool._run("read_many", "products", document_ids=document_ids, return_objects=True))
+
+    read = read_many(["p003", "nope", "p001", "p003"])
+    assert [document["_id"] for document in read["documents"]] == ["p003", "p001"]
+    assert read["missing"] == ["nope"]
+    assert client.calls["get_all"] == 1 and client.calls["listen"] == 0
+
+    assert read_many(["p001", "p003"])["missing"] == []
+    assert client.calls["get_all"] == 1
+    assert tool._run("read_many", "products", document_ids=[f"p{n:03d}" for n in range(5)]).startswith("Error")
+    assert tool._run("read_many", "products").startswith("Error")
+
+    # Once the listener is live, every id is answered from the cache
+    tool._run("count", "products")
+    client.collection("products").set("p004", {"title": "Renamed", "categoryId": "c1", "price": 4})
+    assert read_many(["p004", "gone"]) == {
+        "documents": [{"_id": "p004", "title": "Renamed", "categoryId": "c1"}],
+        "missing": ["gone"],
+    }
+    assert client.calls["get_all"] == 1
+
+
+def test_long_disjunctions_are_split_into_queries_firestore_accepts(make_tool):
+    clients = {"cached": Client(), "remote": Client(listen_delay=5.0)}
+    tools = {}
+    for name, client in clients.items():
+        add_products(client, 80)
+        for number, document in enumerate(client.collection("products").docs.values()):
+            document["tags"] = [f"t{number % 45}", f"t{number % 7 + 45}"]
+        tools[name] = make_tool(client, max_page_size=25, snapshot_wait_timeout=0.01)
+
+    prices = {"field": "price", "operator": "in", "value": list(range(0, 120, 2)) + [0, 2]}
+    categories = {"field": "categoryId", "operator": "in", "value": ["c0", "c2", "c9"]}
+    tags = {"field": "tags", "operator": "array-contains-any", "value": [f"t{number}" for number in range(0, 52, 3)]}
+    for conditions in ([prices], [prices, categories], [prices, tags], [categories, tags]):
+        expected = all_pages(tools["cached"], query_conditions=conditions)
+        assert expected
+        assert all_pages(tools["remote"], query_conditions=conditions) == expected
+        assert tools["remote"]._run("count", "products", query_conditions=conditions) == (
+            f"Total documents matching query: {len(expected)}"
+        )
+    assert clients["remote"].calls["stream"] > 0 and not tools["remote"]._collection_cache["products"]["ready"]
+
+
+@pytest.mark.parametrize("client_options", [{}, {"fail_listen": True}], ids=["live", "polled"])
+def test_responses_are_memoized_until_the_listener_applies_a_change(make_tool, monkeypatch, client_options):
+    built = []
+    build_page = FirebaseReadOnlyTool._cached_query_page
+
+    def counting_page(self, *args):
+        built.append(args)
+        return build_page(self, *args)
+
+    monkeypatch.setattr(FirebaseReadOnlyTool, "_cached_query_page", counting_page)
+    client = Client(**client_options)
+    add_products(client, 6)
+    tool = make_tool(client)
+    c1 = [{"field": "categoryId", "operator": "==", "value": "c1"}]
+    tool._run("count", "products")
+
+    first = tool._run("query", "products", query_conditions=c1)
+    assert tool._run("query", "products", query_conditions=c1) == first
+    if client_options:
+        # Without a live listener the cache may be stale, so nothing is reused
+        assert len(built) == 2
+        return
+    assert len(built) == 1
+
+    client.collection("products").set("p100", {"title": "Added", "categoryId": "c1", "price": 1})
+    changed = tool._run("query", "products", query_conditions=c1)
+    assert changed != first and "Added" in changed
+    assert len(built) == 2
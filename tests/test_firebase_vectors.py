@@ -0,0 +1,56 @@
+import json
+
+from fake_firestore import Client
+
+CATALOG = {
+    "a": {"title": "Red running shoes", "categoryId": "shoes"},
+    "b": {"title": "Blue running shoes", "categoryId": "shoes"},
+    "c": {"title": "Leather handbag", "categoryId": "bags"},
+    "d": {"title": "Canvas tote bag", "categoryId": "bags"},
+}
+
+
+def catalog_client() -> Client:
+    client = Client()
+    client.collection("products").docs.update(CATALOG)
+    return client
+
+
+def ranked_ids(response: str) -> list:
+    return [document["_id"] for document in json.loads(response)["documents"]]
+
+
+def test_embeddings_are_opt_in(make_tool):
+    tool = make_tool(catalog_client())
+
+    assert tool._run("semantic_search", "products", search_text="shoes").startswith("Error")
+    assert "vector" not in tool._collection_cache["products"]["snapshot"].search_indexes
+
+
+def test_semantic_search_ranks_by_meaning(make_tool):
+    tool = make_tool(catalog_client(), embedding_fields=["title"])
+
+    ranked = ranked_ids(tool._run("semantic_search", "products", search_text="running shoe", return_objects=True))
+
+    assert set(ranked[:2]) == {"a", "b"}
+
+
+def test_similar_leaves_out_the_document_and_honors_conditions(make_tool):
+    tool = make_tool(catalog_client(), embedding_fields=["title"])
+    bags = [{"field": "categoryId", "operator": "==", "value": "bags"}]
+
+    assert ranked_ids(tool._run("similar", "products", document_id="a", return_objects=True))[0] == "b"
+    assert "a" not in ranked_ids(tool._run("similar", "products", document_id="a", return_objects=True))
+    assert ranked_ids(
+        tool._run("similar", "products", document_id="c", query_conditions=bags, return_objects=True)
+    ) == ["d"]
+
+
+def test_modified_documents_are_re_embedded(make_tool):
+    client = catalog_client()
+    tool = make_tool(client, embedding_fields=["title"], response_cache_size=0)
+
+    client.collection("products").set("c", {"title": "Trail running shoes", "categoryId": "shoes"})
+
+    ranked = ranked_ids(tool._run("similar", "products", document_id="a", return_objects=True))
+    assert "c" in ranked[:2]